@@ -0,0 +1,48 @@
+"""prompt queue and history
+
+Revision ID: 5b2a1c7e9d40
+Revises:
+Create Date: 2026-10-18 10:12:41.305118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2a1c7e9d40'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('queue_items',
+    sa.Column('prompt_id', sa.String(), nullable=False),
+    sa.Column('queue', sa.String(), nullable=False),
+    sa.Column('number', sa.Integer(), nullable=False),
+    sa.Column('item', sa.JSON(), nullable=False),
+    sa.Column('pinned', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('prompt_id')
+    )
+    op.create_table('history_items',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('prompt_id', sa.String(), nullable=False),
+    sa.Column('queue', sa.String(), nullable=False),
+    sa.Column('entry', sa.JSON(), nullable=False),
+    sa.Column('completed_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('prompt_id')
+    )
+    op.create_index('ix_history_items_queue_id', 'history_items', ['queue', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_history_items_queue_id', table_name='history_items')
+    op.drop_table('history_items')
+    op.drop_table('queue_items')
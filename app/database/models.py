@@ -1,3 +1,4 @@
+from sqlalchemy import JSON, Boolean, Column, Float, Index, Integer, String
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -11,4 +12,28 @@ def to_dict(obj):
         if (val := getattr(obj, field))
     }
 
-# TODO: Define models here
+
+class QueueItem(Base):
+    """A prompt that was queued and hasn't finished yet, re-queued on startup."""
+    __tablename__ = "queue_items"
+
+    prompt_id = Column(String, primary_key=True)
+    queue = Column(String, nullable=False)
+    number = Column(Integer, nullable=False)
+    # [prompt, extra_data, outputs_to_execute], sensitive extra data is never stored
+    item = Column(JSON, nullable=False)
+    pinned = Column(Boolean, nullable=False, default=False)
+    created_at = Column(Float, nullable=False)
+
+
+class HistoryItem(Base):
+    """A finished prompt, ids increase in the order prompts finished."""
+    __tablename__ = "history_items"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    prompt_id = Column(String, nullable=False, unique=True)
+    queue = Column(String, nullable=False)
+    entry = Column(JSON, nullable=False)
+    completed_at = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_history_items_queue_id", "queue", "id"),)
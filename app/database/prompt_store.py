@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from sqlalchemy import delete, func, select, text, update
+
+from app.database.db import can_create_session, create_session
+from app.database.models import HistoryItem, QueueItem
+
+
+class PromptStore:
+    """
+    Keeps queued prompts and the history of the prompt queues in the database, so both
+    survive restarts. Every queue has a name, rows of a queue are tagged with it.
+
+    Writes are appended to a list and committed by a background thread, all writes
+    made while the previous commit ran go into one transaction. Reads flush first.
+    """
+    def __init__(self, max_history: int):
+        self.max_history = max_history
+        self.lock = threading.Lock()
+        self.pending: list[Callable] = []
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt_store")
+        with create_session() as session:
+            if session.get_bind().dialect.name == "sqlite":
+                # Appends don't rewrite the database and don't block readers
+                session.execute(text("PRAGMA journal_mode=WAL"))
+                session.commit()
+            self.last_history_id = session.scalar(select(func.max(HistoryItem.id))) or 0
+
+    def _submit(self, op: Callable):
+        with self.lock:
+            self.pending.append(op)
+            if len(self.pending) > 1:
+                # a write is already scheduled and will pick this one up
+                return
+        self.writer.submit(self._write)
+
+    def _write(self):
+        with self.lock:
+            ops, self.pending = self.pending, []
+        try:
+            with create_session() as session:
+                for op in ops:
+                    op(session)
+                session.commit()
+        except Exception as e:
+            logging.error(f"Failed to write {len(ops)} prompt queue changes to the database: {e}")
+
+    def flush(self):
+        self.writer.submit(lambda: None).result()
+
+    def add(self, queue: str, item: tuple, pinned: bool = False):
+        row = dict(prompt_id=item[1], queue=queue, number=item[0], item=[item[2], item[3], item[4]],
+                   pinned=pinned, created_at=time.time())
+        self._submit(lambda session: session.merge(QueueItem(**row)))
+
+    def move(self, prompt_id: str, queue: str):
+        self._submit(lambda session: session.execute(update(QueueItem).where(QueueItem.prompt_id == prompt_id).values(queue=queue)))
+
+    def remove(self, prompt_ids: list[str]):
+        self._submit(lambda session: session.execute(delete(QueueItem).where(QueueItem.prompt_id.in_(prompt_ids))))
+
+    def next_history_id(self) -> int:
+        """Ids of history entries, they continue after the ones already stored."""
+        with self.lock:
+            self.last_history_id += 1
+            return self.last_history_id
+
+    def complete(self, queue: str, prompt_id: str, entry: dict, history_id: int):
+        """Replaces the queued prompt with its history entry."""
+        entry = dict(entry, prompt=list(entry["prompt"][:5]))
+        completed_at = time.time()
+
+        def op(session):
+            session.execute(delete(QueueItem).where(QueueItem.prompt_id == prompt_id))
+            session.execute(delete(HistoryItem).where(HistoryItem.prompt_id == prompt_id))
+            session.add(HistoryItem(id=history_id, prompt_id=prompt_id, queue=queue, entry=entry, completed_at=completed_at))
+            session.flush()
+            oldest = session.scalar(select(HistoryItem.id).where(HistoryItem.queue == queue)
+                                    .order_by(HistoryItem.id.desc()).offset(self.max_history).limit(1))
+            if oldest is not None:
+                session.execute(delete(HistoryItem).where(HistoryItem.queue == queue, HistoryItem.id <= oldest))
+        self._submit(op)
+
+    def delete_history(self, queue: str, prompt_id: Optional[str] = None):
+        query = delete(HistoryItem).where(HistoryItem.queue == queue)
+        if prompt_id is not None:
+            query = query.where(HistoryItem.prompt_id == prompt_id)
+        self._submit(lambda session: session.execute(query))
+
+    def get_history_item(self, queue: str, prompt_id: str) -> Optional[dict]:
+        self.flush()
+        with create_session() as session:
+            return session.scalar(select(HistoryItem.entry).where(HistoryItem.queue == queue, HistoryItem.prompt_id == prompt_id))
+
+    def get_history(self, queue: str, max_items: Optional[int] = None, offset: int = -1) -> dict[str, dict]:
+        """
+        History entries of a queue, oldest first, with the same paging as
+        PromptQueue.get_history. A negative offset returns the last max_items entries.
+        """
+        self.flush()
+        query = select(HistoryItem.prompt_id, HistoryItem.entry).where(HistoryItem.queue == queue)
+        with create_session() as session:
+            if offset < 0 and max_items is not None:
+                rows = session.execute(query.order_by(HistoryItem.id.desc()).limit(max_items)).all()
+                rows.reverse()
+            else:
+                query = query.order_by(HistoryItem.id).offset(max(offset, 0))
+                if max_items is not None:
+                    query = query.limit(max_items)
+                rows = session.execute(query).all()
+        return {prompt_id: entry for prompt_id, entry in rows}
+
+    def get_history_page(self, queue: str, since: Optional[int] = None, before: Optional[int] = None,
+                         max_items: Optional[int] = None, upto: Optional[int] = None) -> list[tuple[int, str, dict]]:
+        """Same as PromptQueue.get_history_page, served from the (queue, id) index."""
+        self.flush()
+        query = select(HistoryItem.id, HistoryItem.prompt_id, HistoryItem.entry).where(HistoryItem.queue == queue)
+        if upto is not None:
+            query = query.where(HistoryItem.id <= upto)
+        if since is not None:
+            query = query.where(HistoryItem.id > since).order_by(HistoryItem.id)
+        else:
+            if before is not None:
+                query = query.where(HistoryItem.id < before)
+            query = query.order_by(HistoryItem.id.desc())
+        if max_items is not None:
+            query = query.limit(max_items)
+        with create_session() as session:
+            rows = [tuple(row) for row in session.execute(query)]
+        if since is None:
+            rows.reverse()
+        return rows
+
+    def count_history(self, queue: str) -> int:
+        self.flush()
+        with create_session() as session:
+            return session.scalar(select(func.count()).select_from(HistoryItem).where(HistoryItem.queue == queue))
+
+    def restore(self, queues: dict) -> int:
+        """
+        Puts the prompts that were queued or running when the server stopped back into
+        their queues, queues that no longer exist hand theirs to the first queue.
+        Returns the number to continue numbering prompts from.
+        """
+        with create_session() as session:
+            rows = session.execute(select(QueueItem).order_by(QueueItem.number)).scalars().all()
+        fallback = next(iter(queues))
+        number = 0
+        for row in rows:
+            name = row.queue if row.queue in queues else fallback
+            if name != row.queue:
+                self.move(row.prompt_id, name)
+            prompt, extra_data, outputs_to_execute = row.item
+            queues[name].restore((row.number, row.prompt_id, prompt, extra_data, outputs_to_execute, {}), row.pinned)
+            number = max(number, row.number + 1)
+        if len(rows) > 0:
+            logging.info(f"Restored {len(rows)} queued prompts from the database")
+        return number
+
+
+def create_prompt_store(max_history: int) -> Optional[PromptStore]:
+    if not can_create_session():
+        logging.warning("The prompt queue can't be kept in the database, it isn't available.")
+        return None
+    return PromptStore(max_history)
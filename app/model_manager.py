@@ -99,8 +99,6 @@ class ModelFileManager:
             return None
         if not os.path.isdir(folder):
             return None
-        if os.path.getmtime(folder) != model_file_list_cache[1]:
-            return None
         for x in model_file_list_cache[1]:
             time_modified = model_file_list_cache[1][x]
             folder = x
@@ -118,42 +116,27 @@ class ModelFileManager:
         include_hidden_files = False
 
         result: list[str] = []
-        dirs: dict[str, float] = {}
-
-        for dirpath, subdirs, filenames in os.walk(directory, followlinks=True, topdown=True):
-            subdirs[:] = [d for d in subdirs if d not in excluded_dir_names]
-            if not include_hidden_files:
-                subdirs[:] = [d for d in subdirs if not d.startswith(".")]
-                filenames = [f for f in filenames if not f.startswith(".")]
-
-            filenames = filter_files_extensions(filenames, folder_paths.supported_pt_extensions)
-
-            for file_name in filenames:
-                try:
-                    full_path = os.path.join(dirpath, file_name)
-                    relative_path = os.path.relpath(full_path, directory)
-
-                    # Get file metadata
-                    file_info = {
-                        "name": relative_path,
-                        "pathIndex": pathIndex,
-                        "modified": os.path.getmtime(full_path),  # Add modification time
-                        "created": os.path.getctime(full_path),   # Add creation time
-                        "size": os.path.getsize(full_path)        # Add file size
-                    }
-                    result.append(file_info)
-
-                except Exception as e:
-                    logging.warning(f"Warning: Unable to access {file_name}. Error: {e}. Skipping this file.")
-                    continue
+        files, dirs = folder_paths.file_index.scan(directory, excluded_dir_names)
+        if not include_hidden_files:
+            files = [f for f in files if not any(part.startswith(".") for part in f.split(os.sep))]
 
-            for d in subdirs:
-                path: str = os.path.join(dirpath, d)
-                try:
-                    dirs[path] = os.path.getmtime(path)
-                except FileNotFoundError:
-                    logging.warning(f"Warning: Unable to access {path}. Skipping this path.")
-                    continue
+        for relative_path in filter_files_extensions(files, folder_paths.supported_pt_extensions):
+            try:
+                modified, created, size = folder_paths.file_index.stat_file(os.path.join(directory, relative_path))
+
+                # Get file metadata
+                file_info = {
+                    "name": relative_path,
+                    "pathIndex": pathIndex,
+                    "modified": modified,  # Add modification time
+                    "created": created,    # Add creation time
+                    "size": size           # Add file size
+                }
+                result.append(file_info)
+
+            except Exception as e:
+                logging.warning(f"Warning: Unable to access {relative_path}. Error: {e}. Skipping this file.")
+                continue
 
         return result, dirs, time.perf_counter()
 
@@ -100,12 +100,18 @@ class LatentPreviewMethod(enum.Enum):
 parser.add_argument("--preview-method", type=LatentPreviewMethod, default=LatentPreviewMethod.NoPreviews, help="Default preview method for sampler nodes.", action=EnumAction)
 
 parser.add_argument("--preview-size", type=int, default=512, help="Sets the maximum preview size for sampler nodes.")
+parser.add_argument("--preview-max-fps", type=float, default=0, help="Maximum number of sampler previews per second sent to each client, 0 for no limit. Steps over the limit are not decoded at all.")
 
 cache_group = parser.add_mutually_exclusive_group()
 cache_group.add_argument("--cache-classic", action="store_true", help="Use the old style (aggressive) caching.")
 cache_group.add_argument("--cache-lru", type=int, default=0, help="Use LRU caching with a maximum of N node results cached. May use more RAM/VRAM.")
+cache_group.add_argument("--cache-lru-gb", type=float, default=0, help="Use LRU caching bounded by the estimated size of the cached node results in GB instead of their count. Large results that were fast to compute are evicted first.")
 cache_group.add_argument("--cache-none", action="store_true", help="Reduced RAM/VRAM usage at the expense of executing every node for each run.")
 cache_group.add_argument("--cache-ram", nargs='?', const=4.0, type=float, default=0, help="Use RAM pressure caching with the specified headroom threshold. If available RAM drops below the threhold the cache remove large items to free RAM. Default 4GB")
+parser.add_argument("--cache-disk", nargs='?', const=20.0, type=float, default=0, help="Also keep IMAGE, LATENT, MASK and CONDITIONING node results on disk so they survive restarts, using at most the specified number of GB. Default 20GB")
+parser.add_argument("--cache-disk-directory", type=str, default=None, help="Set the directory of the disk node cache. Defaults to cache/node_outputs in the ComfyUI directory.")
+parser.add_argument("--node-concurrency", type=str, nargs='?', const="", default=None, metavar="LIMITS", help="Run the independent async nodes and THREAD_SAFE nodes of a prompt at the same time. Optionally sets the limit per resource class, for example cpu=8,network=32 (defaults: gpu=1,cpu=4,network=16). With several GPU workers the limits and the thread pool are per worker.")
+parser.add_argument("--batch-prompts", type=int, default=0, metavar="N", help="Sample queued prompts that only differ in seed or prompt text together, up to N prompts per batch. Only deterministic samplers are batched, and only queued prompts whose other sampler inputs are already cached.")
 
 attn_group = parser.add_mutually_exclusive_group()
 attn_group.add_argument("--use-split-cross-attention", action="store_true", help="Use the split cross attention optimization. Ignored when xformers is used.")
@@ -132,12 +138,14 @@ vram_group.add_argument("--cpu", action="store_true", help="To use the CPU for e
 parser.add_argument("--reserve-vram", type=float, default=None, help="Set the amount of vram in GB you want to reserve for use by your OS/other software. By default some amount is reserved depending on your OS.")
 
 parser.add_argument("--async-offload", action="store_true", help="Use async weight offloading.")
+parser.add_argument("--prefetch-weights", type=int, default=0, metavar="N", help="When a model doesn't fit in VRAM, copy the weights of offloaded layers and apply their LoRAs N layers ahead of their use, in the layer order recorded on the first step. Implies --async-offload.")
 
 parser.add_argument("--force-non-blocking", action="store_true", help="Force ComfyUI to use non-blocking operations for all applicable tensors. This may improve performance on some non-Nvidia systems but can cause issues with some workflows.")
 
 parser.add_argument("--default-hashing-function", type=str, choices=['md5', 'sha1', 'sha256', 'sha512'], default='sha256', help="Allows you to choose the hash function to use for duplicate filename / contents comparison. Default is sha256.")
 
 parser.add_argument("--disable-smart-memory", action="store_true", help="Force ComfyUI to agressively offload to regular ram instead of keeping models in vram when it can.")
+parser.add_argument("--patched-weight-cache-gb", type=float, default=0, help="Keep up to this many GB of weights with LoRAs merged into them in RAM, so switching back to a recently used LoRA combination copies the merged weights instead of recomputing them.")
 parser.add_argument("--deterministic", action="store_true", help="Make pytorch use slower deterministic algorithms when it can. Note that this might not make images deterministic in all cases.")
 
 class PerformanceFeature(enum.Enum):
@@ -157,6 +165,8 @@ parser.add_argument("--quick-test-for-ci", action="store_true", help="Quick test
 parser.add_argument("--windows-standalone-build", action="store_true", help="Windows standalone build: Enable convenient things that most people using the standalone windows build will probably enjoy (like auto opening the page on startup).")
 
 parser.add_argument("--disable-metadata", action="store_true", help="Disable saving prompt metadata in files.")
+parser.add_argument("--image-save-workers", type=int, default=4, help="Number of threads used to encode and write the images of SaveImage and PreviewImage in parallel.")
+parser.add_argument("--async-image-save", action="store_true", help="Let SaveImage and PreviewImage finish before their files are written. Requests for a file that is still being written wait for it.")
 parser.add_argument("--disable-all-custom-nodes", action="store_true", help="Disable loading all custom nodes.")
 parser.add_argument("--whitelist-custom-nodes", type=str, nargs='+', default=[], help="Specify custom node folders to load even when --disable-all-custom-nodes is enabled.")
 parser.add_argument("--disable-api-nodes", action="store_true", help="Disable loading all api nodes.")
@@ -210,11 +220,15 @@ parser.add_argument(
     default="https://api.comfy.org",
     help="Set the base URL for the ComfyUI API.  (default: https://api.comfy.org)",
 )
+parser.add_argument("--api-nodes-connections-per-host", type=int, default=8, help="Maximum number of open connections per host of the HTTP session shared by API nodes, 0 for no limit.")
+parser.add_argument("--api-nodes-keepalive", type=float, default=30.0, help="Seconds an idle API node connection is kept open for reuse.")
 
 database_default_path = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "..", "user", "comfyui.db")
 )
 parser.add_argument("--database-url", type=str, default=f"sqlite:///{database_default_path}", help="Specify the database URL, e.g. for an in-memory database you can use 'sqlite:///:memory:'.")
+parser.add_argument("--persist-queue", action="store_true", help="Keep queued prompts and the prompt history in the database, queued prompts are run again after a restart. Sensitive extra data like API keys is not stored.")
+parser.add_argument("--persist-history-size", type=int, default=100000, help="Number of history entries per prompt queue kept in the database with --persist-queue.")
 
 if comfy.options.args_parsing:
     args = parser.parse_args()
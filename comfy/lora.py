@@ -21,6 +21,7 @@ import comfy.utils
 import comfy.model_management
 import comfy.model_base
 import comfy.weight_adapter as weight_adapter
+import contextlib
 import logging
 import torch
 
@@ -413,3 +414,101 @@ def calculate_weight(patches, weight, key, intermediate_dtype=torch.float32, ori
             weight = old_weight
 
     return weight
+
+BATCHED_MERGE_MAX_BYTES = 128 * 1024 * 1024
+
+def lora_update_factors(patches, weight):
+    """
+    For a weight that is only patched by plain LoRAs (no DoRA, mid weights, offsets, functions or
+    strength_model) returns the [(scale, up, down)] with calculate_weight(patches, weight) == weight + sum(scale * up @ down),
+    up and down flattened to 2D. Returns None for anything else.
+    """
+    out_dim = weight.shape[0] if weight.ndim > 0 else 0
+    factors = []
+    for strength, v, strength_model, offset, function in patches:
+        if type(v) is not weight_adapter.LoRAAdapter or offset is not None or function is not None or strength_model != 1.0:
+            return None
+        mat1, mat2, alpha, mid, dora_scale, reshape = v.weights
+        if mid is not None or dora_scale is not None or reshape is not None:
+            return None
+        up = mat1.flatten(start_dim=1)
+        down = mat2.flatten(start_dim=1)
+        if up.shape[0] != out_dim or up.shape[1] != down.shape[0] or out_dim * down.shape[1] != weight.numel():
+            return None
+        if alpha is not None:
+            alpha = alpha / mat2.shape[0]
+        else:
+            alpha = 1.0
+        factors.append((strength * alpha, up, down))
+    if len(factors) == 0:
+        return None
+    return factors
+
+def calculate_weights_batched(items, device=None, intermediate_dtype=torch.float32, max_batch_bytes=BATCHED_MERGE_MAX_BYTES):
+    """
+    Merges plain LoRA patches into many weights at once. items are (key, weight, factors) with factors
+    from lora_update_factors. Weights with the same shape and total rank on the same device are merged
+    with one torch.baddbmm per batch: the LoRAs of a weight are concatenated along the rank, so a stack
+    of LoRAs is a single matmul. Batches are staged into buffers that are reused by the following batches,
+    the next batch is copied to the device on an offload stream while the current one is computed. A set of
+    buffers takes at most max_batch_bytes and half of the memory free on the device above the reserve.
+
+    Yields (key, merged weight) in intermediate_dtype. The merged weight is a view of a reused buffer and
+    is only valid until the next item is requested.
+    """
+    groups = {}
+    for key, weight, factors in items:
+        d = device if device is not None else weight.device
+        rank = sum(up.shape[1] for _, up, _ in factors)
+        groups.setdefault((d, weight.shape[0], weight.numel() // weight.shape[0], rank), []).append((key, weight, factors))
+
+    element_size = torch.empty((), dtype=intermediate_dtype).element_size()
+    budgets = {}
+    for (d, out_dim, in_dim, rank), group in groups.items():
+        if d not in budgets:
+            free = comfy.model_management.get_free_memory(d) - comfy.model_management.extra_reserved_memory()
+            budgets[d] = int(min(max_batch_bytes, free // 2))
+        item_bytes = (out_dim * in_dim + out_dim * rank + rank * in_dim) * element_size
+        batch_size = max(1, min(len(group), budgets[d] // item_bytes))
+        batches = [group[i:i + batch_size] for i in range(0, len(group), batch_size)]
+        # two sets of buffers, one being computed while the other one is filled
+        buffers = []
+        for _ in range(min(2, len(batches))):
+            buffers.append((torch.empty((batch_size, out_dim, in_dim), device=d, dtype=intermediate_dtype),
+                            torch.empty((batch_size, out_dim, rank), device=d, dtype=intermediate_dtype),
+                            torch.empty((batch_size, rank, in_dim), device=d, dtype=intermediate_dtype)))
+
+        def stage(batch, buffer):
+            offload_stream = comfy.model_management.get_offload_stream(d)
+            if offload_stream is not None:
+                # the buffer may still be read by work queued for the previous batch
+                offload_stream.wait_stream(comfy.model_management.current_stream(d))
+                context = offload_stream
+            else:
+                context = contextlib.nullcontext()
+            non_blocking = comfy.model_management.device_supports_non_blocking(d)
+            w_buf, up_buf, down_buf = buffer
+            with context, torch.no_grad():
+                for i, (key, weight, factors) in enumerate(batch):
+                    w_buf[i].copy_(weight.reshape(out_dim, in_dim), non_blocking=non_blocking)
+                    r = 0
+                    for scale, up, down in factors:
+                        up_buf[i, :, r:r + up.shape[1]].copy_(up, non_blocking=non_blocking)
+                        up_buf[i, :, r:r + up.shape[1]].mul_(scale)
+                        down_buf[i, r:r + up.shape[1]].copy_(down, non_blocking=non_blocking)
+                        r += up.shape[1]
+            return offload_stream
+
+        offload_stream = stage(batches[0], buffers[0])
+        for b, batch in enumerate(batches):
+            w_buf, up_buf, down_buf = buffers[b % 2]
+            next_stream = None
+            if b + 1 < len(batches):
+                next_stream = stage(batches[b + 1], buffers[(b + 1) % 2])
+            comfy.model_management.sync_stream(d, offload_stream)
+            n = len(batch)
+            with torch.no_grad():
+                torch.baddbmm(w_buf[:n], up_buf[:n], down_buf[:n], out=w_buf[:n])
+            for i, (key, weight, factors) in enumerate(batch):
+                yield key, w_buf[i].view(weight.shape)
+            offload_stream = next_stream
@@ -18,6 +18,7 @@
 
 import psutil
 import logging
+import collections
 from enum import Enum
 from comfy.cli_args import args, PerformanceFeature
 import torch
@@ -32,12 +33,112 @@ import threading
 # ============ 多 GPU 调度相关配置 ============
 ENABLE_MULTI_GPU = os.getenv('COMFY_MULTI_GPU_SCHED', '0') == '1'
 
+# 共享权重池的内存预算（GB），默认使用物理内存的一半
+SHARED_POOL_BUDGET_GB = os.getenv('COMFY_MULTI_GPU_POOL_GB', None)
+
+
+class SharedStoragePool:
+    """
+    多 GPU 共享的 CPU 权重池（key: model_hash, value: 已 share_memory_() 的 state_dict）
+
+    - 记录每个条目的字节数，总量超过预算时按 LRU 淘汰
+    - 记录每个条目正在被哪些 GPU 使用（引用计数），使用中的条目不会被淘汰
+    - 统计命中/未命中/淘汰次数，供 /shared_pool 接口查询
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.lock = threading.RLock()
+        self.entries = collections.OrderedDict()  # model_hash -> state_dict，按最近使用排序
+        self.entry_bytes = {}  # model_hash -> 字节数
+        self.users = {}  # model_hash -> {device 字符串: 引用计数}
+        self.bytes_resident = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, model_hash):
+        with self.lock:
+            return model_hash in self.entries
+
+    def get(self, model_hash):
+        with self.lock:
+            state_dict = self.entries.get(model_hash, None)
+            if state_dict is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(model_hash)
+            self.hits += 1
+            return state_dict
+
+    def put(self, model_hash, state_dict):
+        size = sum(t.nelement() * t.element_size() for t in state_dict.values() if isinstance(t, torch.Tensor))
+        with self.lock:
+            if model_hash in self.entries:
+                return
+            self.entries[model_hash] = state_dict
+            self.entry_bytes[model_hash] = size
+            self.bytes_resident += size
+            self._evict(keep=model_hash)
+
+    def acquire(self, model_hash, device):
+        with self.lock:
+            users = self.users.setdefault(model_hash, {})
+            users[str(device)] = users.get(str(device), 0) + 1
+
+    def release(self, model_hash, device):
+        with self.lock:
+            users = self.users.get(model_hash, {})
+            count = users.get(str(device), 0) - 1
+            if count > 0:
+                users[str(device)] = count
+            else:
+                users.pop(str(device), None)
+            if len(users) == 0:
+                self.users.pop(model_hash, None)
+            self._evict()
+
+    def _evict(self, keep=None):
+        if self.budget_bytes is None:
+            return
+        for model_hash in list(self.entries.keys()):
+            if self.bytes_resident <= self.budget_bytes:
+                break
+            if model_hash == keep or len(self.users.get(model_hash, {})) > 0:
+                continue
+            self.entries.pop(model_hash)
+            self.bytes_resident -= self.entry_bytes.pop(model_hash)
+            self.evictions += 1
+            logging.info(f"🧹 [Shared Memory] Evicted {model_hash} from shared pool, resident {self.bytes_resident / (1024 ** 3):.2f} GB")
+        if self.bytes_resident > self.budget_bytes:
+            logging.debug(f"[Shared Memory] Pool over budget, all remaining entries are in use ({self.bytes_resident / (1024 ** 3):.2f} GB)")
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "budget_bytes": self.budget_bytes,
+                "bytes_resident": self.bytes_resident,
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "models": [
+                    {"model_hash": k, "bytes": self.entry_bytes[k], "users": dict(self.users.get(k, {}))}
+                    for k in self.entries
+                ],
+            }
+
+
 if ENABLE_MULTI_GPU:
     # 使用全局共享缓存，所有 GPU 共享同一份 CPU 内存中的模型
     _shared_model_cache = []  # 全局共享的模型缓存（CPU 侧）
     _model_cache_lock = threading.RLock()
-    # 存储共享的模型基础对象，key: model_hash, value: base_model (已设置 share_memory_)
-    _shared_storage_pool = {}
+    # 存储共享的模型基础对象，key: model_hash, value: state_dict (已设置 share_memory_)
+    if SHARED_POOL_BUDGET_GB is not None:
+        _shared_pool_budget = int(float(SHARED_POOL_BUDGET_GB) * 1024 * 1024 * 1024)
+    else:
+        _shared_pool_budget = psutil.virtual_memory().total // 2
+    _shared_storage_pool = SharedStoragePool(_shared_pool_budget)
     # 加载锁：确保同一个模型只有一个 Worker 在加载
     _model_loading_locks = {}  # key: model_hash, value: threading.Lock
     _use_shared_cache = True
@@ -67,7 +168,7 @@ def _extract_model_storage(model, model_hash):
 
             if shared_count > 0:
                 # 保存共享的 state_dict
-                _shared_storage_pool[model_hash] = state_dict
+                _shared_storage_pool.put(model_hash, state_dict)
                 logging.info(f"💾 [Shared Memory] Cached state_dict with {shared_count} shared tensors for {model.__class__.__name__} (hash: {model_hash})")
             else:
                 logging.warning(f"⚠️  No CPU tensors found to share for {model.__class__.__name__}")
@@ -76,11 +177,13 @@ def _extract_model_storage(model, model_hash):
 
 def _apply_shared_storage(model, model_hash):
     """从共享池加载 state_dict 到当前模型，避免重新从磁盘读取"""
-    if not _use_shared_cache or model_hash not in _shared_storage_pool:
+    if not _use_shared_cache:
         return False
 
     try:
-        shared_state_dict = _shared_storage_pool[model_hash]
+        shared_state_dict = _shared_storage_pool.get(model_hash)
+        if shared_state_dict is None:
+            return False
 
         # 使用共享的 state_dict 加载参数（避免从磁盘读取）
         if hasattr(model, 'model') and model.model is not None:
@@ -552,6 +655,7 @@ class LoadedModel:
         self.currently_used = True
         self.model_finalizer = None
         self._patcher_finalizer = None
+        self._pool_acquired = False
 
         # 多 GPU 模式：计算模型标识用于缓存查找
         if _use_shared_cache:
@@ -560,19 +664,21 @@ class LoadedModel:
             self.model_hash = None
 
     def _compute_model_hash(self, model):
-        """计算模型的唯一标识"""
+        """
+        计算模型的内容标识：权重文件的内容哈希（见 comfy.utils.weights_file_hash）+ 模型类型 + dtype
+
+        同一文件中的 UNet / CLIP / VAE 通过内部模型类型区分；
+        没有内容标识的模型（例如代码中构造、非文件加载的模型）返回 None，不参与共享
+        """
+        identity = getattr(model, "model_identity", None)
+        if identity is None:
+            return None
         try:
-            # 使用模型大小、类型和类名组合作为标识
-            size = model.model_size()
             type_name = model.__class__.__name__
-            # 如果有 model 属性，也包含它的类型
-            if hasattr(model, 'model') and model.model is not None:
-                inner_type = model.model.__class__.__name__
-                return f"{type_name}_{inner_type}_{size}"
-            return f"{type_name}_{size}"
-        except:
-            # 降级方案：使用类名
-            return model.__class__.__name__
+            inner_type = model.model.__class__.__name__ if getattr(model, 'model', None) is not None else ""
+            return f"{type_name}_{inner_type}_{model.model_dtype()}_{identity}"
+        except Exception:
+            return None
 
     def _set_model(self, model):
         self._model = weakref.ref(model)
@@ -613,6 +719,10 @@ class LoadedModel:
             if self.model_hash not in _shared_storage_pool:
                 # 首次加载，将 CPU 参数设为共享内存
                 _extract_model_storage(self.model, self.model_hash)
+            # 标记该 GPU 正在使用此条目，使用期间不会被淘汰
+            if not self._pool_acquired:
+                _shared_storage_pool.acquire(self.model_hash, self.device)
+                self._pool_acquired = True
 
         # if self.model.loaded_size() > 0:
         use_more_vram = lowvram_model_memory
@@ -644,26 +754,30 @@ class LoadedModel:
         self.model_finalizer.detach()
         self.model_finalizer = None
         self.real_model = None
+        self.release_shared_storage()
         return True
 
+    def release_shared_storage(self):
+        if self._pool_acquired:
+            _shared_storage_pool.release(self.model_hash, self.device)
+            self._pool_acquired = False
+
     def model_use_more_vram(self, extra_memory, force_patch_weights=False):
         return self.model.partially_load(self.device, extra_memory, force_patch_weights=force_patch_weights)
 
     def __eq__(self, other):
-        # 多 GPU 模式：基于模型大小和类型判断（而不是对象引用）
-        if _use_shared_cache:
-            if self.model is other.model:
-                return True
-            # 如果是相同大小和类型的模型，认为是同一个
+        if self.model is other.model:
+            return True
+        # 多 GPU 模式：内容标识相同、同一设备、共用底层模块且补丁一致时视为同一个模型
+        # （只按大小和类型判断会把同架构的不同微调模型当成同一个）
+        if _use_shared_cache and self.model_hash is not None and self.model_hash == other.model_hash:
             try:
-                return (self.model.model_size() == other.model.model_size() and
-                        type(self.model) == type(other.model) and
-                        self.model.__class__.__name__ == other.model.__class__.__name__)
-            except:
+                return (self.device == other.device and
+                        self.model.model is other.model.model and
+                        self.model.patches_uuid == other.model.patches_uuid)
+            except AttributeError:
                 return False
-        else:
-            # 单 GPU 模式：保持原有逻辑
-            return self.model is other.model
+        return False
 
     def __del__(self):
         if self._patcher_finalizer is not None:
@@ -817,6 +931,7 @@ def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimu
             model_to_unload = current_loaded.pop(i)
             model_to_unload.model.detach(unpatch_all=False)
             model_to_unload.model_finalizer.detach()
+            model_to_unload.release_shared_storage()
 
     total_memory_required = {}
     for loaded_model in models_to_load:
@@ -893,6 +1008,27 @@ def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimu
 def load_model_gpu(model):
     return load_models_gpu([model])
 
+def shared_pool_stats():
+    """返回多 GPU 共享权重池的统计信息，单 GPU 模式下返回 None"""
+    if not _use_shared_cache:
+        return None
+    return _shared_storage_pool.get_stats()
+
+def loaded_source_files():
+    """
+    返回每个设备上当前驻留模型的来源文件，供多 GPU 调度器做模型亲和路由
+
+    Returns:
+        dict: torch.device -> set(模型文件路径)
+    """
+    out = {}
+    for loaded in list(_get_current_loaded_models()):
+        model = loaded.model
+        if model is None or loaded.real_model is None or loaded.real_model() is None:
+            continue
+        out.setdefault(loaded.device, set()).update(getattr(model, "source_files", ()))
+    return out
+
 def loaded_models(only_currently_used=False):
     output = []
     for m in current_loaded_models:
@@ -906,8 +1042,9 @@ def loaded_models(only_currently_used=False):
 
 def cleanup_models_gc():
     do_gc = False
-    for i in range(len(current_loaded_models)):
-        cur = current_loaded_models[i]
+    current_loaded = _get_current_loaded_models()
+    for i in range(len(current_loaded)):
+        cur = current_loaded[i]
         if cur.is_dead():
             logging.info("Potential memory leak detected with model {}, doing a full garbage collect, for maximum performance avoid circular references in the model code.".format(cur.real_model().__class__.__name__))
             do_gc = True
@@ -917,21 +1054,24 @@ def cleanup_models_gc():
         gc.collect()
         soft_empty_cache()
 
-        for i in range(len(current_loaded_models)):
-            cur = current_loaded_models[i]
+        for i in range(len(current_loaded)):
+            cur = current_loaded[i]
             if cur.is_dead():
                 logging.warning("WARNING, memory leak with model {}. Please make sure it is not being referenced from somewhere.".format(cur.real_model().__class__.__name__))
 
 
 
 def cleanup_models():
+    current_loaded = _get_current_loaded_models()
     to_delete = []
-    for i in range(len(current_loaded_models)):
-        if current_loaded_models[i].real_model() is None:
+    for i in range(len(current_loaded)):
+        if current_loaded[i].real_model() is None:
             to_delete = [i] + to_delete
 
     for i in to_delete:
-        x = current_loaded_models.pop(i)
+        x = current_loaded.pop(i)
+        # 模型已被回收，释放其在共享池中的占用，条目才能被淘汰
+        x.release_shared_storage()
         del x
 
 def dtype_size(dtype):
@@ -1201,7 +1341,7 @@ def force_channels_last():
 
 STREAMS = {}
 NUM_STREAMS = 1
-if args.async_offload:
+if args.async_offload or args.prefetch_weights > 0:
     NUM_STREAMS = 2
     logging.info("Using async weight offloading with {} streams".format(NUM_STREAMS))
 
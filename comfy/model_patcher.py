@@ -32,8 +32,10 @@ import comfy.float
 import comfy.hooks
 import comfy.lora
 import comfy.model_management
+import comfy.patched_weight_cache
 import comfy.patcher_extension
 import comfy.utils
+import comfy.weight_prefetch
 from comfy.comfy_types import UnetWrapperFunction
 from comfy.patcher_extension import CallbacksMP, PatcherInjection, WrappersMP
 
@@ -106,6 +108,9 @@ def wipe_lowvram_weight(m):
     if hasattr(m, "bias_function"):
         m.bias_function = []
 
+    if hasattr(m, "comfy_cast_weights"):
+        m.weight_prefetcher = None
+
 def move_weight_functions(m, device):
     if device is None:
         return 0
@@ -239,6 +244,10 @@ class ModelPatcher:
         self.patches_uuid = uuid.uuid4()
         self.parent = None
         self.pinned = set()
+        self.source_files: tuple[str, ...] = ()
+        self.model_identity: Optional[str] = None
+        # (identity, strength_patch, strength_model) of every add_patches call, None once patches without identity were added
+        self.patches_identity: Optional[tuple] = ()
 
         self.attachments: dict[str] = {}
         self.additional_models: dict[str, list[ModelPatcher]] = {}
@@ -299,6 +308,9 @@ class ModelPatcher:
         n.object_patches_backup = self.object_patches_backup
         n.parent = self
         n.pinned = self.pinned
+        n.source_files = self.source_files
+        n.model_identity = self.model_identity
+        n.patches_identity = self.patches_identity
 
         n.force_cast_weights = self.force_cast_weights
 
@@ -552,7 +564,11 @@ class ModelPatcher:
         if hasattr(self.model, "get_dtype"):
             return self.model.get_dtype()
 
-    def add_patches(self, patches, strength_patch=1.0, strength_model=1.0):
+    def add_patches(self, patches, strength_patch=1.0, strength_model=1.0, patches_identity=None):
+        """
+        patches_identity identifies the content of patches (for example the hash of the LoRA file they
+        were loaded from), weights merged with patches that have one can be kept in the patched weight cache.
+        """
         with self.use_ejected():
             p = set()
             model_sd = self.model.state_dict()
@@ -574,6 +590,10 @@ class ModelPatcher:
                     self.patches[key] = current_patches
 
             self.patches_uuid = uuid.uuid4()
+            if patches_identity is None or self.patches_identity is None:
+                self.patches_identity = None
+            else:
+                self.patches_identity = self.patches_identity + ((patches_identity, strength_patch, strength_model),)
             return list(p)
 
     def get_key_patches(self, filter_prefix=None):
@@ -616,25 +636,98 @@ class ModelPatcher:
         weight, set_func, convert_func = get_key_weight(self.model, key)
         inplace_update = self.weight_inplace_update or inplace_update
 
+        self.backup_weight(key, weight, inplace_update)
+
+        cache = None
+        cache_key = None
+        if set_func is None:
+            cache_key = self.patched_weight_cache_key(key, weight, convert_func)
+            if cache_key is not None:
+                cache = comfy.patched_weight_cache.get_cache()
+
+        out_weight = None
+        if cache is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                out_weight = cached.to(device=device_to if device_to is not None else weight.device, copy=True)
+
+        if out_weight is None:
+            if device_to is not None:
+                temp_weight = comfy.model_management.cast_to_device(weight, device_to, torch.float32, copy=True)
+            else:
+                temp_weight = weight.to(torch.float32, copy=True)
+            if convert_func is not None:
+                temp_weight = convert_func(temp_weight, inplace=True)
+
+            out_weight = comfy.lora.calculate_weight(self.patches[key], temp_weight, key)
+            if set_func is None:
+                out_weight = comfy.float.stochastic_rounding(out_weight, weight.dtype, seed=string_to_seed(key))
+                if cache is not None:
+                    cache.put(cache_key, out_weight)
+
+        if set_func is None:
+            self.set_patched_weight(key, out_weight, inplace_update)
+        else:
+            set_func(out_weight, inplace_update=inplace_update, seed=string_to_seed(key))
+
+    def backup_weight(self, key, weight, inplace_update):
         if key not in self.backup:
             self.backup[key] = collections.namedtuple('Dimension', ['weight', 'inplace_update'])(weight.to(device=self.offload_device, copy=inplace_update), inplace_update)
 
-        if device_to is not None:
-            temp_weight = comfy.model_management.cast_to_device(weight, device_to, torch.float32, copy=True)
+    def set_patched_weight(self, key, out_weight, inplace_update):
+        if inplace_update:
+            comfy.utils.copy_to_param(self.model, key, out_weight)
         else:
-            temp_weight = weight.to(torch.float32, copy=True)
-        if convert_func is not None:
-            temp_weight = convert_func(temp_weight, inplace=True)
+            comfy.utils.set_attr_param(self.model, key, out_weight)
 
-        out_weight = comfy.lora.calculate_weight(self.patches[key], temp_weight, key)
-        if set_func is None:
-            out_weight = comfy.float.stochastic_rounding(out_weight, weight.dtype, seed=string_to_seed(key))
-            if inplace_update:
-                comfy.utils.copy_to_param(self.model, key, out_weight)
+    def patch_weights_to_device(self, keys, device_to=None, inplace_update=False):
+        """
+        Same as calling patch_weight_to_device for every key. Weights that are only patched by plain
+        LoRAs are merged together by comfy.lora.calculate_weights_batched instead of one at a time.
+        """
+        inplace_update = self.weight_inplace_update or inplace_update
+        cache = comfy.patched_weight_cache.get_cache()
+        batched = []
+        for key in keys:
+            if key not in self.patches:
+                continue
+            weight, set_func, convert_func = get_key_weight(self.model, key)
+            factors = None
+            cache_key = None
+            if set_func is None and convert_func is None:
+                cache_key = self.patched_weight_cache_key(key, weight, convert_func)
+                if cache is None or cache_key is None or cache_key not in cache:
+                    factors = comfy.lora.lora_update_factors(self.patches[key], weight)
+            if factors is None:
+                self.patch_weight_to_device(key, device_to=device_to, inplace_update=inplace_update)
             else:
-                comfy.utils.set_attr_param(self.model, key, out_weight)
-        else:
-            set_func(out_weight, inplace_update=inplace_update, seed=string_to_seed(key))
+                batched.append((key, weight, factors, cache_key))
+
+        if len(batched) < 2:
+            for key, _, _, _ in batched:
+                self.patch_weight_to_device(key, device_to=device_to, inplace_update=inplace_update)
+            return
+
+        weights = {}
+        for key, weight, factors, cache_key in batched:
+            self.backup_weight(key, weight, inplace_update)
+            weights[key] = (weight, cache_key)
+
+        for key, merged in comfy.lora.calculate_weights_batched([(k, w, f) for k, w, f, _ in batched], device=device_to):
+            weight, cache_key = weights[key]
+            if merged.dtype == weight.dtype:
+                out_weight = merged.clone()
+            else:
+                out_weight = comfy.float.stochastic_rounding(merged, weight.dtype, seed=string_to_seed(key))
+            if cache is not None and cache_key is not None:
+                cache.put(cache_key, out_weight)
+            self.set_patched_weight(key, out_weight, inplace_update)
+
+    def patched_weight_cache_key(self, key, weight, convert_func):
+        """Key of the merged weight in the patched weight cache, None if it can't be identified."""
+        if self.model_identity is None or not self.patches_identity:
+            return None
+        return (self.model_identity, key, weight.dtype, tuple(weight.shape), convert_func is not None, self.patches_identity)
 
     def pin_weight_to_device(self, key):
         weight, set_func, convert_func = get_key_weight(self.model, key)
@@ -678,6 +771,14 @@ class ModelPatcher:
             load_completely = []
             offloaded = []
             loading.sort(reverse=True)
+            prefetcher = None
+            if not full_load and len(loading) > 0 and lowvram_model_memory < self.model_size():
+                compute_dtype = getattr(self.model, "manual_cast_dtype", None) or self.model_dtype()
+                largest = max((comfy.weight_prefetch.cast_module_size(x[2], compute_dtype) for x in loading if hasattr(x[2], "comfy_cast_weights")), default=0)
+                prefetcher = comfy.weight_prefetch.create_prefetcher(self.model, largest)
+                if prefetcher is not None and self.model.model_loaded_weight_memory == 0:
+                    # room for the prefetched weights
+                    lowvram_model_memory = max(0, lowvram_model_memory - prefetcher.max_bytes)
             for x in loading:
                 n = x[1]
                 m = x[2]
@@ -718,6 +819,8 @@ class ModelPatcher:
                             m.bias_function = [LowVramPatch(bias_key, self.patches, convert_func, set_func)]
                             patch_counter += 1
 
+                    if prefetcher is not None and hasattr(m, "comfy_cast_weights"):
+                        m.weight_prefetcher = prefetcher
                     cast_weight = True
                     offloaded.append((module_mem, n, m, params))
                 else:
@@ -741,6 +844,7 @@ class ModelPatcher:
                 mem_counter += move_weight_functions(m, device_to)
 
             load_completely.sort(reverse=True)
+            patch_keys = []
             for x in load_completely:
                 n = x[1]
                 m = x[2]
@@ -752,10 +856,11 @@ class ModelPatcher:
                 for param in params:
                     key = "{}.{}".format(n, param)
                     self.unpin_weight(key)
-                    self.patch_weight_to_device(key, device_to=device_to)
+                    patch_keys.append(key)
 
                 logging.debug("lowvram: loaded module regularly {} {}".format(n, m))
                 m.comfy_patched_weights = True
+            self.patch_weights_to_device(patch_keys, device_to=device_to)
 
             for x in load_completely:
                 x[2].to(device_to)
@@ -815,6 +920,7 @@ class ModelPatcher:
 
                 self.model.model_lowvram = False
                 self.model.lowvram_patch_counter = 0
+            comfy.weight_prefetch.release_prefetcher(self.model)
 
             keys = list(self.backup.keys())
 
@@ -886,6 +992,7 @@ class ModelPatcher:
                         m.to(device_to)
                         module_mem += move_weight_functions(m, device_to)
                         if lowvram_possible:
+                            m.weight_prefetcher = getattr(self.model, "weight_prefetcher", None)
                             if weight_key in self.patches:
                                 _, set_func, convert_func = get_key_weight(self.model, weight_key)
                                 m.weight_function.append(LowVramPatch(weight_key, self.patches, convert_func, set_func))
@@ -1195,8 +1302,14 @@ class ModelPatcher:
             callback(self, hooks)
         return comfy.hooks.create_transformer_options_from_hooks(self, hooks, transformer_options)
 
+    def clear_prefetched_weights(self):
+        prefetcher = getattr(self.model, "weight_prefetcher", None)
+        if prefetcher is not None:
+            prefetcher.clear()
+
     def patch_hooks(self, hooks: comfy.hooks.HookGroup):
         with self.use_ejected():
+            self.clear_prefetched_weights()
             if hooks is not None:
                 model_sd_keys = list(self.model_state_dict().keys())
                 memory_counter = None
@@ -1290,6 +1403,7 @@ class ModelPatcher:
             if len(self.hook_backup) == 0:
                 self.current_hooks = None
                 return
+            self.clear_prefetched_weights()
             keys = list(self.hook_backup.keys())
             if whitelist_keys_set:
                 for k in keys:
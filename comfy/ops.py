@@ -71,24 +71,8 @@ def cast_to_input(weight, input, non_blocking=False, copy=True):
     return comfy.model_management.cast_to(weight, input.dtype, input.device, non_blocking=non_blocking, copy=copy)
 
 
-def cast_bias_weight(s, input=None, dtype=None, device=None, bias_dtype=None, offloadable=False):
-    # NOTE: offloadable=False is a a legacy and if you are a custom node author reading this please pass
-    # offloadable=True and call uncast_bias_weight() after your last usage of the weight/bias. This
-    # will add async-offload support to your cast and improve performance.
-    if input is not None:
-        if dtype is None:
-            dtype = input.dtype
-        if bias_dtype is None:
-            bias_dtype = dtype
-        if device is None:
-            device = input.device
-
-    if offloadable and (device != s.weight.device or
-                        (s.bias is not None and device != s.bias.device)):
-        offload_stream = comfy.model_management.get_offload_stream(device)
-    else:
-        offload_stream = None
-
+def cast_weight_bias_functions(s, dtype, device, bias_dtype, offload_stream):
+    """Copies the weight and bias of s to device and applies their weight/bias functions, on offload_stream if not None."""
     if offload_stream is not None:
         wf_context = offload_stream
     else:
@@ -110,11 +94,35 @@ def cast_bias_weight(s, input=None, dtype=None, device=None, bias_dtype=None, of
                 for f in s.bias_function:
                     bias = f(bias)
 
-    weight = weight.to(dtype=dtype)
-    if weight_has_function:
-        with wf_context:
-            for f in s.weight_function:
-                weight = f(weight)
+    with wf_context:
+        weight = weight.to(dtype=dtype)
+        for f in s.weight_function:
+            weight = f(weight)
+    return weight, bias
+
+def cast_bias_weight(s, input=None, dtype=None, device=None, bias_dtype=None, offloadable=False):
+    # NOTE: offloadable=False is a a legacy and if you are a custom node author reading this please pass
+    # offloadable=True and call uncast_bias_weight() after your last usage of the weight/bias. This
+    # will add async-offload support to your cast and improve performance.
+    if input is not None:
+        if dtype is None:
+            dtype = input.dtype
+        if bias_dtype is None:
+            bias_dtype = dtype
+        if device is None:
+            device = input.device
+
+    weight_prefetcher = getattr(s, "weight_prefetcher", None)
+    if offloadable and weight_prefetcher is not None and not torch.compiler.is_compiling():
+        return weight_prefetcher.cast(s, dtype, device, bias_dtype)
+
+    if offloadable and (device != s.weight.device or
+                        (s.bias is not None and device != s.bias.device)):
+        offload_stream = comfy.model_management.get_offload_stream(device)
+    else:
+        offload_stream = None
+
+    weight, bias = cast_weight_bias_functions(s, dtype, device, bias_dtype, offload_stream)
 
     comfy.model_management.sync_stream(device, offload_stream)
     if offloadable:
@@ -140,6 +148,7 @@ class CastWeightBiasOp:
     comfy_cast_weights = False
     weight_function = []
     bias_function = []
+    weight_prefetcher = None
 
 class disable_weight_init:
     class Linear(torch.nn.Linear, CastWeightBiasOp):
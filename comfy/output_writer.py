@@ -0,0 +1,84 @@
+import concurrent.futures
+import logging
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from comfy.cli_args import args
+
+
+class OutputWriter:
+    """
+    Encodes and writes output images on a bounded thread pool so PNG compression of
+    a batch runs in parallel instead of serially on the executor thread. File names are
+    picked by the caller, the writer only does the encoding and the write. At most
+    2 * max_workers images are queued, submitting more blocks until one is written.
+    """
+    def __init__(self, max_workers: int):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="output_writer")
+        self.slots = threading.BoundedSemaphore(max_workers * 2)
+        self.lock = threading.Lock()
+        self.pending: dict[str, concurrent.futures.Future] = {}
+        self.next_counters: dict[tuple[str, str], int] = {}
+
+    def reserve_counters(self, folder: str, filename: str, counter: int, count: int) -> int:
+        """
+        First of count file counters for filename in folder. counter is the next one after the
+        files on disk, counters handed out before are skipped even if their files aren't written
+        yet, so queued writes and concurrent saves with the same prefix don't overwrite each other.
+        """
+        key = (os.path.normcase(os.path.abspath(folder)), os.path.normcase(filename))
+        with self.lock:
+            counter = max(counter, self.next_counters.get(key, 0))
+            self.next_counters[key] = counter + count
+        return counter
+
+    def save_image(self, image, path: str, pnginfo=None, compress_level: int = 4) -> concurrent.futures.Future:
+        """Writes an IMAGE tensor of shape [H, W, C] with values in 0..1 as PNG."""
+        path = os.path.abspath(path)
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(self._save_image, image, path, pnginfo, compress_level)
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending[path] = future
+        future.add_done_callback(lambda f: self._done(path, f))
+        return future
+
+    def _save_image(self, image, path, pnginfo, compress_level):
+        i = 255. * image.numpy()
+        img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+        img.save(path, pnginfo=pnginfo, compress_level=compress_level)
+
+    def _done(self, path, future):
+        self.slots.release()
+        with self.lock:
+            if self.pending.get(path) is future:
+                del self.pending[path]
+        if not future.cancelled() and future.exception() is not None:
+            logging.error("Failed to write {}: {}".format(path, future.exception()))
+
+    def pending_write(self, path: str) -> concurrent.futures.Future | None:
+        with self.lock:
+            return self.pending.get(os.path.abspath(path), None)
+
+    def wait(self, futures: list[concurrent.futures.Future]) -> None:
+        """Waits for all the writes, raising the first error."""
+        concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
+
+
+_output_writer: OutputWriter | None = None
+_output_writer_lock = threading.Lock()
+
+def get_output_writer() -> OutputWriter:
+    global _output_writer
+    with _output_writer_lock:
+        if _output_writer is None:
+            _output_writer = OutputWriter(max(1, args.image_save_workers))
+        return _output_writer
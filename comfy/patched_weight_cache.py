@@ -0,0 +1,91 @@
+import collections
+import logging
+import threading
+from typing import Optional
+
+import torch
+
+from comfy.cli_args import args
+
+
+class PatchedWeightCache:
+    """
+    LRU cache of weights with their patches (LoRAs) already merged, kept in host RAM.
+
+    Entries are keyed by the identity of the base weights, the weight key and the
+    identity of the patch stack, so loading a recently used LoRA combination again
+    copies the merged weight instead of recomputing it. Bounded by total bytes.
+    """
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.lock = threading.Lock()
+        self.entries: collections.OrderedDict[tuple, torch.Tensor] = collections.OrderedDict()
+        self.bytes_resident = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: tuple) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key: tuple) -> Optional[torch.Tensor]:
+        with self.lock:
+            weight = self.entries.get(key, None)
+            if weight is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return weight
+
+    def put(self, key: tuple, weight: torch.Tensor):
+        size = weight.nelement() * weight.element_size()
+        if size > self.budget_bytes:
+            return
+        weight = weight.to(device="cpu", copy=True)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes_resident -= old.nelement() * old.element_size()
+            self.entries[key] = weight
+            self.bytes_resident += size
+            while self.bytes_resident > self.budget_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes_resident -= evicted.nelement() * evicted.element_size()
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes_resident = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes_resident": self.bytes_resident,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_cache: Optional[PatchedWeightCache] = None
+
+
+def set_budget(budget_gb: float):
+    global _cache
+    if budget_gb > 0:
+        _cache = PatchedWeightCache(int(budget_gb * (1024 ** 3)))
+        logging.info(f"Caching up to {budget_gb} GB of weights with merged LoRAs in RAM")
+    else:
+        _cache = None
+
+
+def get_cache() -> Optional[PatchedWeightCache]:
+    return _cache
+
+
+set_budget(args.patched_weight_cache_gb)
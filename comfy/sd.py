@@ -62,7 +62,7 @@ import comfy.taesd.taesd
 
 import comfy.ldm.flux.redux
 
-def load_lora_for_models(model, clip, lora, strength_model, strength_clip):
+def load_lora_for_models(model, clip, lora, strength_model, strength_clip, lora_identity=None):
     key_map = {}
     if model is not None:
         key_map = comfy.lora.model_lora_keys_unet(model.model, key_map)
@@ -73,14 +73,14 @@ def load_lora_for_models(model, clip, lora, strength_model, strength_clip):
     loaded = comfy.lora.load_lora(lora, key_map)
     if model is not None:
         new_modelpatcher = model.clone()
-        k = new_modelpatcher.add_patches(loaded, strength_model)
+        k = new_modelpatcher.add_patches(loaded, strength_model, patches_identity=lora_identity)
     else:
         k = ()
         new_modelpatcher = None
 
     if clip is not None:
         new_clip = clip.clone()
-        k1 = new_clip.add_patches(loaded, strength_clip)
+        k1 = new_clip.add_patches(loaded, strength_clip, patches_identity=lora_identity)
     else:
         k1 = ()
         new_clip = None
@@ -146,8 +146,8 @@ class CLIP:
     def get_ram_usage(self):
         return self.patcher.get_ram_usage()
 
-    def add_patches(self, patches, strength_patch=1.0, strength_model=1.0):
-        return self.patcher.add_patches(patches, strength_patch, strength_model)
+    def add_patches(self, patches, strength_patch=1.0, strength_model=1.0, patches_identity=None):
+        return self.patcher.add_patches(patches, strength_patch, strength_model, patches_identity=patches_identity)
 
     def set_tokenizer_option(self, option_name, value):
         self.tokenizer_options[option_name] = value
@@ -917,7 +917,10 @@ def load_clip(ckpt_paths, embedding_directory=None, clip_type=CLIPType.STABLE_DI
     clip_data = []
     for p in ckpt_paths:
         clip_data.append(comfy.utils.load_torch_file(p, safe_load=True))
-    return load_text_encoder_state_dicts(clip_data, embedding_directory=embedding_directory, clip_type=clip_type, model_options=model_options)
+    clip = load_text_encoder_state_dicts(clip_data, embedding_directory=embedding_directory, clip_type=clip_type, model_options=model_options)
+    clip.patcher.source_files = tuple(ckpt_paths)
+    clip.patcher.model_identity = "+".join(comfy.utils.weights_file_hash(p) for p in ckpt_paths)
+    return clip
 
 
 class TEModel(Enum):
@@ -1193,6 +1196,12 @@ def load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, o
     out = load_state_dict_guess_config(sd, output_vae, output_clip, output_clipvision, embedding_directory, output_model, model_options, te_model_options=te_model_options, metadata=metadata)
     if out is None:
         raise RuntimeError("ERROR: Could not detect model type of: {}\n{}".format(ckpt_path, model_detection_error_hint(ckpt_path, sd)))
+    model_patcher, clip, vae, _ = out
+    model_identity = comfy.utils.weights_file_hash(ckpt_path)
+    for patcher in (model_patcher, getattr(clip, "patcher", None), getattr(vae, "patcher", None)):
+        if patcher is not None:
+            patcher.source_files = (ckpt_path,)
+            patcher.model_identity = model_identity
     return out
 
 def load_state_dict_guess_config(sd, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True, model_options={}, te_model_options={}, metadata=None):
@@ -1368,6 +1377,8 @@ def load_diffusion_model(unet_path, model_options={}):
     if model is None:
         logging.error("ERROR UNSUPPORTED DIFFUSION MODEL {}".format(unet_path))
         raise RuntimeError("ERROR: Could not detect model type of: {}\n{}".format(unet_path, model_detection_error_hint(unet_path, sd)))
+    model.source_files = (unet_path,)
+    model.model_identity = comfy.utils.weights_file_hash(unet_path)
     return model
 
 def load_unet(unet_path, dtype=None):
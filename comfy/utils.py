@@ -19,7 +19,10 @@
 
 import torch
 import math
+import os
 import struct
+import hashlib
+import threading
 import comfy.checkpoint_pickle
 import safetensors.torch
 import numpy as np
@@ -736,6 +739,51 @@ def safetensors_header(safetensors_path, max_size=100*1024*1024):
             return None
         return f.read(length_of_header)
 
+WEIGHTS_HASH_SAMPLES = 16
+WEIGHTS_HASH_SAMPLE_SIZE = 64 * 1024
+_weights_hash_cache: dict[str, tuple[tuple[int, int], str]] = {}
+_weights_hash_lock = threading.Lock()
+
+def weights_file_hash(path):
+    """
+    Fast content identity of a weights file without reading all of it: the file size,
+    the safetensors header (tensor names, dtypes, shapes, offsets) and evenly spaced
+    samples of the tensor data. Cached per path, invalidated when mtime or size change.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _weights_hash_lock:
+        cached = _weights_hash_cache.get(path, None)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(struct.pack('<Q', stat.st_size))
+    data_start = 0
+    with open(path, "rb") as f:
+        if path.lower().endswith(".safetensors") or path.lower().endswith(".sft"):
+            header = f.read(8)
+            if len(header) == 8:
+                length_of_header = struct.unpack('<Q', header)[0]
+                if length_of_header <= stat.st_size - 8:
+                    h.update(f.read(length_of_header))
+                    data_start = 8 + length_of_header
+
+        data_size = stat.st_size - data_start
+        if data_size <= WEIGHTS_HASH_SAMPLES * WEIGHTS_HASH_SAMPLE_SIZE:
+            f.seek(data_start)
+            h.update(f.read(data_size))
+        else:
+            step = (data_size - WEIGHTS_HASH_SAMPLE_SIZE) // (WEIGHTS_HASH_SAMPLES - 1)
+            for i in range(WEIGHTS_HASH_SAMPLES):
+                f.seek(data_start + i * step)
+                h.update(f.read(WEIGHTS_HASH_SAMPLE_SIZE))
+
+    digest = h.hexdigest()
+    with _weights_hash_lock:
+        _weights_hash_cache[path] = (key, digest)
+    return digest
+
 def set_attr(obj, attr, value):
     attrs = attr.split(".")
     for name in attrs[:-1]:
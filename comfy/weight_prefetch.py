@@ -0,0 +1,156 @@
+import collections
+import logging
+from typing import Optional
+
+import torch
+
+import comfy.model_management
+import comfy.ops
+from comfy.cli_args import args
+
+
+class WeightPrefetcher:
+    """
+    Casts the weights of offloaded (lowvram) modules ahead of their use.
+
+    The order in which the modules cast their weights is recorded on the first step. After that,
+    when a module casts its weights the next modules_ahead modules are copied to the device and
+    have their LowVramPatch functions applied on an offload stream, so the copies overlap with the
+    compute of the modules before them. Every prefetched module records an event after its casts,
+    the compute waits for that event only, not for the copies queued after it. The prefetched
+    weights are kept until their module runs, at most max_bytes of them at a time, counted by the
+    size of the cast tensors.
+    """
+    def __init__(self, modules_ahead: int, max_bytes: int):
+        self.modules_ahead = modules_ahead
+        self.max_bytes = max_bytes
+        self.order = []
+        self.position = {}
+        self.recording = True
+        self.staged: collections.OrderedDict[torch.nn.Module, tuple] = collections.OrderedDict()
+        self.staged_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self):
+        self.clear()
+        self.order = []
+        self.position = {}
+        self.recording = True
+
+    def clear(self):
+        self.staged.clear()
+        self.staged_bytes = 0
+
+    def cast(self, s, dtype, device, bias_dtype):
+        """Returns (weight, bias, offload_stream) for s like comfy.ops.cast_bias_weight, prefetches the modules after it."""
+        staged = self.staged.pop(s, None)
+        if staged is not None:
+            self.staged_bytes -= staged[4]
+            if staged[3] != (dtype, device, bias_dtype):
+                staged = None
+        if not self.recording or s in self.position:
+            if staged is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if staged is None:
+            staged = self._cast(s, (dtype, device, bias_dtype))
+        weight, bias, offload_stream, _, size, event = staged
+        self._advance(s, (dtype, device, bias_dtype), size)
+        if event is not None:
+            comfy.model_management.current_stream(device).wait_event(event)
+        return weight, bias, offload_stream
+
+    def _cast(self, m, key):
+        dtype, device, bias_dtype = key
+        offload_stream = comfy.model_management.get_offload_stream(device)
+        weight, bias = comfy.ops.cast_weight_bias_functions(m, dtype, device, bias_dtype, offload_stream)
+        event = None
+        if offload_stream is not None:
+            event = offload_stream.record_event()
+        size = staged_size(weight) + staged_size(bias)
+        return (weight, bias, offload_stream, key, size, event)
+
+    def _advance(self, s, key, size):
+        position = self.position.get(s, None)
+        if position is None and not self.recording:
+            # modules were offloaded or loaded since the order was recorded
+            self.reset()
+        if position is None:
+            self.position[s] = len(self.order)
+            self.order.append((s, key, size))
+            return
+        # back at a module seen before, the order of one step is recorded
+        self.recording = False
+
+        count = len(self.order)
+        ahead = min(self.modules_ahead, count - 1)
+        for m in list(self.staged.keys()):
+            if not 0 < (self.position[m] - position) % count <= ahead:
+                # skipped by the model this step
+                self.staged_bytes -= self.staged.pop(m)[4]
+
+        for i in range(1, ahead + 1):
+            m, key, size = self.order[(position + i) % count]
+            if m in self.staged:
+                continue
+            if m.weight_prefetcher is not self:
+                continue
+            if self.staged_bytes + size > self.max_bytes:
+                break
+            staged = self._cast(m, key)
+            self.staged[m] = staged
+            self.staged_bytes += staged[4]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "modules": len(self.order),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+        }
+
+
+def staged_size(tensor) -> int:
+    if tensor is None:
+        return 0
+    return tensor.nelement() * tensor.element_size()
+
+
+def cast_module_size(m, compute_dtype) -> int:
+    """Bytes of the weights of m once cast to compute_dtype, or their stored size if that is larger."""
+    element_size = torch.empty((), dtype=compute_dtype).element_size() if compute_dtype is not None else 0
+    return sum(p.nelement() * max(p.element_size(), element_size) for p in m.parameters(recurse=False))
+
+
+def create_prefetcher(model, largest_cast_bytes: int) -> Optional[WeightPrefetcher]:
+    """
+    The prefetcher for the offloaded modules of model, None if prefetching is disabled.
+    largest_cast_bytes is the cast size of the largest module, see cast_module_size.
+    """
+    if args.prefetch_weights <= 0:
+        return None
+    max_bytes = args.prefetch_weights * largest_cast_bytes
+    prefetcher = getattr(model, "weight_prefetcher", None)
+    if prefetcher is None:
+        prefetcher = WeightPrefetcher(args.prefetch_weights, max_bytes)
+        model.weight_prefetcher = prefetcher
+    else:
+        prefetcher.reset()
+        prefetcher.max_bytes = max_bytes
+    return prefetcher
+
+
+def release_prefetcher(model):
+    prefetcher = getattr(model, "weight_prefetcher", None)
+    if prefetcher is None:
+        return
+    stats = prefetcher.stats()
+    if stats["hits"] + stats["misses"] > 0:
+        logging.info("Weight prefetch: {} of {} offloaded weight casts were prefetched ({:.1%}), {} modules".format(
+            stats["hits"], stats["hits"] + stats["misses"], stats["hit_rate"], stats["modules"]))
+    prefetcher.clear()
+    del model.weight_prefetcher
@@ -33,6 +33,14 @@ class VideoInput(ABC):
         """
         pass
 
+    def get_frames(self, start_frame: int = 0, end_frame: Optional[int] = None, stride: int = 1):
+        """
+        Returns the frames from start_frame up to end_frame, every stride-th one. The
+        result supports len(), indexing and slicing like an IMAGE tensor. Subclasses
+        can return a source that only decodes the frames that are accessed.
+        """
+        return self.get_components().images[start_frame:end_frame:stride]
+
     def get_stream_source(self) -> Union[str, io.BytesIO]:
         """
         Get a streamable source for the video. This allows processing without
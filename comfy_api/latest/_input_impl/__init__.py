@@ -1,7 +1,8 @@
-from .video_types import VideoFromFile, VideoFromComponents
+from .video_types import VideoFromFile, VideoFromComponents, VideoFrameSource
 
 __all__ = [
     # Implementations
     "VideoFromFile",
     "VideoFromComponents",
+    "VideoFrameSource",
 ]
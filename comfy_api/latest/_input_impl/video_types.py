@@ -1,6 +1,8 @@
 from __future__ import annotations
 from av.container import InputContainer
 from av.subtitles.stream import SubtitleStream
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from fractions import Fraction
 from typing import Optional
 from comfy_api.latest._input import AudioInput, VideoInput
@@ -9,6 +11,8 @@ import io
 import json
 import numpy as np
 import math
+import os
+import threading
 import torch
 from comfy_api.latest._util import VideoContainer, VideoCodec, VideoComponents
 
@@ -52,6 +56,225 @@ def get_open_write_kwargs(
     return open_kwargs
 
 
+# Encoder, pixel format and options of each codec VideoFromComponents can write
+VIDEO_ENCODERS = {
+    VideoCodec.H264: ("libx264", "yuv420p", {}),
+    VideoCodec.H265: ("libx265", "yuv420p", {"x265-params": "log-level=warning"}),
+    VideoCodec.VP9: ("libvpx-vp9", "yuv420p", {"row-mt": "1"}),
+    VideoCodec.AV1: ("libsvtav1", "yuv420p10le", {"preset": "6"}),
+}
+
+# Muxer, codecs it can hold (the first one is the default) and audio codec of each container
+VIDEO_CONTAINERS = {
+    VideoContainer.MP4: ("mp4", (VideoCodec.H264, VideoCodec.H265, VideoCodec.VP9, VideoCodec.AV1), "aac"),
+    VideoContainer.WEBM: ("webm", (VideoCodec.VP9, VideoCodec.AV1), "libopus"),
+    VideoContainer.MKV: ("matroska", (VideoCodec.H264, VideoCodec.H265, VideoCodec.VP9, VideoCodec.AV1), "aac"),
+}
+
+# Name of each codec as reported by a decoded stream
+VIDEO_CODEC_NAMES = {
+    VideoCodec.H264: "h264",
+    VideoCodec.H265: "hevc",
+    VideoCodec.VP9: "vp9",
+    VideoCodec.AV1: "av1",
+}
+
+# Stream codecs each container can take unchanged when a file is remuxed, None for any
+REMUX_CODECS = {
+    VideoContainer.MP4: {"h264", "hevc", "vp9", "av1", "aac", "mp3", "opus", "flac", "alac"},
+    VideoContainer.WEBM: {"vp8", "vp9", "av1", "opus", "vorbis"},
+    VideoContainer.MKV: None,
+}
+
+
+def stream_codec_name(stream) -> str:
+    """The codec of stream independent of the decoder used for it, e.g. av1 for libdav1d."""
+    return stream.codec_context.codec.canonical_name
+
+
+def can_remux(streams, format: VideoContainer) -> bool:
+    """Whether every stream that would be copied can be written to a format container as is."""
+    codecs = REMUX_CODECS[format]
+    if codecs is None:
+        return True
+    for stream in streams:
+        if isinstance(stream, SubtitleStream):
+            return False
+        if isinstance(stream, (av.VideoStream, av.AudioStream)) and stream_codec_name(stream) not in codecs:
+            return False
+    return True
+
+
+# Frames converted to uint8 in one op, and frames waiting to be encoded at most
+ENCODE_BATCH_SIZE = 16
+ENCODE_QUEUE_DEPTH = 32
+
+_reformat_pool: Optional[ThreadPoolExecutor] = None
+_reformat_pool_lock = threading.Lock()
+
+
+def get_reformat_pool() -> ThreadPoolExecutor:
+    global _reformat_pool
+    with _reformat_pool_lock:
+        if _reformat_pool is None:
+            _reformat_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="video_reformat")
+        return _reformat_pool
+
+
+def _to_video_frame(img: np.ndarray, pix_fmt: str) -> av.VideoFrame:
+    return av.VideoFrame.from_ndarray(img, format='rgb24').reformat(format=pix_fmt)
+
+
+def iter_video_frames(images: torch.Tensor, pix_fmt: str):
+    """
+    Yields the images as frames in the encoder's pixel format, in order. The uint8
+    conversion runs on batches of images on their own device, the colorspace conversion
+    of up to ENCODE_QUEUE_DEPTH frames runs ahead on a thread pool while frames are encoded.
+    """
+    pool = get_reformat_pool()
+    pending = deque()
+    for i in range(0, images.shape[0], ENCODE_BATCH_SIZE):
+        batch = (images[i:i + ENCODE_BATCH_SIZE, :, :, :3] * 255).clamp(0, 255).byte().cpu().numpy()  # shape: (N, H, W, 3)
+        for img in batch:
+            pending.append(pool.submit(_to_video_frame, img, pix_fmt))
+            while len(pending) >= ENCODE_QUEUE_DEPTH:
+                yield pending.popleft().result()
+    while len(pending) > 0:
+        yield pending.popleft().result()
+
+
+class VideoFrameSource:
+    """
+    Frames of a video file that are decoded when they are accessed, instead of all at once.
+
+    Supports len(), indexing and slicing like an IMAGE tensor: an index returns a float32
+    (H, W, 3) frame, a slice a (N, H, W, 3) batch. start_frame, end_frame and stride pick
+    the frames of the file that are part of the source. Reaching a frame far ahead of the
+    decoder seeks to the keyframe before it, frames that are only decoded on the way are
+    not converted to RGB. Requested frames are kept as uint8 in a small window of recent
+    frames and only converted to float when they are returned.
+    """
+
+    # Targets further ahead than this are reached by seeking instead of decoding up to them
+    SEEK_MIN_FRAMES = 120
+
+    def __init__(self, file: str | io.BytesIO, start_frame: int = 0, end_frame: Optional[int] = None, stride: int = 1, window: int = 32):
+        if stride < 1:
+            raise ValueError("stride must be at least 1")
+        if isinstance(file, io.BytesIO):
+            # A container of its own, the BytesIO may be read by others in the meantime
+            file = io.BytesIO(file.getvalue())
+        self.file = file
+        self.stride = stride
+        self.window = window
+        self.lock = threading.Lock()
+        self.cache: OrderedDict[int, torch.Tensor] = OrderedDict()
+        self.container: Optional[InputContainer] = None
+        self.decoded = None
+        self.position = 0  # frame index the decoder returns next
+
+        self._open()
+        stream = self.container.streams.video[0]
+        self.width = stream.width
+        self.height = stream.height
+        self.frame_rate = Fraction(stream.average_rate) if stream.average_rate else Fraction(1)
+        total = stream.frames if stream.frames > 0 else self._count_frames()
+        end_frame = total if end_frame is None else min(end_frame, total)
+        self.frames = range(max(start_frame, 0), max(end_frame, 0), stride)
+
+    def _open(self):
+        if isinstance(self.file, io.BytesIO):
+            self.file.seek(0)
+        self.container = av.open(self.file, mode='r')
+        stream = self.container.streams.video[0]
+        stream.thread_type = "AUTO"
+        self.time_base = stream.time_base
+        self.start_pts = stream.start_time or 0
+        self.decoded = self.container.decode(stream)
+        self.position = 0
+
+    def _count_frames(self) -> int:
+        stream = self.container.streams.video[0]
+        count = sum(1 for packet in self.container.demux(stream) if packet.size > 0)
+        self.close()
+        return count
+
+    def close(self):
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+            self.decoded = None
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def _frame_index(self, frame) -> int:
+        if frame.pts is None or self.time_base is None:
+            return self.position or 0
+        return round((frame.pts - self.start_pts) * self.time_base * self.frame_rate)
+
+    def _seek(self, index: int):
+        if self.container is None or self.time_base is None or index == 0:
+            self.close()
+            self._open()
+            if index == 0 or self.time_base is None:
+                return
+        stream = self.container.streams.video[0]
+        self.container.seek(self.start_pts + int(index / self.frame_rate / self.time_base), stream=stream, backward=True)
+        self.decoded = self.container.decode(stream)
+        # the position is only known once the first frame after the seek is decoded
+        self.position = None
+
+    def _decode_to(self, index: int, seek: bool = True) -> torch.Tensor:
+        if self.container is None or self.position is None or index < self.position or (seek and index - self.position > self.SEEK_MIN_FRAMES):
+            self._seek(index if seek else 0)
+        for frame in self.decoded:
+            position = self._frame_index(frame)
+            if self.position is None and position > index:
+                # the seek went past the frame, decode from the start instead
+                self._seek(0)
+                return self._decode_to(index, seek=False)
+            self.position = position + 1
+            if position >= index:
+                # variable frame rate videos can skip indices, the next frame stands in
+                return torch.from_numpy(frame.to_ndarray(format='rgb24'))
+        raise IndexError(f"Frame {index} could not be decoded")
+
+    def get_uint8(self, key: int | slice) -> torch.Tensor:
+        """Same as indexing, but returns the frames as uint8."""
+        if isinstance(key, slice):
+            indices = self.frames[key]
+        else:
+            indices = [self.frames[key]]
+        out = torch.empty((len(indices), self.height, self.width, 3), dtype=torch.uint8)
+        with self.lock:
+            # Decode in file order, whatever order the frames were asked for in
+            for i in sorted(range(len(indices)), key=lambda i: indices[i]):
+                index = indices[i]
+                frame = self.cache.get(index, None)
+                if frame is None:
+                    frame = self._decode_to(index)
+                    self.cache[index] = frame
+                    if len(self.cache) > self.window:
+                        self.cache.popitem(last=False)
+                else:
+                    self.cache.move_to_end(index)
+                out[i] = frame
+        return out if isinstance(key, slice) else out[0]
+
+    def __getitem__(self, key: int | slice) -> torch.Tensor:
+        return self.get_uint8(key).float().div_(255.0)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def iter_batches(self, batch_size: int):
+        """Yields the frames as (N, H, W, 3) batches of at most batch_size frames."""
+        for i in range(0, len(self), batch_size):
+            yield self[i:i + batch_size]
+
+
 class VideoFromFile(VideoInput):
     """
     Class representing video input from a file.
@@ -133,15 +356,28 @@ class VideoFromFile(VideoInput):
         with av.open(self.__file, mode='r') as container:
             return container.format.name
 
+    def get_frames(self, start_frame: int = 0, end_frame: Optional[int] = None, stride: int = 1) -> VideoFrameSource:
+        """
+        Returns the frames from start_frame up to end_frame, every stride-th one, decoded
+        only once they are accessed.
+        """
+        return VideoFrameSource(self.__file, start_frame=start_frame, end_frame=end_frame, stride=stride)
+
     def get_components_internal(self, container: InputContainer) -> VideoComponents:
-        # Get video frames
+        # Get video frames, kept as uint8 until all are decoded so only the result is float
+        container.streams.video[0].thread_type = "AUTO"
         frames = []
         for frame in container.decode(video=0):
-            img = frame.to_ndarray(format='rgb24')  # shape: (H, W, 3)
-            img = torch.from_numpy(img) / 255.0  # shape: (H, W, 3)
-            frames.append(img)
+            frames.append(torch.from_numpy(frame.to_ndarray(format='rgb24')))  # shape: (H, W, 3)
 
-        images = torch.stack(frames) if len(frames) > 0 else torch.zeros(0, 3, 0, 0)
+        if len(frames) > 0:
+            images = torch.empty((len(frames),) + frames[0].shape, dtype=torch.float32)
+            for i in range(len(frames)):
+                images[i] = frames[i]
+                images[i] /= 255.0
+                frames[i] = None
+        else:
+            images = torch.zeros(0, 3, 0, 0)
 
         # Get frame rate
         video_stream = next(s for s in container.streams if s.type == 'video')
@@ -189,13 +425,19 @@ class VideoFromFile(VideoInput):
     ):
         if isinstance(self.__file, io.BytesIO):
             self.__file.seek(0)  # Reset the BytesIO object to the beginning
+        format = VideoContainer(format)
+        codec = VideoCodec(codec)
         with av.open(self.__file, mode='r') as container:
             container_format = container.format.name
-            video_encoding = container.streams.video[0].codec.name if len(container.streams.video) > 0 else None
+            video_encoding = stream_codec_name(container.streams.video[0]) if len(container.streams.video) > 0 else None
             reuse_streams = True
-            if format != VideoContainer.AUTO and format not in container_format.split(","):
-                reuse_streams = False
-            if codec != VideoCodec.AUTO and codec != video_encoding and video_encoding is not None:
+            to_format = format
+            if format != VideoContainer.AUTO:
+                # The demuxer name doesn't tell the containers apart (matroska,webm), so the
+                # streams are copied whenever the target container can hold them.
+                reuse_streams = can_remux(container.streams, format)
+                to_format = VIDEO_CONTAINERS[format][0]
+            if codec != VideoCodec.AUTO and VIDEO_CODEC_NAMES[codec] != video_encoding and video_encoding is not None:
                 reuse_streams = False
 
             if not reuse_streams:
@@ -210,7 +452,7 @@ class VideoFromFile(VideoInput):
 
             streams = container.streams
 
-            open_kwargs = get_open_write_kwargs(path, container_format, format)
+            open_kwargs = get_open_write_kwargs(path, container_format, to_format)
             with av.open(path, **open_kwargs) as output_container:
                 # Copy over the original metadata
                 for key, value in container.metadata.items():
@@ -255,16 +497,26 @@ class VideoFromComponents(VideoInput):
 
     def save_to(
         self,
-        path: str,
+        path: str | io.BytesIO,
         format: VideoContainer = VideoContainer.AUTO,
         codec: VideoCodec = VideoCodec.AUTO,
         metadata: Optional[dict] = None
     ):
-        if format != VideoContainer.AUTO and format != VideoContainer.MP4:
-            raise ValueError("Only MP4 format is supported for now")
-        if codec != VideoCodec.AUTO and codec != VideoCodec.H264:
-            raise ValueError("Only H264 codec is supported for now")
-        with av.open(path, mode='w', options={'movflags': 'use_metadata_tags'}) as output:
+        format = VideoContainer(format)
+        codec = VideoCodec(codec)
+        if format == VideoContainer.AUTO:
+            format = VideoContainer.MP4
+        muxer, container_codecs, audio_codec = VIDEO_CONTAINERS[format]
+        if codec == VideoCodec.AUTO:
+            codec = container_codecs[0]
+        if codec not in container_codecs:
+            raise ValueError(f"The {codec.value} codec can't be saved as {format.value}")
+        encoder, pix_fmt, encoder_options = VIDEO_ENCODERS[codec]
+
+        open_kwargs = {"format": muxer}
+        if muxer == "mp4":
+            open_kwargs["options"] = {'movflags': 'use_metadata_tags'}
+        with av.open(path, mode='w', **open_kwargs) as output:
             # Add metadata before writing any streams
             if metadata is not None:
                 for key, value in metadata.items():
@@ -272,23 +524,24 @@ class VideoFromComponents(VideoInput):
 
             frame_rate = Fraction(round(self.__components.frame_rate * 1000), 1000)
             # Create a video stream
-            video_stream = output.add_stream('h264', rate=frame_rate)
+            video_stream = output.add_stream(encoder, rate=frame_rate)
             video_stream.width = self.__components.images.shape[2]
             video_stream.height = self.__components.images.shape[1]
-            video_stream.pix_fmt = 'yuv420p'
+            video_stream.pix_fmt = pix_fmt
+            video_stream.options = dict(encoder_options)
+            # Let the encoder pick its number of threads
+            video_stream.codec_context.thread_count = 0
 
             # Create an audio stream
             audio_sample_rate = 1
             audio_stream: Optional[av.AudioStream] = None
             if self.__components.audio:
                 audio_sample_rate = int(self.__components.audio['sample_rate'])
-                audio_stream = output.add_stream('aac', rate=audio_sample_rate)
+                # Opus only runs at 48kHz, the encoder resamples
+                audio_stream = output.add_stream(audio_codec, rate=audio_sample_rate if audio_codec == "aac" else 48000)
 
             # Encode video
-            for i, frame in enumerate(self.__components.images):
-                img = (frame * 255).clamp(0, 255).byte().cpu().numpy() # shape: (H, W, 3)
-                frame = av.VideoFrame.from_ndarray(img, format='rgb24')
-                frame = frame.reformat(format='yuv420p')  # Convert to YUV420P as required by h264
+            for frame in iter_video_frames(self.__components.images, pix_fmt):
                 packet = video_stream.encode(frame)
                 output.mux(packet)
 
@@ -8,6 +8,9 @@ from comfy_api.latest._input import ImageInput, AudioInput
 class VideoCodec(str, Enum):
     AUTO = "auto"
     H264 = "h264"
+    H265 = "h265"
+    VP9 = "vp9"
+    AV1 = "av1"
 
     @classmethod
     def as_input(cls) -> list[str]:
@@ -19,6 +22,8 @@ class VideoCodec(str, Enum):
 class VideoContainer(str, Enum):
     AUTO = "auto"
     MP4 = "mp4"
+    WEBM = "webm"
+    MKV = "mkv"
 
     @classmethod
     def as_input(cls) -> list[str]:
@@ -36,6 +41,10 @@ class VideoContainer(str, Enum):
             value = cls(value)
         if value == VideoContainer.MP4 or value == VideoContainer.AUTO:
             return "mp4"
+        if value == VideoContainer.WEBM:
+            return "webm"
+        if value == VideoContainer.MKV:
+            return "mkv"
         return ""
 
 @dataclass
@@ -109,6 +109,7 @@ from server import PromptServer
 from comfy.cli_args import args
 from comfy import utils
 from . import request_logger
+from comfy_api_nodes.util._helpers import get_http_session
 
 T = TypeVar("T", bound=BaseModel)
 R = TypeVar("R", bound=BaseModel)
@@ -292,22 +293,22 @@ class ApiClient:
             "is_api_issue": False,
         }
         timeout = aiohttp.ClientTimeout(total=5.0)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            try:
-                async with session.get("https://www.google.com", ssl=self.verify_ssl) as resp:
-                    results["internet_accessible"] = resp.status < 500
-            except (ClientError, asyncio.TimeoutError, socket.gaierror):
-                results["is_local_issue"] = True
-                return results  # cannot reach the internet – early exit
-
-            # Now check API health endpoint
-            parsed = urlparse(target_url)
-            health_url = f"{parsed.scheme}://{parsed.netloc}/health"
-            try:
-                async with session.get(health_url, ssl=self.verify_ssl) as resp:
-                    results["api_accessible"] = resp.status < 500
-            except ClientError:
-                pass  # leave as False
+        session = await get_http_session()
+        try:
+            async with session.get("https://www.google.com", ssl=self.verify_ssl, timeout=timeout) as resp:
+                results["internet_accessible"] = resp.status < 500
+        except (ClientError, asyncio.TimeoutError, socket.gaierror):
+            results["is_local_issue"] = True
+            return results  # cannot reach the internet – early exit
+
+        # Now check API health endpoint
+        parsed = urlparse(target_url)
+        health_url = f"{parsed.scheme}://{parsed.netloc}/health"
+        try:
+            async with session.get(health_url, ssl=self.verify_ssl, timeout=timeout) as resp:
+                results["api_accessible"] = resp.status < 500
+        except ClientError:
+            pass  # leave as False
 
         results["is_api_issue"] = results["internet_accessible"] and not results["api_accessible"]
         return results
@@ -388,6 +389,7 @@ class ApiClient:
                 url,
                 params=params,
                 ssl=self.verify_ssl,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
                 **payload_args,
             ) as resp:
                 if resp.status >= 400:
@@ -518,20 +520,20 @@ class ApiClient:
         for attempt in range(max_retries + 1):
             try:
                 timeout = aiohttp.ClientTimeout(total=None)  # honour server side timeouts
-                async with aiohttp.ClientSession(timeout=timeout) as session:
-                    async with session.put(
-                        upload_url, data=data, headers=headers, skip_auto_headers=skip_auto_headers,
-                    ) as resp:
-                        resp.raise_for_status()
-                        request_logger.log_request_response(
-                            operation_id=operation_id,
-                            request_method="PUT",
-                            request_url=upload_url,
-                            response_status_code=resp.status,
-                            response_headers=dict(resp.headers),
-                            response_content="File uploaded successfully.",
-                        )
-                        return resp
+                session = await get_http_session()
+                async with session.put(
+                    upload_url, data=data, headers=headers, skip_auto_headers=skip_auto_headers, timeout=timeout,
+                ) as resp:
+                    resp.raise_for_status()
+                    request_logger.log_request_response(
+                        operation_id=operation_id,
+                        request_method="PUT",
+                        request_url=upload_url,
+                        response_status_code=resp.status,
+                        response_headers=dict(resp.headers),
+                        response_content="File uploaded successfully.",
+                    )
+                    return resp
             except (ClientError, asyncio.TimeoutError) as e:
                 request_logger.log_request_response(
                     operation_id=operation_id,
@@ -633,9 +635,9 @@ class ApiClient:
 
     async def _get_session(self) -> aiohttp.ClientSession:
         if self._session is None or self._session.closed:
-            timeout = aiohttp.ClientTimeout(total=self.timeout)
-            self._session = aiohttp.ClientSession(timeout=timeout)
-            self._owns_session = True
+            # Shared keep-alive session of the event loop, not closed by this client
+            self._session = await get_http_session()
+            self._owns_session = False
         return self._session
 
     async def close(self) -> None:
@@ -2,9 +2,12 @@ import asyncio
 import contextlib
 import os
 import time
+import weakref
 from io import BytesIO
 from typing import Callable, Optional, Union
 
+import aiohttp
+
 from comfy.cli_args import args
 from comfy.model_management import processing_interrupted
 from comfy_api.latest import IO
@@ -33,6 +36,39 @@ def default_base_url() -> str:
     return getattr(args, "comfy_api_base", "https://api.comfy.org")
 
 
+_http_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+_http_session_guards: set[asyncio.Task] = set()
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """
+    Returns the keep-alive HTTP session shared by all API node requests on the running
+    event loop, so repeated calls and polls reuse their connections. The session has no
+    timeout of its own, pass one per request. It is closed when the loop shuts down.
+    """
+    loop = asyncio.get_running_loop()
+    session = _http_sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit_per_host=getattr(args, "api_nodes_connections_per_host", 8),
+            keepalive_timeout=getattr(args, "api_nodes_keepalive", 30.0),
+        )
+        session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None))
+        _http_sessions[loop] = session
+
+        async def _close_on_shutdown():
+            # Loops are shut down by cancelling their remaining tasks
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await session.close()
+
+        guard = loop.create_task(_close_on_shutdown())
+        _http_session_guards.add(guard)
+        guard.add_done_callback(_http_session_guards.discard)
+    return session
+
+
 async def sleep_with_interrupt(
     seconds: float,
     node_cls: Optional[type[IO.ComfyNode]],
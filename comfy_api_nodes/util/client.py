@@ -22,6 +22,7 @@ from server import PromptServer
 from ._helpers import (
     default_base_url,
     get_auth_header,
+    get_http_session,
     get_node_id,
     is_processing_interrupted,
     sleep_with_interrupt,
@@ -457,18 +458,18 @@ async def _diagnose_connectivity() -> dict[str, bool]:
         "api_accessible": False,
     }
     timeout = aiohttp.ClientTimeout(total=5.0)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        with contextlib.suppress(ClientError, OSError):
-            async with session.get("https://www.google.com") as resp:
-                results["internet_accessible"] = resp.status < 500
-        if not results["internet_accessible"]:
-            return results
-
-        parsed = urlparse(default_base_url())
-        health_url = f"{parsed.scheme}://{parsed.netloc}/health"
-        with contextlib.suppress(ClientError, OSError):
-            async with session.get(health_url) as resp:
-                results["api_accessible"] = resp.status < 500
+    session = await get_http_session()
+    with contextlib.suppress(ClientError, OSError, asyncio.TimeoutError):
+        async with session.get("https://www.google.com", timeout=timeout) as resp:
+            results["internet_accessible"] = resp.status < 500
+    if not results["internet_accessible"]:
+        return results
+
+    parsed = urlparse(default_base_url())
+    health_url = f"{parsed.scheme}://{parsed.netloc}/health"
+    with contextlib.suppress(ClientError, OSError, asyncio.TimeoutError):
+        async with session.get(health_url, timeout=timeout) as resp:
+            results["api_accessible"] = resp.status < 500
     return results
 
 
@@ -584,7 +585,6 @@ async def _request_base(cfg: _RequestConfig, expect_binary: bool):
         attempt += 1
         stop_event = asyncio.Event()
         monitor_task: Optional[asyncio.Task] = None
-        sess: Optional[aiohttp.ClientSession] = None
 
         operation_id = _generate_operation_id(method, cfg.endpoint.path, attempt)
         logging.debug("[DEBUG] HTTP %s %s (attempt %d)", method, url, attempt)
@@ -604,7 +604,7 @@ async def _request_base(cfg: _RequestConfig, expect_binary: bool):
                 monitor_task = asyncio.create_task(_monitor(stop_event, start_time))
 
             timeout = aiohttp.ClientTimeout(total=cfg.timeout)
-            sess = aiohttp.ClientSession(timeout=timeout)
+            sess = await get_http_session()
 
             if cfg.content_type == "multipart/form-data" and method != "GET":
                 # aiohttp will set Content-Type boundary; remove any fixed Content-Type
@@ -656,7 +656,7 @@ async def _request_base(cfg: _RequestConfig, expect_binary: bool):
             except Exception as _log_e:
                 logging.debug("[DEBUG] request logging failed: %s", _log_e)
 
-            req_coro = sess.request(method, url, params=params, **payload_kw)
+            req_coro = sess.request(method, url, params=params, timeout=timeout, **payload_kw)
             req_task = asyncio.create_task(req_coro)
 
             # Race: request vs. monitor (interruption)
@@ -858,9 +858,6 @@ async def _request_base(cfg: _RequestConfig, expect_binary: bool):
                 monitor_task.cancel()
                 with contextlib.suppress(Exception):
                     await monitor_task
-            if sess:
-                with contextlib.suppress(Exception):
-                    await sess.close()
             if operation_succeeded and cfg.monitor_progress and cfg.final_label_on_success:
                 _display_time_progress(
                     cfg.node_cls,
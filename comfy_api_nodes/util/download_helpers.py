@@ -17,6 +17,7 @@ from comfy_api_nodes.apis import request_logger
 from ._helpers import (
     default_base_url,
     get_auth_header,
+    get_http_session,
     is_processing_interrupted,
     sleep_with_interrupt,
 )
@@ -71,7 +72,6 @@ async def download_url_to_bytesio(
 
         is_path_sink = isinstance(dest, (str, Path))
         fhandle = None
-        session: Optional[aiohttp.ClientSession] = None
         stop_evt: Optional[asyncio.Event] = None
         monitor_task: Optional[asyncio.Task] = None
         req_task: Optional[asyncio.Task] = None
@@ -80,7 +80,7 @@ async def download_url_to_bytesio(
             with contextlib.suppress(Exception):
                 request_logger.log_request_response(operation_id=op_id, request_method="GET", request_url=url)
 
-            session = aiohttp.ClientSession(timeout=timeout_cfg)
+            session = await get_http_session()
             stop_evt = asyncio.Event()
 
             async def _monitor():
@@ -94,7 +94,7 @@ async def download_url_to_bytesio(
 
             monitor_task = asyncio.create_task(_monitor())
 
-            req_task = asyncio.create_task(session.get(url, headers=headers))
+            req_task = asyncio.create_task(session.get(url, headers=headers, timeout=timeout_cfg))
             done, pending = await asyncio.wait({req_task, monitor_task}, return_when=asyncio.FIRST_COMPLETED)
 
             if monitor_task in done and req_task in pending:
@@ -207,9 +207,6 @@ async def download_url_to_bytesio(
                 req_task.cancel()
                 with contextlib.suppress(Exception):
                     await req_task
-            if session:
-                with contextlib.suppress(Exception):
-                    await session.close()
             if fhandle:
                 with contextlib.suppress(Exception):
                     fhandle.flush()
@@ -15,7 +15,7 @@ from comfy_api.latest import IO, Input
 from comfy_api.util import VideoCodec, VideoContainer
 from comfy_api_nodes.apis import request_logger
 
-from ._helpers import is_processing_interrupted, sleep_with_interrupt
+from ._helpers import get_http_session, is_processing_interrupted, sleep_with_interrupt
 from .client import (
     ApiEndpoint,
     _diagnose_connectivity,
@@ -218,7 +218,6 @@ async def upload_file(
                 return
 
         monitor_task = asyncio.create_task(_monitor())
-        sess: Optional[aiohttp.ClientSession] = None
         try:
             try:
                 request_logger.log_request_response(
@@ -232,8 +231,8 @@ async def upload_file(
             except Exception as e:
                 logging.debug("[DEBUG] upload request logging failed: %s", e)
 
-            sess = aiohttp.ClientSession(timeout=timeout)
-            req = sess.put(upload_url, data=data, headers=headers, skip_auto_headers=skip_auto_headers)
+            sess = await get_http_session()
+            req = sess.put(upload_url, data=data, headers=headers, skip_auto_headers=skip_auto_headers, timeout=timeout)
             req_task = asyncio.create_task(req)
 
             done, pending = await asyncio.wait({req_task, monitor_task}, return_when=asyncio.FIRST_COMPLETED)
@@ -324,9 +323,6 @@ async def upload_file(
                 monitor_task.cancel()
                 with contextlib.suppress(Exception):
                     await monitor_task
-            if sess:
-                with contextlib.suppress(Exception):
-                    await sess.close()
 
 
 def _generate_operation_id(method: str, url: str, attempt: int, op_uuid: str) -> str:
@@ -1,13 +1,24 @@
 import bisect
 import gc
+import hashlib
 import itertools
+import json
+import logging
+import math
+import os
 import psutil
+import threading
 import time
 import torch
+import safetensors
+import safetensors.torch
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Sequence, Mapping, Dict
 from comfy_execution.graph import DynamicPrompt
 from abc import ABC, abstractmethod
 
+import comfy.model_management
 import nodes
 
 from comfy_execution.graph_utils import is_link
@@ -154,6 +165,9 @@ class BasicCache:
         self.cache_key_set: CacheKeySet
         self.cache = {}
         self.subcaches = {}
+        self.shared_cache: SharedOutputCache | None = None
+        self.disk_cache: DiskCache | None = None
+        self.batch_results: BatchResultCache | None = None
 
     async def set_prompt(self, dynprompt, node_ids, is_changed_cache):
         self.dynprompt = dynprompt
@@ -200,6 +214,9 @@ class BasicCache:
         assert self.initialized
         cache_key = self.cache_key_set.get_data_key(node_id)
         self.cache[cache_key] = value
+        for tier in (self.shared_cache, self.disk_cache):
+            if tier is not None:
+                tier.put(cache_key, self.dynprompt.get_node(node_id)["class_type"], value)
 
     def _get_immediate(self, node_id):
         if not self.initialized:
@@ -207,14 +224,22 @@ class BasicCache:
         cache_key = self.cache_key_set.get_data_key(node_id)
         if cache_key in self.cache:
             return self.cache[cache_key]
-        else:
-            return None
+        for tier in (self.batch_results, self.shared_cache, self.disk_cache):
+            if tier is not None:
+                value = tier.get(cache_key)
+                if value is not None:
+                    self.cache[cache_key] = value
+                    return value
+        return None
 
     async def _ensure_subcache(self, node_id, children_ids):
         subcache_key = self.cache_key_set.get_subcache_key(node_id)
         subcache = self.subcaches.get(subcache_key, None)
         if subcache is None:
             subcache = BasicCache(self.key_class)
+            subcache.shared_cache = self.shared_cache
+            subcache.disk_cache = self.disk_cache
+            subcache.batch_results = self.batch_results
             self.subcaches[subcache_key] = subcache
         await subcache.set_prompt(self.dynprompt, children_ids, self.is_changed_cache)
         return subcache
@@ -349,6 +374,86 @@ class LRUCache(BasicCache):
         return self
 
 
+def estimate_output_size(outputs) -> int:
+    """Bytes held by the tensors (and models reporting get_ram_usage) in a node's outputs."""
+    if isinstance(outputs, torch.Tensor):
+        return outputs.numel() * outputs.element_size()
+    if isinstance(outputs, (list, tuple)):
+        return sum(estimate_output_size(x) for x in outputs)
+    if isinstance(outputs, dict):
+        return sum(estimate_output_size(x) for x in outputs.values())
+    if hasattr(outputs, "get_ram_usage"):
+        return outputs.get_ram_usage()
+    return 0
+
+#Recompute time assumed for nodes that finish (nearly) instantly, so that tiny entries of
+#trivial nodes don't get an infinite keep score.
+SIZE_LRU_MIN_COST = 0.01
+
+#Bias towards evicting results of older workflows, per generation of not being used.
+SIZE_LRU_AGE_MULTIPLIER = 1.5
+
+class SizeLRUCache(LRUCache):
+    """
+    LRU cache bounded by the estimated size of the cached outputs instead of their count.
+    When over budget, results not used by the current prompt are evicted by
+    size * age / recompute time, so large stale results that were cheap to produce go
+    first and small results of slow nodes are kept. The recompute time is measured
+    between the cache miss of a node and the result being set.
+    """
+    def __init__(self, key_class, max_bytes):
+        super().__init__(key_class, max_size=0)
+        self.max_bytes = max_bytes
+        self.sizes = {}
+        self.costs = {}
+        self.miss_times = {}
+
+    def get(self, node_id):
+        value = super().get(node_id)
+        if value is None:
+            self.miss_times[self.cache_key_set.get_data_key(node_id)] = time.perf_counter()
+        return value
+
+    def set(self, node_id, value):
+        cache_key = self.cache_key_set.get_data_key(node_id)
+        start = self.miss_times.pop(cache_key, None)
+        if start is not None:
+            self.costs[cache_key] = time.perf_counter() - start
+        self.sizes[cache_key] = estimate_output_size(value[1])
+        return super().set(node_id, value)
+
+    def _entry_size(self, key):
+        if key not in self.sizes:
+            # inserted by the shared or disk tier
+            self.sizes[key] = estimate_output_size(self.cache[key][1])
+        return self.sizes[key]
+
+    def clean_unused(self):
+        total = sum(self._entry_size(key) for key in self.cache)
+        if total > self.max_bytes:
+            candidates = []
+            for key in self.cache:
+                age = self.generation - self.used_generation.get(key, 0)
+                if age <= 0:
+                    continue
+                cost = max(self.costs.get(key, SIZE_LRU_MIN_COST), SIZE_LRU_MIN_COST)
+                size = self._entry_size(key)
+                # size * multiplier ** age / cost in log space, the power overflows for old entries
+                score = math.log(size) + age * math.log(SIZE_LRU_AGE_MULTIPLIER) - math.log(cost) if size > 0 else -math.inf
+                candidates.append((score, key))
+            candidates.sort(key=lambda x: x[0], reverse=True)
+            for _, key in candidates:
+                if total <= self.max_bytes:
+                    break
+                total -= self.sizes.pop(key)
+                del self.cache[key]
+                self.used_generation.pop(key, None)
+                self.costs.pop(key, None)
+                self.children.pop(key, None)
+        self.miss_times.clear()
+        self._clean_subcaches()
+
+
 #Iterating the cache for usage analysis might be expensive, so if we trigger make sure
 #to take a chunk out to give breathing space on high-node / low-ram-per-node flows.
 
@@ -421,3 +526,383 @@ class RAMPressureCache(LRUCache):
             _, _, key = clean_list.pop()
             del self.cache[key]
             gc.collect()
+
+
+# Output types that can be cached outside of a single executor (on disk or shared between
+# GPU workers). Everything in them is made of tensors and plain python values, unlike
+# MODEL, CLIP, VAE and other live objects.
+PORTABLE_OUTPUT_TYPES = {"LATENT", "IMAGE", "MASK", "CONDITIONING"}
+
+# Bump when the on-disk layout or the meaning of cache keys changes.
+DISK_CACHE_VERSION = 1
+
+
+class NotSerializable(Exception):
+    pass
+
+
+def canonical_key(obj) -> str:
+    """
+    Process independent form of a to_hashable() signature. frozensets are ordered by
+    their serialized elements since their iteration order depends on hash seeds.
+    """
+    if isinstance(obj, Unhashable):
+        raise NotSerializable()
+    if isinstance(obj, bool) or obj is None:
+        return repr(obj)
+    if isinstance(obj, int):
+        return "i{}".format(obj)
+    if isinstance(obj, float):
+        if obj != obj:
+            # NaN is used for "always changed", these results must never be reused
+            raise NotSerializable()
+        return "f{}".format(repr(obj))
+    if isinstance(obj, str):
+        return json.dumps(obj)
+    if isinstance(obj, bytes):
+        return "x" + obj.hex()
+    if isinstance(obj, frozenset):
+        return "{" + ",".join(sorted(canonical_key(x) for x in obj)) + "}"
+    if isinstance(obj, tuple):
+        return "(" + ",".join(canonical_key(x) for x in obj) + ")"
+    raise NotSerializable()
+
+
+def is_portable_result(class_type, value) -> bool:
+    ui, outputs = value
+    if ui:
+        # ui results reference files (previews, saved images) owned by whoever ran the node
+        return False
+    class_def = nodes.NODE_CLASS_MAPPINGS.get(class_type, None)
+    return_types = getattr(class_def, "RETURN_TYPES", ())
+    return len(return_types) > 0 and all(t in PORTABLE_OUTPUT_TYPES for t in return_types)
+
+
+def map_tensors(obj, fn):
+    if type(obj) is torch.Tensor:
+        return fn(obj)
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(map_tensors(x, fn) for x in obj)
+    if isinstance(obj, dict) and all(isinstance(k, str) for k in obj):
+        return {k: map_tensors(v, fn) for k, v in obj.items()}
+    raise NotSerializable()
+
+
+def pack_output(obj, tensors: dict):
+    if type(obj) is torch.Tensor:
+        name = str(len(tensors))
+        tensors[name] = obj.detach().to("cpu", copy=True).contiguous()
+        return {"t": name}
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return {"l": [pack_output(x, tensors) for x in obj], "tuple": isinstance(obj, tuple)}
+    if isinstance(obj, dict) and all(isinstance(k, str) for k in obj):
+        return {"d": {k: pack_output(v, tensors) for k, v in obj.items()}}
+    raise NotSerializable()
+
+
+def unpack_output(obj, tensors: dict):
+    if isinstance(obj, dict):
+        if "t" in obj:
+            return tensors[obj["t"]]
+        if "l" in obj:
+            out = [unpack_output(x, tensors) for x in obj["l"]]
+            return tuple(out) if obj["tuple"] else out
+        return {k: unpack_output(v, tensors) for k, v in obj["d"].items()}
+    return obj
+
+
+class DiskCache:
+    """
+    Disk tier behind the in-memory output caches. Results of nodes that only return
+    PORTABLE_OUTPUT_TYPES are written as safetensors blobs named after a digest of their
+    input signature, so they survive restarts and executor recreation. Writes happen
+    on a background thread, the directory is kept under max_bytes by evicting the
+    least recently used blobs.
+    """
+    def __init__(self, directory: str, max_bytes: int, entry_factory=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entry_factory = entry_factory
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk_cache")
+        self.files: dict[str, tuple[int, float]] = {}  # digest -> (size, last use)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+            elif name.endswith(".safetensors"):
+                stat = os.stat(path)
+                self.files[name[:-len(".safetensors")]] = (stat.st_size, stat.st_mtime)
+                self.total_bytes += stat.st_size
+        logging.info("Disk node cache at {} with {} entries ({:.2f} GB)".format(directory, len(self.files), self.total_bytes / (1024 ** 3)))
+
+    def _digest(self, cache_key):
+        if cache_key is None:
+            return None
+        try:
+            key = canonical_key(cache_key)
+        except NotSerializable:
+            return None
+        return hashlib.sha256("{}:{}".format(DISK_CACHE_VERSION, key).encode("utf-8")).hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + ".safetensors")
+
+    def get(self, cache_key):
+        digest = self._digest(cache_key)
+        if digest is None:
+            return None
+        with self.lock:
+            if digest not in self.files:
+                self.misses += 1
+                return None
+            size, _ = self.files[digest]
+            self.files[digest] = (size, time.time())
+        try:
+            path = self._path(digest)
+            with safetensors.safe_open(path, framework="pt") as f:
+                structure = json.loads(f.metadata()["structure"])
+                tensors = {k: f.get_tensor(k) for k in f.keys()}
+            os.utime(path)
+        except Exception as e:
+            logging.warning("Failed to read disk cache entry {}: {}".format(digest, e))
+            self._remove(digest)
+            return None
+        with self.lock:
+            self.hits += 1
+        outputs = unpack_output(structure, tensors)
+        if self.entry_factory is not None:
+            return self.entry_factory(ui=None, outputs=outputs)
+        return (None, outputs)
+
+    def put(self, cache_key, class_type, value):
+        if not is_portable_result(class_type, value):
+            return
+        outputs = value[1]
+        digest = self._digest(cache_key)
+        if digest is None:
+            return
+        with self.lock:
+            if digest in self.files:
+                return
+        tensors = {}
+        try:
+            structure = pack_output(outputs, tensors)
+        except NotSerializable:
+            return
+        self.writer.submit(self._write, digest, structure, tensors)
+
+    def _write(self, digest, structure, tensors):
+        path = self._path(digest)
+        tmp_path = path + ".tmp"
+        try:
+            safetensors.torch.save_file(tensors, tmp_path, metadata={"structure": json.dumps(structure)})
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning("Failed to write disk cache entry {}: {}".format(digest, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        size = os.path.getsize(path)
+        with self.lock:
+            if digest in self.files:
+                self.total_bytes -= self.files[digest][0]
+            self.files[digest] = (size, time.time())
+            self.total_bytes += size
+            to_remove = []
+            if self.total_bytes > self.max_bytes:
+                for d, (s, _) in sorted(self.files.items(), key=lambda x: x[1][1]):
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    to_remove.append(d)
+                    self.total_bytes -= s
+                for d in to_remove:
+                    del self.files[d]
+        for d in to_remove:
+            try:
+                os.remove(self._path(d))
+            except FileNotFoundError:
+                pass
+
+    def _remove(self, digest):
+        with self.lock:
+            if digest in self.files:
+                self.total_bytes -= self.files.pop(digest)[0]
+        try:
+            os.remove(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+    def flush(self):
+        self.writer.submit(lambda: None).result()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.files),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_disk_caches: dict[str, DiskCache] = {}
+_disk_caches_lock = threading.Lock()
+
+def get_disk_cache(directory: str, max_bytes: int, entry_factory=None) -> DiskCache:
+    """Disk caches are shared by every executor in the process, one per directory."""
+    with _disk_caches_lock:
+        directory = os.path.abspath(directory)
+        if directory not in _disk_caches:
+            _disk_caches[directory] = DiskCache(directory, max_bytes, entry_factory=entry_factory)
+        return _disk_caches[directory]
+
+
+class SharedOutputCache:
+    """
+    Process wide output cache shared by the executors of all GPU workers. Holds CPU
+    copies of portable results, so a text encode or VAE encode done on one GPU is
+    reused by the others. Entries are handed out on the intermediate device of the
+    calling worker and evicted least recently used first past max_bytes.
+    """
+    def __init__(self, max_bytes: int, entry_factory=None):
+        self.max_bytes = max_bytes
+        self.entry_factory = entry_factory
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, tuple] = OrderedDict()
+        self.entry_bytes: dict[str, int] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, cache_key):
+        if cache_key is None:
+            return None
+        try:
+            return canonical_key(cache_key)
+        except NotSerializable:
+            return None
+
+    def get(self, cache_key):
+        key = self._key(cache_key)
+        if key is None:
+            return None
+        with self.lock:
+            outputs = self.entries.get(key, None)
+            if outputs is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        device = comfy.model_management.intermediate_device()
+        outputs = map_tensors(outputs, lambda t: t.to(device))
+        if self.entry_factory is not None:
+            return self.entry_factory(ui=None, outputs=outputs)
+        return (None, outputs)
+
+    def put(self, cache_key, class_type, value):
+        if not is_portable_result(class_type, value):
+            return
+        key = self._key(cache_key)
+        if key is None:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+        size = [0]
+        def to_cpu(t):
+            t = t.detach().to("cpu")
+            size[0] += t.nbytes
+            return t
+        try:
+            outputs = map_tensors(value[1], to_cpu)
+        except NotSerializable:
+            return
+        if size[0] > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = outputs
+            self.entry_bytes[key] = size[0]
+            self.total_bytes += size[0]
+            while self.total_bytes > self.max_bytes:
+                old_key, _ = self.entries.popitem(last=False)
+                self.total_bytes -= self.entry_bytes.pop(old_key)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_shared_output_cache: SharedOutputCache | None = None
+_shared_output_cache_lock = threading.Lock()
+
+def get_shared_output_cache(max_bytes: int, entry_factory=None) -> SharedOutputCache:
+    global _shared_output_cache
+    with _shared_output_cache_lock:
+        if _shared_output_cache is None:
+            _shared_output_cache = SharedOutputCache(max_bytes, entry_factory=entry_factory)
+        return _shared_output_cache
+
+
+class BatchResultCache(SharedOutputCache):
+    """
+    Results computed ahead of time for queued prompts by the prompt batcher. An entry
+    is handed out once, to the prompt it was computed for, and dropped afterwards.
+    """
+    def __init__(self, max_bytes: int, entry_factory=None):
+        super().__init__(max_bytes, entry_factory=entry_factory)
+        self.claimed: OrderedDict[str, None] = OrderedDict()
+
+    def get(self, cache_key):
+        value = super().get(cache_key)
+        if value is not None:
+            key = self._key(cache_key)
+            with self.lock:
+                if key in self.entries:
+                    del self.entries[key]
+                    self.total_bytes -= self.entry_bytes.pop(key)
+        return value
+
+    def claim(self, prompt_id: str) -> bool:
+        """Marks a queued prompt as batched, returns False if another executor already did."""
+        with self.lock:
+            if prompt_id in self.claimed:
+                return False
+            self.claimed[prompt_id] = None
+            if len(self.claimed) > 4096:
+                self.claimed.popitem(last=False)
+            return True
+
+    def release(self, prompt_ids: list[str]):
+        """Undoes claim() for prompts whose batch failed, they run on their own."""
+        with self.lock:
+            for prompt_id in prompt_ids:
+                self.claimed.pop(prompt_id, None)
+
+
+_batch_result_cache: BatchResultCache | None = None
+
+def get_batch_result_cache(max_bytes: int, entry_factory=None) -> BatchResultCache:
+    global _batch_result_cache
+    with _shared_output_cache_lock:
+        if _batch_result_cache is None:
+            _batch_result_cache = BatchResultCache(max_bytes, entry_factory=entry_factory)
+        return _batch_result_cache
@@ -0,0 +1,91 @@
+import asyncio
+import contextvars
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+RESOURCE_CLASSES = ("gpu", "cpu", "network")
+DEFAULT_LIMITS = {"gpu": 1, "cpu": 4, "network": 16}
+
+
+def parse_limits(spec: str) -> dict[str, int]:
+    """Parses "cpu=8,network=32" into per resource class limits, using the defaults for the rest."""
+    limits = dict(DEFAULT_LIMITS)
+    for part in spec.split(","):
+        part = part.strip()
+        if len(part) == 0:
+            continue
+        name, _, value = part.partition("=")
+        name = name.strip().lower()
+        if name not in RESOURCE_CLASSES:
+            raise ValueError(f"Unknown resource class '{name}', expected one of {', '.join(RESOURCE_CLASSES)}")
+        limits[name] = max(1, int(value))
+    return limits
+
+
+class NodeConcurrency:
+    """
+    Lets independent nodes of a prompt run at the same time. Nodes opt in:
+
+    - async nodes always run as tasks, they are limited per RESOURCE_CLASS ("network"
+      unless the node says otherwise)
+    - sync nodes with THREAD_SAFE = True run on a thread pool, limited per
+      RESOURCE_CLASS ("cpu" unless the node says otherwise)
+
+    Both report as pending to the executor, which keeps running other ready nodes and
+    picks up the result once it's done, so dependency order and caching are unchanged.
+
+    Every executor owns its NodeConcurrency, thread pool included, so the limits hold
+    per executor: with one executor per GPU worker, each worker runs up to the limits
+    for its own prompt, and its threads aren't shared with the other workers.
+    """
+    def __init__(self, limits: dict[str, int]):
+        self.limits = limits
+        self.pool = ThreadPoolExecutor(max_workers=limits["cpu"] + limits["gpu"], thread_name_prefix="node_exec")
+        self.semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]] = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def runs_in_thread(obj) -> bool:
+        return getattr(obj, "THREAD_SAFE", False) is True
+
+    @staticmethod
+    def resource_class(obj, is_async: bool) -> str:
+        resource_class = getattr(obj, "RESOURCE_CLASS", None)
+        if resource_class in RESOURCE_CLASSES:
+            return resource_class
+        return "network" if is_async else "cpu"
+
+    def limit(self, resource_class: str) -> asyncio.Semaphore:
+        # Every prompt runs on its own event loop, semaphores can't be shared between them
+        loop = asyncio.get_running_loop()
+        semaphores = self.semaphores.get(loop, None)
+        if semaphores is None:
+            semaphores = {name: asyncio.Semaphore(limit) for name, limit in self.limits.items()}
+            self.semaphores[loop] = semaphores
+        return semaphores[resource_class]
+
+    async def run_in_thread(self, resource_class: str, f: Callable):
+        import torch
+        # Device selection and inference mode are per thread
+        device = torch.cuda.current_device() if torch.cuda.is_available() else None
+        context = contextvars.copy_context()
+
+        def run():
+            if device is not None:
+                torch.cuda.set_device(device)
+            with torch.inference_mode():
+                return context.run(f)
+
+        async with self.limit(resource_class):
+            return await asyncio.get_running_loop().run_in_executor(self.pool, run)
+
+
+def create_node_concurrency() -> Optional[NodeConcurrency]:
+    """The concurrency settings of a new executor, or None when nodes run one after another."""
+    from comfy.cli_args import args
+    if args.node_concurrency is None:
+        return None
+    concurrency = NodeConcurrency(parse_limits(args.node_concurrency))
+    logging.info(f"Running thread safe and async nodes concurrently, limits per executor: {concurrency.limits}")
+    return concurrency
@@ -0,0 +1,172 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+import folder_paths
+
+# Inputs of the loader nodes that name a weight file, and the model folder they
+# resolve against. Custom loaders that reuse these input names are picked up too.
+MODEL_INPUT_FOLDERS = {
+    "ckpt_name": "checkpoints",
+    "unet_name": "diffusion_models",
+    "lora_name": "loras",
+    "vae_name": "vae",
+    "clip_name": "text_encoders",
+    "clip_name1": "text_encoders",
+    "clip_name2": "text_encoders",
+    "clip_name3": "text_encoders",
+    "clip_name4": "text_encoders",
+}
+
+# Rough relative cost of swapping each kind of weights in, used to rank GPUs when
+# each of them only holds part of what a prompt needs.
+MODEL_FOLDER_WEIGHTS = {
+    "checkpoints": 4,
+    "diffusion_models": 4,
+    "text_encoders": 2,
+    "vae": 1,
+    "loras": 1,
+}
+
+# Nodes without GPU work of their own that may be part of a remote-only prompt: they
+# load the inputs of API nodes and save or preview what the API nodes return.
+REMOTE_PROMPT_LOCAL_NODES = {
+    "LoadImage", "LoadImageMask", "LoadVideo", "LoadAudio",
+    "SaveImage", "PreviewImage", "SaveVideo", "SaveAnimatedWEBP", "SaveAnimatedPNG",
+    "SaveAudio", "PreviewAudio", "SaveGLB",
+    "PrimitiveString", "PrimitiveStringMultiline", "PrimitiveInt", "PrimitiveFloat", "PrimitiveBoolean",
+}
+
+
+def is_remote_prompt(prompt: dict, node_classes: Optional[dict] = None) -> bool:
+    """
+    Whether a prompt only waits on remote services: it holds at least one API node and
+    every other node is in REMOTE_PROMPT_LOCAL_NODES. Such prompts don't need a GPU.
+    """
+    if node_classes is None:
+        import nodes
+        node_classes = nodes.NODE_CLASS_MAPPINGS
+    has_api_node = False
+    for node in prompt.values():
+        class_type = node.get("class_type", None) if isinstance(node, dict) else None
+        if class_type in REMOTE_PROMPT_LOCAL_NODES:
+            continue
+        class_def = node_classes.get(class_type, None)
+        if class_def is None or getattr(class_def, "API_NODE", False) is not True:
+            return False
+        has_api_node = True
+    return has_api_node
+
+
+def prompt_model_files(prompt: dict) -> dict[str, int]:
+    """
+    Returns the full paths of the weight files referenced by a prompt, mapped to
+    their swap cost weight. Names that don't resolve to a file are ignored, they
+    will fail validation or be loaded some other way.
+    """
+    files = {}
+    for node in prompt.values():
+        inputs = node.get("inputs", {}) if isinstance(node, dict) else {}
+        for input_name, folder_name in MODEL_INPUT_FOLDERS.items():
+            value = inputs.get(input_name, None)
+            if not isinstance(value, str):
+                continue
+            full_path = folder_paths.get_full_path(folder_name, value)
+            if full_path is not None:
+                files[full_path] = max(files.get(full_path, 0), MODEL_FOLDER_WEIGHTS[folder_name])
+    return files
+
+
+def resident_files_by_gpu() -> dict[int, set[str]]:
+    import comfy.model_management
+    out = {}
+    for device, files in comfy.model_management.loaded_source_files().items():
+        if getattr(device, "index", None) is not None:
+            out.setdefault(device.index, set()).update(files)
+    return out
+
+
+def steal_prompt(thief_id: int, queues: list, resident_files: Callable[[], dict[int, set[str]]] = resident_files_by_gpu) -> Optional[tuple]:
+    """
+    Work stealing for an idle GPU worker: moves one unpinned pending prompt from the
+    longest sibling queue into queues[thief_id]. Prompts whose weights are already
+    resident on the thief are preferred. Returns the moved queue item, or None.
+    """
+    victims = sorted((i for i in range(len(queues)) if i != thief_id), key=lambda i: queues[i].get_tasks_stealable(), reverse=True)
+    victims = [i for i in victims if queues[i].get_tasks_stealable() > 0]
+    if len(victims) == 0:
+        return None
+
+    try:
+        thief_files = resident_files().get(thief_id, set())
+    except Exception:
+        thief_files = set()
+
+    def score(item):
+        if len(thief_files) == 0:
+            return 0
+        return sum(w for f, w in prompt_model_files(item[2]).items() if f in thief_files)
+
+    for victim_id in victims:
+        item = queues[victim_id].steal_into(queues[thief_id], score=score)
+        if item is not None:
+            logging.info(f"🔀 [GPU {thief_id}] Stole prompt {item[1][:8]} from GPU {victim_id}")
+            return item
+    return None
+
+
+class ModelAffinityScheduler:
+    """
+    Picks the GPU queue for prompts that don't pin a GPU themselves.
+
+    The GPU whose loaded models already hold the most (weighted) weight files of the
+    prompt wins, as long as its queue isn't more than max_queue_skew tasks longer than
+    the least loaded queue. Otherwise, or when nothing is resident anywhere, the least
+    loaded GPU is used.
+    """
+    def __init__(self, queues: list, resident_files: Optional[Callable[[], dict[int, set[str]]]] = None, max_queue_skew: int = 2):
+        self.queues = queues
+        self.resident_files = resident_files if resident_files is not None else resident_files_by_gpu
+        self.max_queue_skew = max_queue_skew
+        self.lock = threading.Lock()
+        self.affinity_hits = 0
+        self.fallbacks = 0
+
+    def select_gpu(self, prompt: dict) -> int:
+        wanted = prompt_model_files(prompt)
+        with self.lock:
+            loads = [q.get_tasks_remaining() for q in self.queues]
+            least_loaded = min(range(len(loads)), key=lambda i: (loads[i], i))
+            if len(wanted) == 0:
+                self.fallbacks += 1
+                return least_loaded
+
+            try:
+                resident = self.resident_files()
+            except Exception as e:
+                logging.warning(f"Model affinity lookup failed, using least loaded GPU: {e}")
+                resident = {}
+
+            best = least_loaded
+            best_score = 0
+            for gpu_id in range(len(self.queues)):
+                if loads[gpu_id] - loads[least_loaded] > self.max_queue_skew:
+                    continue
+                gpu_files = resident.get(gpu_id, set())
+                score = sum(w for f, w in wanted.items() if f in gpu_files)
+                if score > best_score or (score == best_score and score > 0 and loads[gpu_id] < loads[best]):
+                    best = gpu_id
+                    best_score = score
+
+            if best_score > 0:
+                self.affinity_hits += 1
+            else:
+                self.fallbacks += 1
+            return best
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "affinity_hits": self.affinity_hits,
+                "fallbacks": self.fallbacks,
+            }
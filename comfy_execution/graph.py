@@ -3,6 +3,7 @@ from typing import Type, Literal
 
 import nodes
 import asyncio
+import heapq
 import inspect
 from comfy_execution.graph_utils import is_link, ExecutionBlocker
 from comfy.comfy_types.node_typing import ComfyNodeABC, InputTypeDict, InputTypeOptions
@@ -105,8 +106,17 @@ class TopologicalSort:
         self.pendingNodes = {}
         self.blockCount = {} # Number of nodes this node is directly blocked by
         self.blocking = {} # Which nodes are blocked by this node
+        self.blockedBy = {} # Which pending nodes block this node
         self.externalBlocks = 0
         self.unblockedEvent = asyncio.Event()
+        # Ready nodes, ordered by (priority, order added). Entries go stale when a node
+        # gets blocked again, is executed or its priority drops, they are skipped on read.
+        self.readyHeap = []
+        self.order = {} # Sequence number of each pending node, in order added
+        self.nextOrder = 0
+        self.priority = {} # See node_priority
+        self.feedsOutput = {} # Whether a node directly blocks an output node
+        self.classFlags = {} # class_type -> (is_output, is_async)
 
     def get_input_info(self, unique_id, input_name):
         class_type = self.dynprompt.get_node(unique_id)["class_type"]
@@ -129,11 +139,14 @@ class TopologicalSort:
             if to_node_id not in self.blocking[from_node_id]:
                 self.blocking[from_node_id][to_node_id] = {}
                 self.blockCount[to_node_id] += 1
+                self.blockedBy[to_node_id].add(from_node_id)
+                self._link_priority(from_node_id, to_node_id)
             self.blocking[from_node_id][to_node_id][from_socket] = True
 
     def add_node(self, node_unique_id, include_lazy=False, subgraph_nodes=None):
         node_ids = [node_unique_id]
         links = []
+        added = []
 
         while len(node_ids) > 0:
             unique_id = node_ids.pop()
@@ -143,6 +156,13 @@ class TopologicalSort:
             self.pendingNodes[unique_id] = True
             self.blockCount[unique_id] = 0
             self.blocking[unique_id] = {}
+            self.blockedBy[unique_id] = set()
+            self.order[unique_id] = self.nextOrder
+            self.nextOrder += 1
+            is_output, is_async = self.get_class_flags(unique_id)
+            self.priority[unique_id] = 0 if is_output or is_async else 3
+            self.feedsOutput[unique_id] = False
+            added.append(unique_id)
 
             inputs = self.dynprompt.get_node(unique_id)["inputs"]
             for input_name in inputs:
@@ -160,6 +180,9 @@ class TopologicalSort:
 
         for link in links:
             self.add_strong_link(*link)
+        for unique_id in added:
+            if unique_id in self.pendingNodes and self.blockCount[unique_id] == 0:
+                self._push_ready(unique_id)
 
     def add_external_block(self, node_id):
         assert node_id in self.blockCount, "Can't add external block to a node that isn't pending"
@@ -168,12 +191,67 @@ class TopologicalSort:
         def unblock():
             self.externalBlocks -= 1
             self.blockCount[node_id] -= 1
+            if node_id in self.pendingNodes and self.blockCount[node_id] == 0:
+                self._push_ready(node_id)
             self.unblockedEvent.set()
         return unblock
 
     def is_cached(self, node_id):
         return False
 
+    def get_class_flags(self, unique_id):
+        """Returns (is_output, is_async) for the class of a node, looked up once per class."""
+        class_type = self.dynprompt.get_node(unique_id)["class_type"]
+        flags = self.classFlags.get(class_type, None)
+        if flags is None:
+            class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
+            is_output = hasattr(class_def, 'OUTPUT_NODE') and class_def.OUTPUT_NODE == True
+            is_async = inspect.iscoroutinefunction(getattr(class_def, class_def.FUNCTION))
+            flags = (is_output, is_async)
+            self.classFlags[class_type] = flags
+        return flags
+
+    # Priority of a ready node, lower runs first:
+    # 0 - output and async nodes
+    # 1 - nodes that block an output node
+    # 2 - nodes that block a node that blocks an output node
+    # 3 - everything else
+    # Links are only removed together with the node they start at, so the priority of
+    # a pending node can only go down and is updated as links are added.
+    def node_priority(self, unique_id):
+        return self.priority[unique_id]
+
+    def _lower_priority(self, unique_id, priority):
+        if priority < self.priority[unique_id]:
+            self.priority[unique_id] = priority
+            if self.blockCount[unique_id] == 0:
+                self._push_ready(unique_id)
+
+    def _link_priority(self, from_node_id, to_node_id):
+        if self.get_class_flags(to_node_id)[0] and not self.feedsOutput[from_node_id]:
+            self.feedsOutput[from_node_id] = True
+            self._lower_priority(from_node_id, 1)
+            for parent_id in self.blockedBy[from_node_id]:
+                self._lower_priority(parent_id, 2)
+        if self.feedsOutput[to_node_id]:
+            self._lower_priority(from_node_id, 2)
+
+    def _push_ready(self, unique_id):
+        heapq.heappush(self.readyHeap, (self.priority[unique_id], self.order[unique_id], unique_id))
+
+    def _is_live(self, entry):
+        priority, order, unique_id = entry
+        return (unique_id in self.pendingNodes and self.blockCount[unique_id] == 0
+                and self.order[unique_id] == order and self.priority[unique_id] == priority)
+
+    def peek_ready_node(self):
+        """Returns the ready node with the lowest (priority, order added), or None."""
+        while len(self.readyHeap) > 0 and not self._is_live(self.readyHeap[0]):
+            heapq.heappop(self.readyHeap)
+        if len(self.readyHeap) == 0:
+            return None
+        return self.readyHeap[0][2]
+
     def get_ready_nodes(self):
         return [node_id for node_id in self.pendingNodes if self.blockCount[node_id] == 0]
 
@@ -181,7 +259,14 @@ class TopologicalSort:
         del self.pendingNodes[unique_id]
         for blocked_node_id in self.blocking[unique_id]:
             self.blockCount[blocked_node_id] -= 1
+            self.blockedBy[blocked_node_id].discard(unique_id)
+            if self.blockCount[blocked_node_id] == 0:
+                self._push_ready(blocked_node_id)
         del self.blocking[unique_id]
+        del self.blockedBy[unique_id]
+        del self.order[unique_id]
+        del self.priority[unique_id]
+        del self.feedsOutput[unique_id]
 
     def is_empty(self):
         return len(self.pendingNodes) == 0
@@ -233,13 +318,13 @@ class ExecutionList(TopologicalSort):
         assert self.staged_node_id is None
         if self.is_empty():
             return None, None, None
-        available = self.get_ready_nodes()
-        while len(available) == 0 and self.externalBlocks > 0:
+        ready_node_id = self.peek_ready_node()
+        while ready_node_id is None and self.externalBlocks > 0:
             # Wait for an external block to be released
             await self.unblockedEvent.wait()
             self.unblockedEvent.clear()
-            available = self.get_ready_nodes()
-        if len(available) == 0:
+            ready_node_id = self.peek_ready_node()
+        if ready_node_id is None:
             cycled_nodes = self.get_nodes_in_cycle()
             # Because cycles composed entirely of static nodes are caught during initial validation,
             # we will 'blame' the first node in the cycle that is not a static node.
@@ -259,7 +344,8 @@ class ExecutionList(TopologicalSort):
             }
             return None, error_details, ex
 
-        self.staged_node_id = self.ux_friendly_pick_node(available)
+        # The ready queue is ordered by the same heuristics as ux_friendly_pick_node
+        self.staged_node_id = ready_node_id
         return self.staged_node_id, None, None
 
     def ux_friendly_pick_node(self, node_list):
@@ -268,18 +354,12 @@ class ExecutionList(TopologicalSort):
         # for a PreviewImage to display a result as soon as it can
         # Some other heuristics could probably be used here to improve the UX further.
         def is_output(node_id):
-            class_type = self.dynprompt.get_node(node_id)["class_type"]
-            class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
-            if hasattr(class_def, 'OUTPUT_NODE') and class_def.OUTPUT_NODE == True:
-                return True
-            return False
+            return self.get_class_flags(node_id)[0]
 
         # If an available node is async, do that first.
         # This will execute the asynchronous function earlier, reducing the overall time.
         def is_async(node_id):
-            class_type = self.dynprompt.get_node(node_id)["class_type"]
-            class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
-            return inspect.iscoroutinefunction(getattr(class_def, class_def.FUNCTION))
+            return self.get_class_flags(node_id)[1]
 
         for node_id in node_list:
             if is_output(node_id) or is_async(node_id):
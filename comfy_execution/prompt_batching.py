@@ -0,0 +1,241 @@
+import copy
+import heapq
+import json
+import logging
+from typing import Callable, Optional
+
+import torch
+
+import comfy.model_management
+import comfy.sample
+import comfy.utils
+import latent_preview
+import nodes
+from comfy_execution.caching import BatchResultCache, CacheKeySetInputSignature
+from comfy_execution.graph import DynamicPrompt
+from comfy_execution.graph_utils import ExecutionBlocker, is_link
+
+BATCHED_SAMPLER_NODES = {"KSampler"}
+
+# Samplers that only use the seed for the initial noise. A batch of prompts run with
+# one of these gives each prompt the result it would get on its own, the ancestral,
+# SDE and similar samplers draw more noise while sampling and would not.
+BATCHABLE_SAMPLERS = {
+    "euler", "euler_cfg_pp", "heun", "heunpp2", "dpm_2", "lms", "dpmpp_2m", "dpmpp_2m_cfg_pp",
+    "ipndm", "ipndm_v", "deis", "res_multistep", "res_multistep_cfg_pp", "gradient_estimation",
+    "ddim", "uni_pc", "uni_pc_bh2",
+}
+
+# Constant inputs allowed to differ between the prompts of a batch.
+VARYING_INPUTS = {
+    "KSampler": ("seed",),
+    "CLIPTextEncode": ("text",),
+}
+
+BATCH_RESULTS_MAX_BYTES = 2 * 1024 ** 3
+
+
+def batch_key(prompt: dict) -> Optional[str]:
+    """
+    Returns a key shared by the prompts that could be sampled together, or None if the
+    prompt can't be batched. Prompts with the same key only differ in the varying inputs.
+    """
+    samplers = [node for node in prompt.values() if node.get("class_type") in BATCHED_SAMPLER_NODES]
+    if len(samplers) != 1 or samplers[0].get("inputs", {}).get("sampler_name") not in BATCHABLE_SAMPLERS:
+        return None
+    stripped = {}
+    for node_id, node in prompt.items():
+        varying = VARYING_INPUTS.get(node.get("class_type"), ())
+        inputs = {k: v for k, v in node.get("inputs", {}).items() if k not in varying or is_link(v)}
+        stripped[node_id] = [node.get("class_type"), inputs]
+    try:
+        return json.dumps(stripped, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+
+def pending_prompts(server, limit: int) -> list:
+    """
+    The first queued (not running) items over all prompt queues of the server. Items
+    pinned to their GPU with X-TARGET-GPU are left out, batching them would sample
+    them on the GPU of the running prompt.
+    """
+    queues = getattr(server, "prompt_queues", None) or [server.prompt_queue]
+    items = []
+    for queue in queues:
+        with queue.mutex:
+            queued = queue.get_current_queue_volatile()[1]
+            pinned = set(queue.pinned)
+        items.extend(x for x in queued if x[1] not in pinned)
+    return heapq.nsmallest(limit, items, key=lambda x: x[0])
+
+
+def _is_plain(value) -> bool:
+    return isinstance(value, (int, float, str, bool, type(None)))
+
+
+def _same_structure(a, b) -> bool:
+    """Whether a and b can be stacked: they may only differ in tensors of batch size 1."""
+    if isinstance(a, torch.Tensor):
+        return (isinstance(b, torch.Tensor) and a.ndim > 0 and a.shape[0] == 1 and a.shape == b.shape
+                and a.dtype == b.dtype and a.device == b.device and not a.is_nested and not b.is_nested)
+    if isinstance(a, (list, tuple)):
+        return type(a) is type(b) and len(a) == len(b) and all(_same_structure(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(_same_structure(a[k], b[k]) for k in a)
+    if a is b:
+        return True
+    return _is_plain(a) and type(a) is type(b) and a == b
+
+
+def _stack(values: list):
+    first = values[0]
+    if isinstance(first, torch.Tensor):
+        return torch.cat(values)
+    if isinstance(first, (list, tuple)):
+        return type(first)(_stack(list(x)) for x in zip(*values))
+    if isinstance(first, dict):
+        return {k: _stack([v[k] for v in values]) for k in first}
+    return first
+
+
+class PromptBatcher:
+    """
+    Samples the KSampler of the running prompt together with the KSamplers of queued
+    prompts that only differ in seed or prompt text, as one batch. Each prompt keeps
+    its own initial noise. The results of the queued prompts go to a result tier of
+    the output cache, so they are plain cache hits when those prompts run, with their
+    own history entries and outputs.
+
+    Only top level KSampler nodes of prompts holding a single sampler are batched, on
+    latents of batch size 1. The inputs of the queued prompts' samplers have to be in
+    the output cache already, nothing is run for them outside of their own execution.
+    """
+    def __init__(self, pending_items: Callable[[], list], results: BatchResultCache, is_changed_cache_class, max_batch_size: int = 4):
+        self.pending_items = pending_items
+        self.results = results
+        self.is_changed_cache_class = is_changed_cache_class
+        self.max_batch_size = max_batch_size
+        self.keys: dict[str, Optional[str]] = {}
+
+    def accepts(self, class_def, dynprompt: DynamicPrompt, unique_id: str) -> bool:
+        # The batch is sampled with comfy.sample like nodes.KSampler, a custom node
+        # registered under the same name is run as is.
+        return class_def is nodes.KSampler and dynprompt.get_parent_node_id(unique_id) is None
+
+    def _batch_key(self, prompt_id: str, prompt: dict) -> Optional[str]:
+        if prompt_id not in self.keys:
+            if len(self.keys) > 4096:
+                self.keys.clear()
+            self.keys[prompt_id] = batch_key(prompt)
+        return self.keys[prompt_id]
+
+    async def sample(self, prompt_id: str, dynprompt: DynamicPrompt, unique_id: str, input_data_all: dict, outputs_cache) -> Optional[list]:
+        """
+        Returns the output data of the running prompt's sampler node, or None if it
+        should run on its own.
+        """
+        if any(len(v) != 1 for v in input_data_all.values()):
+            return None
+        inputs = {k: v[0] for k, v in input_data_all.items()}
+        if any(isinstance(v, ExecutionBlocker) for v in inputs.values()):
+            return None
+        key = self._batch_key(prompt_id, dynprompt.get_original_prompt())
+        if key is None:
+            return None
+
+        peers = []
+        for item in self.pending_items():
+            if len(peers) >= self.max_batch_size - 1:
+                break
+            peer_prompt_id, peer_prompt = item[1], item[2]
+            if peer_prompt_id == prompt_id or self._batch_key(peer_prompt_id, peer_prompt) != key:
+                continue
+            try:
+                peer = await self._resolve_peer(peer_prompt_id, peer_prompt, unique_id, inputs, outputs_cache)
+            except Exception as e:
+                logging.warning(f"Could not batch prompt {peer_prompt_id}: {e}")
+                continue
+            if peer is not None and self.results.claim(peer_prompt_id):
+                peers.append((peer_prompt_id, *peer))
+        if len(peers) == 0:
+            return None
+
+        runs = [inputs] + [peer_inputs for _, _, peer_inputs in peers]
+        logging.info(f"Sampling {len(runs)} prompts as one batch")
+        try:
+            outputs = self._sample(runs)
+        except Exception as e:
+            self.results.release([peer_prompt_id for peer_prompt_id, _, _ in peers])
+            if isinstance(e, comfy.model_management.InterruptProcessingException):
+                raise
+            logging.warning(f"Sampling a batch of prompts failed, running them one by one: {e}")
+            comfy.model_management.soft_empty_cache()
+            return None
+        for (_, cache_key, _), out in zip(peers, outputs[1:]):
+            self.results.put(cache_key, "KSampler", (None, [[out]]))
+        return [[outputs[0]]]
+
+    async def _resolve_peer(self, peer_prompt_id: str, peer_prompt: dict, node_id: str, inputs: dict, outputs_cache):
+        # Computing the cache keys stores is_changed results in the nodes, work on a copy
+        dynprompt = DynamicPrompt(copy.deepcopy(peer_prompt))
+        if not dynprompt.has_node(node_id):
+            return None
+        keys = CacheKeySetInputSignature(dynprompt, [node_id], self.is_changed_cache_class(peer_prompt_id, dynprompt, outputs_cache))
+        await keys.add_keys([node_id])
+
+        peer_inputs = {}
+        for name, value in dynprompt.get_node(node_id)["inputs"].items():
+            if is_link(value):
+                value = await self._resolve_link(dynprompt, keys, value, outputs_cache)
+                if value is None:
+                    return None
+            peer_inputs[name] = value
+
+        if peer_inputs.keys() != inputs.keys():
+            return None
+        for name, value in inputs.items():
+            peer_value = peer_inputs[name]
+            if name == "seed":
+                if not isinstance(peer_value, int):
+                    return None
+            elif name == "latent_image":
+                if value.keys() != {"samples"} or peer_value.keys() != {"samples"} or not _same_structure(value, peer_value):
+                    return None
+            elif name in ("positive", "negative"):
+                if not _same_structure(value, peer_value):
+                    return None
+            elif peer_value is not value and not (_is_plain(value) and value == peer_value):
+                return None
+        return (keys.get_data_key(node_id), peer_inputs)
+
+    def _lookup(self, outputs_cache, cache_key):
+        entry = getattr(outputs_cache, "cache", {}).get(cache_key, None)
+        for tier in (getattr(outputs_cache, "shared_cache", None), getattr(outputs_cache, "disk_cache", None)):
+            if entry is None and tier is not None:
+                entry = tier.get(cache_key)
+        return entry
+
+    async def _resolve_link(self, dynprompt: DynamicPrompt, keys: CacheKeySetInputSignature, link, outputs_cache):
+        node_id, socket = link
+        await keys.add_keys([node_id])
+        cache_key = keys.get_data_key(node_id)
+        entry = self._lookup(outputs_cache, cache_key)
+        if entry is None:
+            return None
+        values = entry.outputs[socket]
+        return values[0] if len(values) == 1 else None
+
+    def _sample(self, runs: list[dict]) -> list[dict]:
+        first = runs[0]
+        model = first["model"]
+        latents = [comfy.sample.fix_empty_latent_channels(model, r["latent_image"]["samples"]) for r in runs]
+        noise = torch.cat([comfy.sample.prepare_noise(latent, r["seed"]) for latent, r in zip(latents, runs)])
+        positive = _stack([r["positive"] for r in runs])
+        negative = _stack([r["negative"] for r in runs])
+
+        callback = latent_preview.prepare_callback(model, first["steps"])
+        disable_pbar = not comfy.utils.PROGRESS_BAR_ENABLED
+        samples = comfy.sample.sample(model, noise, first["steps"], first["cfg"], first["sampler_name"], first["scheduler"], positive, negative, torch.cat(latents),
+                                      denoise=first["denoise"], callback=callback, disable_pbar=disable_pbar, seed=first["seed"])
+        return [{"samples": s} for s in samples.split(1)]
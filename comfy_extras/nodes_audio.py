@@ -327,6 +327,7 @@ class LoadAudio:
 
     RETURN_TYPES = ("AUDIO", )
     FUNCTION = "load"
+    THREAD_SAFE = True
 
     def load(self, audio):
         audio_path = folder_paths.get_annotated_filepath(audio)
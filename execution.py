@@ -1,6 +1,9 @@
+import contextlib
 import copy
+import functools
 import heapq
 import inspect
+import itertools
 import logging
 import sys
 import threading
@@ -14,6 +17,7 @@ import torch
 
 import comfy.model_management
 import nodes
+from comfy_execution.concurrency import create_node_concurrency
 from comfy_execution.caching import (
     BasicCache,
     CacheKeySetID,
@@ -22,6 +26,10 @@ from comfy_execution.caching import (
     HierarchicalCache,
     LRUCache,
     RAMPressureCache,
+    SizeLRUCache,
+    get_batch_result_cache,
+    get_disk_cache,
+    get_shared_output_cache,
 )
 from comfy_execution.graph import (
     DynamicPrompt,
@@ -30,6 +38,7 @@ from comfy_execution.graph import (
     get_input_info,
 )
 from comfy_execution.graph_utils import GraphBuilder, is_link
+from comfy_execution.prompt_batching import BATCH_RESULTS_MAX_BYTES, PromptBatcher, pending_prompts
 from comfy_execution.validation import validate_node_input
 from comfy_execution.progress import get_progress_state, reset_progress_state, add_progress_handler, WebUIProgressHandler
 from comfy_execution.utils import CurrentNodeContext
@@ -99,6 +108,7 @@ class CacheType(Enum):
     LRU = 1
     NONE = 2
     RAM_PRESSURE = 3
+    LRU_BYTES = 4
 
 
 class CacheSet:
@@ -114,9 +124,24 @@ class CacheSet:
             cache_size = cache_args.get("lru", 0)
             self.init_lru_cache(cache_size)
             logging.info("Using LRU cache")
+        elif cache_type == CacheType.LRU_BYTES:
+            cache_size = cache_args.get("lru_gb", 0)
+            self.init_size_lru_cache(cache_size)
+            logging.info("Using size bounded LRU cache")
         else:
             self.init_classic_cache()
 
+        cache_shared = cache_args.get("shared", 0)
+        if cache_shared > 0 and cache_type != CacheType.NONE:
+            self.outputs.shared_cache = get_shared_output_cache(int(cache_shared * 1024 ** 3), entry_factory=CacheEntry)
+
+        cache_disk = cache_args.get("disk", 0)
+        if cache_disk > 0 and cache_type != CacheType.NONE:
+            self.outputs.disk_cache = get_disk_cache(cache_args.get("disk_directory"), int(cache_disk * 1024 ** 3), entry_factory=CacheEntry)
+
+        if cache_args.get("batch", 0) > 1 and cache_type != CacheType.NONE:
+            self.outputs.batch_results = get_batch_result_cache(BATCH_RESULTS_MAX_BYTES, entry_factory=CacheEntry)
+
         self.all = [self.outputs, self.objects]
 
     # Performs like the old cache -- dump data ASAP
@@ -128,6 +153,10 @@ class CacheSet:
         self.outputs = LRUCache(CacheKeySetInputSignature, max_size=cache_size)
         self.objects = HierarchicalCache(CacheKeySetID)
 
+    def init_size_lru_cache(self, cache_size_gb):
+        self.outputs = SizeLRUCache(CacheKeySetInputSignature, max_bytes=int(cache_size_gb * 1024 ** 3))
+        self.objects = HierarchicalCache(CacheKeySetID)
+
     def init_ram_cache(self, min_headroom):
         self.outputs = RAMPressureCache(CacheKeySetInputSignature)
         self.objects = HierarchicalCache(CacheKeySetID)
@@ -223,7 +252,7 @@ async def resolve_map_node_over_list_results(results):
                 raise exc
         return [x.result() if isinstance(x, asyncio.Task) else x for x in results]
 
-async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, func, allow_interrupt=False, execution_block_cb=None, pre_execute_cb=None, hidden_inputs=None):
+async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, func, allow_interrupt=False, execution_block_cb=None, pre_execute_cb=None, hidden_inputs=None, concurrency=None):
     # check if node wants the lists
     input_is_list = getattr(obj, "INPUT_IS_LIST", False)
 
@@ -236,6 +265,10 @@ async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, f
     def slice_dict(d, i):
         return {k: v[i if len(v) > i else -1] for k, v in d.items()}
 
+    # Only the node function itself may run concurrently with other nodes
+    if func != getattr(obj, "FUNCTION", None):
+        concurrency = None
+
     results = []
     async def process_inputs(inputs, index=None, input_is_list=False):
         if allow_interrupt:
@@ -272,7 +305,10 @@ async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, f
             if inspect.iscoroutinefunction(f):
                 async def async_wrapper(f, prompt_id, unique_id, list_index, args):
                     with CurrentNodeContext(prompt_id, unique_id, list_index):
-                        return await f(**args)
+                        if concurrency is None:
+                            return await f(**args)
+                        async with concurrency.limit(concurrency.resource_class(obj, True)):
+                            return await f(**args)
                 task = asyncio.create_task(async_wrapper(f, prompt_id, unique_id, index, args=inputs))
                 # Give the task a chance to execute without yielding
                 await asyncio.sleep(0)
@@ -281,6 +317,13 @@ async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, f
                     results.append(result)
                 else:
                     results.append(task)
+            elif concurrency is not None and concurrency.runs_in_thread(obj):
+                def thread_wrapper(f, prompt_id, unique_id, list_index, args):
+                    with CurrentNodeContext(prompt_id, unique_id, list_index):
+                        return f(**args)
+                # Reported as pending like an async node, other ready nodes run meanwhile
+                call = functools.partial(thread_wrapper, f, prompt_id, unique_id, index, inputs)
+                results.append(asyncio.create_task(concurrency.run_in_thread(concurrency.resource_class(obj, False), call)))
             else:
                 with CurrentNodeContext(prompt_id, unique_id, index):
                     result = f(**inputs)
@@ -320,8 +363,8 @@ def merge_result_data(results, obj):
             output.append([o[i] for o in results])
     return output
 
-async def get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=None, pre_execute_cb=None, hidden_inputs=None):
-    return_values = await _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, obj.FUNCTION, allow_interrupt=True, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, hidden_inputs=hidden_inputs)
+async def get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=None, pre_execute_cb=None, hidden_inputs=None, concurrency=None):
+    return_values = await _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, obj.FUNCTION, allow_interrupt=True, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, hidden_inputs=hidden_inputs, concurrency=concurrency)
     has_pending_task = any(isinstance(r, asyncio.Task) and not r.done() for r in return_values)
     if has_pending_task:
         return return_values, {}, False, has_pending_task
@@ -401,7 +444,7 @@ def format_value(x):
     else:
         return str(x)
 
-async def execute(server, dynprompt, caches, current_item, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, pending_async_nodes, ui_outputs):
+async def execute(server, dynprompt, caches, current_item, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, pending_async_nodes, ui_outputs, batcher=None, concurrency=None):
     unique_id = current_item
     real_node_id = dynprompt.get_real_node_id(unique_id)
     display_node_id = dynprompt.get_display_node_id(unique_id)
@@ -507,7 +550,13 @@ async def execute(server, dynprompt, caches, current_item, extra_data, executed,
             def pre_execute_cb(call_index):
                 # TODO - How to handle this with async functions without contextvars (which requires Python 3.12)?
                 GraphBuilder.set_default_prefix(unique_id, call_index, 0)
-            output_data, output_ui, has_subgraph, has_pending_tasks = await get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, hidden_inputs=hidden_inputs)
+            output_data = None
+            if batcher is not None and batcher.accepts(class_def, dynprompt, unique_id):
+                with CurrentNodeContext(prompt_id, unique_id, 0):
+                    output_data = await batcher.sample(prompt_id, dynprompt, unique_id, input_data_all, caches.outputs)
+                output_ui, has_subgraph, has_pending_tasks = [], False, False
+            if output_data is None:
+                output_data, output_ui, has_subgraph, has_pending_tasks = await get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, hidden_inputs=hidden_inputs, concurrency=concurrency)
             if has_pending_tasks:
                 pending_async_nodes[unique_id] = output_data
                 unblock = execution_list.add_external_block(unique_id)
@@ -616,6 +665,11 @@ class PromptExecutor:
         self.cache_args = cache_args
         self.cache_type = cache_type
         self.server = server
+        self.batcher = None
+        batch_size = (cache_args or {}).get("batch", 0)
+        if batch_size > 1 and cache_type != CacheType.NONE:
+            self.batcher = PromptBatcher(lambda: pending_prompts(server, 64), get_batch_result_cache(BATCH_RESULTS_MAX_BYTES, entry_factory=CacheEntry), IsChangedCache, max_batch_size=batch_size)
+        self.concurrency = create_node_concurrency()
         self.reset()
 
     def reset(self):
@@ -708,7 +762,7 @@ class PromptExecutor:
                     break
 
                 assert node_id is not None, "Node ID should not be None at this point"
-                result, error, ex = await execute(self.server, dynamic_prompt, self.caches, node_id, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, pending_async_nodes, ui_node_outputs)
+                result, error, ex = await execute(self.server, dynamic_prompt, self.caches, node_id, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, pending_async_nodes, ui_node_outputs, batcher=self.batcher, concurrency=self.concurrency)
                 self.success = result != ExecutionResult.FAILURE
                 if result == ExecutionResult.FAILURE:
                     self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
@@ -1088,20 +1142,134 @@ async def validate_prompt(prompt_id, prompt, partial_execution_list: Union[list[
 
 MAXIMUM_HISTORY_SIZE = 10000
 
+# Ids of history entries, increasing in the order prompts finish over all queues.
+# They are the cursors of PromptQueue.get_history_page.
+_history_ids = itertools.count(1)
+_last_history_id = 0
+# Held while a history id is handed out and its entry inserted. A reader of the history
+# of all queues only takes it to read the last id handed out, then reads the entries up
+# to that id without it, so it never misses an entry with a lower id than one it returned
+# and never blocks the workers on the read. Taken before the queue mutex.
+_history_lock = threading.Lock()
+
+def get_history_page(queues, since=None, before=None, max_items=None):
+    """PromptQueue.get_history_page over several queues, ordered by id."""
+    with _history_lock:
+        upto = max([_last_history_id] + [queue.store.last_history_id for queue in queues if queue.store is not None])
+    page = []
+    for queue in queues:
+        page.extend(queue.get_history_page(since=since, before=before, max_items=max_items, upto=upto))
+    page.sort(key=lambda x: x[0])
+    if max_items is not None:
+        page = page[:max_items] if since is not None else page[max(0, len(page) - max_items):]
+    return page
+
+def delete_queue_item_by_id(queues, prompt_id):
+    """
+    Deletes a pending prompt from whichever of queues holds it. All queues are locked, in
+    the order PromptQueue.steal_into locks them, so a prompt that is being moved to
+    another worker is found in one of them.
+    """
+    with contextlib.ExitStack() as stack:
+        for queue in sorted(queues, key=id):
+            stack.enter_context(queue.mutex)
+        return any(queue.delete_queue_item_by_id(prompt_id) for queue in queues)
+
 class PromptQueue:
-    def __init__(self, server):
+    """
+    Pending prompts are kept in a binary heap ordered by number, with the heap position
+    of every prompt id, so removing a prompt by id doesn't scan or rebuild the heap.
+
+    Queue items are never modified once queued. The worker executes a copy of the item
+    it gets, so readers are handed the items themselves and a snapshot of the queue is
+    only built once per change, outside of what the worker waits on.
+
+    With a store (app.database.prompt_store.PromptStore) queued prompts and history
+    are also kept in the database under the queue's name, so they survive restarts.
+    The in-memory history then only holds the latest entries.
+    """
+    def __init__(self, server, store=None, name="default"):
         self.server = server
+        self.store = store
+        self.name = name
         self.mutex = threading.RLock()
         self.not_empty = threading.Condition(self.mutex)
         self.task_counter = 0
         self.queue = []
+        # prompt id -> position of the item in the heap
+        self.positions = {}
         self.currently_running = {}
         self.history = {}
+        # prompt id -> id of its history entry, in the same order as history
+        self.history_ids = {}
+        # changes with every change to the history
+        self.history_version = 0
         self.flags = {}
+        # prompt ids explicitly routed to this queue, never moved to another worker
+        self.pinned = set()
+        # (running, queued) as returned by get_current_queue_volatile, None once outdated
+        self.snapshot = None
+
+    def _place(self, i, item):
+        self.queue[i] = item
+        self.positions[item[1]] = i
+
+    def _sift_up(self, i):
+        item = self.queue[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not item < self.queue[parent]:
+                break
+            self._place(i, self.queue[parent])
+            i = parent
+        self._place(i, item)
+
+    def _sift_down(self, i):
+        item = self.queue[i]
+        size = len(self.queue)
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and self.queue[child + 1] < self.queue[child]:
+                child += 1
+            if not self.queue[child] < item:
+                break
+            self._place(i, self.queue[child])
+            i = child
+        self._place(i, item)
+
+    def _push(self, item):
+        if item[1] in self.positions:
+            raise ValueError(f"Prompt {item[1]} is already queued")
+        self.queue.append(item)
+        self._sift_up(len(self.queue) - 1)
+        self.snapshot = None
+
+    def _remove_at(self, i):
+        item = self.queue[i]
+        del self.positions[item[1]]
+        self.pinned.discard(item[1])
+        last = self.queue.pop()
+        if i < len(self.queue):
+            self._place(i, last)
+            self._sift_up(i)
+            self._sift_down(self.positions[last[1]])
+        self.snapshot = None
+        return item
+
+    def put(self, item, pinned=False):
+        with self.mutex:
+            self.restore(item, pinned)
+            if self.store is not None:
+                self.store.add(self.name, item, pinned)
 
-    def put(self, item):
+    def restore(self, item, pinned=False):
+        """Queues an item that is already in the store."""
         with self.mutex:
-            heapq.heappush(self.queue, item)
+            self._push(item)
+            if pinned:
+                self.pinned.add(item[1])
             self.server.queue_updated()
             self.not_empty.notify()
 
@@ -1111,12 +1279,14 @@ class PromptQueue:
                 self.not_empty.wait(timeout=timeout)
                 if timeout is not None and len(self.queue) == 0:
                     return None
-            item = heapq.heappop(self.queue)
+            item = self._remove_at(0)
             i = self.task_counter
-            self.currently_running[i] = copy.deepcopy(item)
+            self.currently_running[i] = item
             self.task_counter += 1
             self.server.queue_updated()
-            return (item, i)
+        # Execution stores data in the prompt, it runs on a copy so the queued item
+        # that is shown as running and goes into the history stays untouched.
+        return (copy.deepcopy(item), i)
 
     class ExecutionStatus(NamedTuple):
         status_str: Literal['success', 'error']
@@ -1125,10 +1295,13 @@ class PromptQueue:
 
     def task_done(self, item_id, history_result,
                   status: Optional['PromptQueue.ExecutionStatus'], process_item=None):
-        with self.mutex:
+        with _history_lock, self.mutex:
             prompt = self.currently_running.pop(item_id)
+            self.snapshot = None
             if len(self.history) > MAXIMUM_HISTORY_SIZE:
-                self.history.pop(next(iter(self.history)))
+                oldest = next(iter(self.history))
+                self.history.pop(oldest)
+                self.history_ids.pop(oldest)
 
             status_dict: Optional[dict] = None
             if status is not None:
@@ -1137,67 +1310,119 @@ class PromptQueue:
             if process_item is not None:
                 prompt = process_item(prompt)
 
+            # A prompt that runs again moves to the end, history stays in the order prompts finished
+            self.history.pop(prompt[1], None)
+            self.history_ids.pop(prompt[1], None)
+            # Entries aren't modified after this, readers share them
             self.history[prompt[1]] = {
                 "prompt": prompt,
                 "outputs": {},
                 'status': status_dict,
             }
             self.history[prompt[1]].update(history_result)
+            global _last_history_id
+            history_id = self.store.next_history_id() if self.store is not None else next(_history_ids)
+            _last_history_id = history_id
+            self.history_ids[prompt[1]] = history_id
+            self.history_version += 1
+            if self.store is not None:
+                self.store.complete(self.name, prompt[1], self.history[prompt[1]], history_id)
             self.server.queue_updated()
 
-    # Note: slow
     def get_current_queue(self):
-        with self.mutex:
-            out = []
-            for x in self.currently_running.values():
-                out += [x]
-            return (out, copy.deepcopy(self.queue))
+        running, queued = self.get_current_queue_volatile()
+        return (list(running), list(queued))
 
-    # read-safe as long as queue items are immutable
+    # read-safe as long as queue items are immutable, the returned tuples are shared between readers
     def get_current_queue_volatile(self):
         with self.mutex:
-            running = [x for x in self.currently_running.values()]
-            queued = copy.copy(self.queue)
-            return (running, queued)
+            if self.snapshot is None:
+                self.snapshot = (tuple(self.currently_running.values()), tuple(self.queue))
+            return self.snapshot
 
     def get_tasks_remaining(self):
         with self.mutex:
             return len(self.queue) + len(self.currently_running)
 
+    def get_tasks_stealable(self):
+        with self.mutex:
+            return len(self.queue) - len(self.pinned)
+
+    def steal_into(self, thief, score=None, max_candidates=16):
+        """
+        Moves one unpinned pending item to the thief queue, only while this queue's
+        worker is busy. Both queues are locked during the move so the item is
+        always visible in exactly one of them. Among the max_candidates highest
+        priority items the one with the highest score(item) is taken.
+        """
+        first, second = sorted((self, thief), key=id)
+        with first.mutex, second.mutex:
+            if len(self.currently_running) == 0:
+                return None
+            candidates = [x for x in heapq.nsmallest(max_candidates, self.queue) if x[1] not in self.pinned]
+            if len(candidates) == 0:
+                return None
+            item = candidates[0]
+            if score is not None:
+                item = max(candidates, key=score)
+            if item[1] in thief.positions:
+                return None
+            self._remove_at(self.positions[item[1]])
+            thief._push(item)
+            if self.store is not None:
+                self.store.move(item[1], thief.name)
+            self.server.queue_updated()
+            thief.not_empty.notify()
+            return item
+
     def wipe_queue(self):
         with self.mutex:
+            if self.store is not None:
+                self.store.remove(list(self.positions))
             self.queue = []
+            self.positions = {}
+            self.pinned.clear()
+            self.snapshot = None
             self.server.queue_updated()
 
+    def delete_queue_item_by_id(self, prompt_id):
+        with self.mutex:
+            i = self.positions.get(prompt_id, None)
+            if i is None:
+                return False
+            self._remove_at(i)
+            if self.store is not None:
+                self.store.remove([prompt_id])
+            self.server.queue_updated()
+            return True
+
     def delete_queue_item(self, function):
         with self.mutex:
             for x in range(len(self.queue)):
                 if function(self.queue[x]):
-                    if len(self.queue) == 1:
-                        self.wipe_queue()
-                    else:
-                        self.queue.pop(x)
-                        heapq.heapify(self.queue)
+                    item = self._remove_at(x)
+                    if self.store is not None:
+                        self.store.remove([item[1]])
                     self.server.queue_updated()
                     return True
         return False
 
     def get_history(self, prompt_id=None, max_items=None, offset=-1, map_function=None):
+        if self.store is not None:
+            return self._get_stored_history(prompt_id, max_items, offset, map_function)
         with self.mutex:
             if prompt_id is None:
-                out = {}
-                i = 0
                 if offset < 0 and max_items is not None:
-                    offset = len(self.history) - max_items
-                for k in self.history:
-                    if i >= offset:
-                        p = self.history[k]
-                        if map_function is not None:
-                            p = map_function(p)
-                        out[k] = p
-                        if max_items is not None and len(out) >= max_items:
-                            break
-                    i += 1
+                    keys = reversed(list(itertools.islice(reversed(self.history), max_items)))
+                else:
+                    offset = max(offset, 0)
+                    keys = itertools.islice(self.history, offset, None if max_items is None else offset + max_items)
+                out = {}
+                for k in keys:
+                    p = self.history[k]
+                    if map_function is not None:
+                        p = map_function(p)
+                    out[k] = p
                 return out
             elif prompt_id in self.history:
                 p = self.history[prompt_id]
@@ -1209,13 +1434,62 @@ class PromptQueue:
             else:
                 return {}
 
+    def _get_stored_history(self, prompt_id, max_items, offset, map_function):
+        # Entries read from the store are new objects, they don't need to be copied
+        if prompt_id is None:
+            out = self.store.get_history(self.name, max_items, offset)
+        else:
+            with self.mutex:
+                p = self.history.get(prompt_id, None)
+                if p is not None:
+                    return {prompt_id: copy.deepcopy(p) if map_function is None else map_function(p)}
+            p = self.store.get_history_item(self.name, prompt_id)
+            out = {} if p is None else {prompt_id: p}
+        if map_function is not None:
+            out = {k: map_function(v) for k, v in out.items()}
+        return out
+
+    def get_history_page(self, since=None, before=None, max_items=None, upto=None):
+        """
+        History entries by cursor, as (id, prompt_id, entry) oldest first. With since, the
+        first max_items entries that finished after the entry with that id. Otherwise the
+        last max_items entries that finished before the entry with id before, or the last
+        ones when before is None. Entries with an id above upto are left out. Entries are
+        shared, not copied.
+        """
+        if self.store is not None:
+            return self.store.get_history_page(self.name, since, before, max_items, upto)
+        page = []
+        with self.mutex:
+            for prompt_id in reversed(self.history):
+                history_id = self.history_ids[prompt_id]
+                if since is not None and history_id <= since:
+                    break
+                if (before is not None and history_id >= before) or (upto is not None and history_id > upto):
+                    continue
+                page.append((history_id, prompt_id, self.history[prompt_id]))
+                if since is None and max_items is not None and len(page) >= max_items:
+                    break
+        page.reverse()
+        if since is not None and max_items is not None:
+            page = page[:max_items]
+        return page
+
     def wipe_history(self):
         with self.mutex:
             self.history = {}
+            self.history_ids = {}
+            self.history_version += 1
+            if self.store is not None:
+                self.store.delete_history(self.name)
 
     def delete_history_item(self, id_to_delete):
         with self.mutex:
             self.history.pop(id_to_delete, None)
+            self.history_ids.pop(id_to_delete, None)
+            self.history_version += 1
+            if self.store is not None:
+                self.store.delete_history(self.name, id_to_delete)
 
     def set_flag(self, name, data):
         with self.mutex:
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import os
+import json
 import time
+import sqlite3
 import mimetypes
 import logging
+import threading
 from typing import Literal, List
 from collections.abc import Collection
 
@@ -56,6 +59,8 @@ input_directory = os.path.join(base_path, "input")
 user_directory = os.path.join(base_path, "user")
 
 filename_list_cache: dict[str, tuple[list[str], dict[str, float], float]] = {}
+# folder_name -> (the filename_list_cache entry it was built with, relative filename -> full path)
+full_path_cache: dict[str, tuple[tuple[list[str], dict[str, float], float], dict[str, str]]] = {}
 
 class CacheHelper:
     """
@@ -87,6 +92,133 @@ class CacheHelper:
 
 cache_helper = CacheHelper()
 
+class FileIndex:
+    """
+    Incrementally maintained listing of the directory trees under the model folders.
+    Every directory is stored with its mtime and entries, a scan only stats the known
+    directories and re-lists the ones whose mtime changed instead of walking the whole
+    tree again. The index can be persisted to a SQLite file so a restart doesn't walk
+    the trees either.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        # directory -> (mtime, subdirectory names, file names)
+        self.dirs: dict[str, tuple[float, list[str], list[str]]] = {}
+        # full file path -> (mtime, ctime, size), filled on demand
+        self.file_stats: dict[str, tuple[float, float, int]] = {}
+        self.db: sqlite3.Connection | None = None
+
+    def enable_persistence(self, db_path: str) -> None:
+        with self.lock:
+            try:
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+                db = sqlite3.connect(db_path, check_same_thread=False)
+                db.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime REAL, subdirs TEXT, files TEXT)")
+                for path, mtime, subdirs, files in db.execute("SELECT path, mtime, subdirs, files FROM dirs"):
+                    if path not in self.dirs:
+                        self.dirs[path] = (mtime, json.loads(subdirs), json.loads(files))
+            except Exception as e:
+                logging.warning(f"Warning: Unable to use file index database {db_path}: {e}")
+                return
+            self.db = db
+            logging.info("Loaded file index with {} directories from {}".format(len(self.dirs), db_path))
+
+    def _list_dir(self, path: str) -> tuple[list[str], list[str]]:
+        subdirs = []
+        files = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                    else:
+                        files.append(entry.name)
+                except OSError:
+                    continue
+        return subdirs, files
+
+    def _forget(self, path: str, removed: list[str]) -> None:
+        prefix = os.path.join(path, "")
+        for key in [k for k in self.dirs if k == path or k.startswith(prefix)]:
+            for f in self.dirs.pop(key)[2]:
+                self.file_stats.pop(os.path.join(key, f), None)
+            removed.append(key)
+
+    def _persist(self, changed: list[str], removed: list[str]) -> None:
+        if self.db is None:
+            return
+        try:
+            with self.db:
+                self.db.executemany("DELETE FROM dirs WHERE path = ?", [(p,) for p in removed])
+                self.db.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)",
+                                    [(p, self.dirs[p][0], json.dumps(self.dirs[p][1]), json.dumps(self.dirs[p][2])) for p in changed if p in self.dirs])
+        except sqlite3.Error as e:
+            logging.warning(f"Warning: Unable to update file index database: {e}")
+
+    def scan(self, directory: str, excluded_dir_names: list[str] | None=None) -> tuple[list[str], dict[str, float]]:
+        """
+        Same result as walking the directory: the files relative to it and the mtimes of
+        it and all its subdirectories.
+        """
+        if excluded_dir_names is None:
+            excluded_dir_names = []
+        result = []
+        dirs = {}
+        changed = []
+        removed = []
+        with self.lock:
+            stack = [directory]
+            while stack:
+                path = stack.pop()
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    logging.warning(f"Warning: Unable to access {path}. Skipping this path.")
+                    self._forget(path, removed)
+                    continue
+                entry = self.dirs.get(path)
+                if entry is None or entry[0] != mtime:
+                    try:
+                        subdirs, files = self._list_dir(path)
+                    except OSError:
+                        logging.warning(f"Warning: Unable to access {path}. Skipping this path.")
+                        self._forget(path, removed)
+                        continue
+                    if entry is not None:
+                        for d in set(entry[1]) - set(subdirs):
+                            self._forget(os.path.join(path, d), removed)
+                        for f in entry[2]:
+                            self.file_stats.pop(os.path.join(path, f), None)
+                    entry = (mtime, subdirs, files)
+                    self.dirs[path] = entry
+                    changed.append(path)
+
+                dirs[path] = mtime
+                relative_dir = os.path.relpath(path, directory)
+                for f in entry[2]:
+                    result.append(f if relative_dir == "." else os.path.join(relative_dir, f))
+                for d in entry[1]:
+                    if d not in excluded_dir_names:
+                        stack.append(os.path.join(path, d))
+
+            if changed or removed:
+                logging.debug("file index: relisted {} directories under {}".format(len(changed), directory))
+                self._persist(changed, removed)
+        return result, dirs
+
+    def stat_file(self, full_path: str) -> tuple[float, float, int]:
+        """(mtime, ctime, size) of a file, cached until its directory changes."""
+        with self.lock:
+            stats = self.file_stats.get(full_path)
+        if stats is None:
+            st = os.stat(full_path)
+            stats = (st.st_mtime, st.st_ctime, st.st_size)
+            with self.lock:
+                self.file_stats[full_path] = stats
+        return stats
+
+file_index = FileIndex()
+
 extension_mimetypes_cache = {
     "webp" : "image",
     "fbx" : "model",
@@ -237,40 +369,8 @@ def recursive_search(directory: str, excluded_dir_names: list[str] | None=None)
     if not os.path.isdir(directory):
         return [], {}
 
-    if excluded_dir_names is None:
-        excluded_dir_names = []
-
-    result = []
-    dirs = {}
-
-    # Attempt to add the initial directory to dirs with error handling
-    try:
-        dirs[directory] = os.path.getmtime(directory)
-    except FileNotFoundError:
-        logging.warning(f"Warning: Unable to access {directory}. Skipping this path.")
-
     logging.debug("recursive file list on directory {}".format(directory))
-    dirpath: str
-    subdirs: list[str]
-    filenames: list[str]
-
-    for dirpath, subdirs, filenames in os.walk(directory, followlinks=True, topdown=True):
-        subdirs[:] = [d for d in subdirs if d not in excluded_dir_names]
-        for file_name in filenames:
-            try:
-                relative_path = os.path.relpath(os.path.join(dirpath, file_name), directory)
-                result.append(relative_path)
-            except:
-                logging.warning(f"Warning: Unable to access {file_name}. Skipping this file.")
-                continue
-
-        for d in subdirs:
-            path: str = os.path.join(dirpath, d)
-            try:
-                dirs[path] = os.path.getmtime(path)
-            except FileNotFoundError:
-                logging.warning(f"Warning: Unable to access {path}. Skipping this path.")
-                continue
+    result, dirs = file_index.scan(directory, excluded_dir_names)
     logging.debug("found {} files".format(len(result)))
     return result, dirs
 
@@ -289,6 +389,15 @@ def get_full_path(folder_name: str, filename: str) -> str | None:
         return None
     folders = folder_names_and_paths[folder_name]
     filename = os.path.relpath(os.path.join("/", filename), "/")
+
+    # Files seen by the current file list are resolved without touching the filesystem,
+    # the lookup table is dropped together with the list when a folder changes.
+    cached = full_path_cache.get(folder_name)
+    if cached is not None and (filename_list_cache.get(folder_name) is cached[0] or cache_helper.get(folder_name) is cached[0]):
+        full_path = cached[1].get(filename)
+        if full_path is not None:
+            return full_path
+
     for x in folders[0]:
         full_path = os.path.join(x, filename)
         if os.path.isfile(full_path):
@@ -315,12 +424,18 @@ def get_filename_list_(folder_name: str) -> tuple[list[str], dict[str, float], f
     output_list = set()
     folders = folder_names_and_paths[folder_name]
     output_folders = {}
+    full_paths = {}
     for x in folders[0]:
         files, folders_all = recursive_search(x, excluded_dir_names=[".git"])
-        output_list.update(filter_files_extensions(files, folders[1]))
+        files = filter_files_extensions(files, folders[1])
+        output_list.update(files)
+        for f in files:
+            full_paths.setdefault(f, os.path.join(x, f))
         output_folders = {**output_folders, **folders_all}
 
-    return sorted(list(output_list)), output_folders, time.perf_counter()
+    out = sorted(list(output_list)), output_folders, time.perf_counter()
+    full_path_cache[folder_name] = (out, full_paths)
+    return out
 
 def cached_filename_list_(folder_name: str) -> tuple[list[str], dict[str, float], float] | None:
     strong_cache = cache_helper.get(folder_name)
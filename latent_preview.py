@@ -3,9 +3,12 @@ from PIL import Image
 from comfy.cli_args import args, LatentPreviewMethod
 from comfy.taesd.taesd import TAESD
 import comfy.model_management
+import comfy.model_patcher
 import folder_paths
 import comfy.utils
 import logging
+import threading
+import time
 
 MAX_PREVIEW_RESOLUTION = args.preview_size
 
@@ -20,6 +23,9 @@ def preview_to_image(latent_image):
         return Image.fromarray(latents_ubyte.numpy())
 
 class LatentPreviewer:
+    def prepare(self):
+        pass
+
     def decode_latent_to_preview(self, x0):
         pass
 
@@ -28,14 +34,39 @@ class LatentPreviewer:
         return ("JPEG", preview_image, MAX_PREVIEW_RESOLUTION)
 
 class TAESDPreviewerImpl(LatentPreviewer):
-    def __init__(self, taesd):
+    def __init__(self, taesd, patcher=None):
         self.taesd = taesd
+        self.patcher = patcher
+
+    def prepare(self):
+        # Loaded before sampling starts. Loading from the sampler callback could free memory
+        # by partially unloading the model that is sampling.
+        if self.patcher is not None and self.patcher.current_loaded_device() != self.patcher.load_device:
+            comfy.model_management.load_models_gpu([self.patcher], force_full_load=True)
 
     def decode_latent_to_preview(self, x0):
-        x_sample = self.taesd.decode(x0[:1])[0].movedim(0, 2)
+        # If it was offloaded to make room for the sampled model, decode where it is
+        weight = next(self.taesd.parameters())
+        x_sample = self.taesd.decode(x0[:1].to(device=weight.device, dtype=weight.dtype))[0].movedim(0, 2)
         return preview_to_image(x_sample)
 
 
+# TAESD decoders stay in memory between sampler runs, one per decoder file and device. They
+# are loaded on the device like any other model, so memory pressure offloads them.
+taesd_previewers: dict[tuple[str, int, str], comfy.model_patcher.ModelPatcher] = {}
+taesd_previewers_lock = threading.Lock()
+
+def get_taesd_patcher(decoder_path, latent_channels, device):
+    key = (decoder_path, latent_channels, str(device))
+    with taesd_previewers_lock:
+        patcher = taesd_previewers.get(key, None)
+        if patcher is None:
+            taesd = TAESD(None, decoder_path, latent_channels=latent_channels)
+            patcher = comfy.model_patcher.ModelPatcher(taesd, load_device=device, offload_device=comfy.model_management.vae_offload_device())
+            taesd_previewers[key] = patcher
+        return patcher
+
+
 class Latent2RGBPreviewer(LatentPreviewer):
     def __init__(self, latent_rgb_factors, latent_rgb_factors_bias=None):
         self.latent_rgb_factors = torch.tensor(latent_rgb_factors, device="cpu").transpose(0, 1)
@@ -78,8 +109,8 @@ def get_previewer(device, latent_format):
 
         if method == LatentPreviewMethod.TAESD:
             if taesd_decoder_path:
-                taesd = TAESD(None, taesd_decoder_path, latent_channels=latent_format.latent_channels).to(device)
-                previewer = TAESDPreviewerImpl(taesd)
+                patcher = get_taesd_patcher(taesd_decoder_path, latent_format.latent_channels, device)
+                previewer = TAESDPreviewerImpl(patcher.model, patcher=patcher)
             else:
                 logging.warning("Warning: TAESD previews enabled, but could not find models/vae_approx/{}".format(latent_format.taesd_decoder_name))
 
@@ -88,21 +119,40 @@ def get_previewer(device, latent_format):
                 previewer = Latent2RGBPreviewer(latent_format.latent_rgb_factors, latent_format.latent_rgb_factors_bias)
     return previewer
 
+# Set by the server, returns False when nobody would receive the previews of the running prompt.
+PREVIEW_SUBSCRIBER_CHECK = None
+
+def set_preview_subscriber_check(function):
+    global PREVIEW_SUBSCRIBER_CHECK
+    PREVIEW_SUBSCRIBER_CHECK = function
+
+def previews_wanted():
+    return PREVIEW_SUBSCRIBER_CHECK is None or PREVIEW_SUBSCRIBER_CHECK()
+
 def prepare_callback(model, steps, x0_output_dict=None):
     preview_format = "JPEG"
     if preview_format not in ["JPEG", "PNG"]:
         preview_format = "JPEG"
 
     previewer = get_previewer(model.load_device, model.model.latent_format)
+    if previewer is not None:
+        previewer.prepare()
+    min_interval = 1.0 / args.preview_max_fps if args.preview_max_fps > 0 else 0.0
+    last_preview = None
 
     pbar = comfy.utils.ProgressBar(steps)
     def callback(step, x0, x, total_steps):
+        nonlocal last_preview
         if x0_output_dict is not None:
             x0_output_dict["x0"] = x0
 
         preview_bytes = None
-        if previewer:
-            preview_bytes = previewer.decode_latent_to_preview_image(preview_format, x0)
+        if previewer and previews_wanted():
+            now = time.perf_counter()
+            # the last step is always shown so the client ends on the final preview
+            if last_preview is None or now - last_preview >= min_interval or step + 1 >= total_steps:
+                last_preview = now
+                preview_bytes = previewer.decode_latent_to_preview_image(preview_format, x0)
         pbar.update_absolute(step + 1, total_steps, preview_bytes)
     return callback
 
@@ -114,6 +114,15 @@ from collections import deque
 # ============ 多 GPU 调度配置 ============
 ENABLE_MULTI_GPU = os.getenv('COMFY_MULTI_GPU_SCHED', '0') == '1'
 NUM_GPUS = int(os.getenv('COMFY_NUM_GPUS', '4')) if ENABLE_MULTI_GPU else 1
+# 未指定 X-TARGET-GPU 的任务按模型亲和性路由到已加载对应模型的 GPU
+ENABLE_MODEL_AFFINITY = ENABLE_MULTI_GPU and os.getenv('COMFY_MULTI_GPU_AFFINITY', '0') == '1'
+# 空闲 worker 从最长的兄弟队列窃取未固定 GPU 的任务
+ENABLE_WORK_STEALING = ENABLE_MULTI_GPU and os.getenv('COMFY_MULTI_GPU_WORK_STEALING', '1') == '1'
+WORK_STEALING_INTERVAL = float(os.getenv('COMFY_MULTI_GPU_STEAL_INTERVAL', '0.5'))
+# 各 GPU 执行器共享 IMAGE/LATENT/MASK/CONDITIONING 节点结果（GB，0 为关闭）
+SHARED_OUTPUT_CACHE_GB = float(os.getenv('COMFY_MULTI_GPU_SHARED_OUTPUTS_GB', '0')) if ENABLE_MULTI_GPU else 0
+# 仅由 API 节点（远程服务）组成的任务交给独立的远程 worker 执行，不占用 GPU worker（0 为关闭）
+REMOTE_WORKERS = int(os.getenv('COMFY_MULTI_GPU_REMOTE_WORKERS', '0')) if ENABLE_MULTI_GPU else 0
 
 if ENABLE_MULTI_GPU:
     logging.info(f"🚀 Multi-GPU mode ENABLED with {NUM_GPUS} GPUs")
@@ -163,6 +172,7 @@ import execution
 import server
 from protocol import BinaryEventTypes
 import nodes
+import latent_preview
 import comfy.model_management
 import comfyui_version
 import app.logger
@@ -180,17 +190,26 @@ def cuda_malloc_warning():
             logging.warning("\nWARNING: this card most likely does not support cuda-malloc, if you get \"CUDA error\" please run ComfyUI with: --disable-cuda-malloc\n")
 
 
+def get_cache_args():
+    cache_disk_directory = args.cache_disk_directory
+    if cache_disk_directory is None:
+        cache_disk_directory = os.path.join(folder_paths.base_path, "cache", "node_outputs")
+    return {"lru": args.cache_lru, "lru_gb": args.cache_lru_gb, "ram": args.cache_ram, "disk": args.cache_disk, "disk_directory": cache_disk_directory, "shared": SHARED_OUTPUT_CACHE_GB, "batch": args.batch_prompts}
+
+
 def prompt_worker(q, server_instance):
     current_time: float = 0.0
     cache_type = execution.CacheType.CLASSIC
     if args.cache_lru > 0:
         cache_type = execution.CacheType.LRU
+    elif args.cache_lru_gb > 0:
+        cache_type = execution.CacheType.LRU_BYTES
     elif args.cache_ram > 0:
         cache_type = execution.CacheType.RAM_PRESSURE
     elif args.cache_none:
         cache_type = execution.CacheType.NONE
 
-    e = execution.PromptExecutor(server_instance, cache_type=cache_type, cache_args={ "lru" : args.cache_lru, "ram" : args.cache_ram } )
+    e = execution.PromptExecutor(server_instance, cache_type=cache_type, cache_args=get_cache_args() )
     last_gc_collect = 0
     need_gc = False
     gc_collect_interval = 10.0
@@ -316,6 +335,8 @@ class GPUQueueMetrics:
 
 
 # ============ 多 GPU Worker ============
+from comfy_execution.gpu_scheduler import steal_prompt
+
 def prompt_worker_gpu(gpu_id, queue, server_instance):
     """
     GPU 专用 worker 线程
@@ -333,6 +354,8 @@ def prompt_worker_gpu(gpu_id, queue, server_instance):
     cache_type = execution.CacheType.CLASSIC
     if args.cache_lru > 0:
         cache_type = execution.CacheType.LRU
+    elif args.cache_lru_gb > 0:
+        cache_type = execution.CacheType.LRU_BYTES
     elif args.cache_ram > 0:
         cache_type = execution.CacheType.RAM_PRESSURE
     elif args.cache_none:
@@ -341,7 +364,7 @@ def prompt_worker_gpu(gpu_id, queue, server_instance):
     executor = execution.PromptExecutor(
         server_instance,
         cache_type=cache_type,
-        cache_args={"lru": args.cache_lru, "ram": args.cache_ram}
+        cache_args=get_cache_args()
     )
 
     # 初始化指标收集
@@ -363,11 +386,20 @@ def prompt_worker_gpu(gpu_id, queue, server_instance):
         if need_gc:
             current_time = time.perf_counter()
             timeout = max(gc_collect_interval - (current_time - last_gc_collect), 0.0)
+        if ENABLE_WORK_STEALING:
+            # 定期醒来检查兄弟队列是否有可窃取的任务
+            timeout = min(timeout, WORK_STEALING_INTERVAL)
 
         # 记录队列等待开始时间
         queue_start_time = time.perf_counter()
         queue_item = queue.get(timeout=timeout)
 
+        if queue_item is None and ENABLE_WORK_STEALING:
+            # 本队列为空：窃取任务放入本队列，由下一次 get() 正常取出
+            # 这样任务的 currently_running / history 都记录在实际执行的 GPU 队列上
+            if steal_prompt(gpu_id, server_instance.prompt_queues) is not None:
+                queue_item = queue.get(timeout=0)
+
         if queue_item is not None:
             item, item_id = queue_item
 
@@ -456,7 +488,7 @@ def prompt_worker_gpu(gpu_id, queue, server_instance):
                     executor = execution.PromptExecutor(
                         server_instance,
                         cache_type=cache_type,
-                        cache_args={"lru": args.cache_lru, "ram": args.cache_ram}
+                        cache_args=get_cache_args()
                     )
                     consecutive_failures = 0
 
@@ -640,6 +672,7 @@ def hijack_progress(server_instance):
                 )
 
     comfy.utils.set_progress_bar_global_hook(hook)
+    latent_preview.set_preview_subscriber_check(lambda: server_instance.has_preview_subscriber(server_instance.client_id))
 
 
 def cleanup_temp():
@@ -667,6 +700,7 @@ def start_comfyui(asyncio_loop=None):
         logging.info(f"Setting temp directory to: {temp_dir}")
         folder_paths.set_temp_directory(temp_dir)
     cleanup_temp()
+    folder_paths.file_index.enable_persistence(os.path.join(folder_paths.get_user_directory(), "file_index.db"))
 
     if args.windows_standalone_build:
         try:
@@ -693,21 +727,40 @@ def start_comfyui(asyncio_loop=None):
     prompt_server.add_routes()
     hijack_progress(prompt_server)
 
+    prompt_store = None
+    if args.persist_queue:
+        from app.database.prompt_store import create_prompt_store
+        prompt_store = create_prompt_store(args.persist_history_size)
+
     # ========== 多 GPU 模式初始化 ==========
     if ENABLE_MULTI_GPU:
         # 创建多个队列
         prompt_server.prompt_queues = [
-            execution.PromptQueue(prompt_server) for _ in range(NUM_GPUS)
+            execution.PromptQueue(prompt_server, prompt_store, f"gpu{gpu_id}") for gpu_id in range(NUM_GPUS)
         ]
         # 兼容原有代码（指向 GPU 0 的队列）
         prompt_server.prompt_queue = prompt_server.prompt_queues[0]
 
         logging.info(f"📋 Created {NUM_GPUS} task queues for multi-GPU scheduling")
+
+        if ENABLE_MODEL_AFFINITY:
+            from comfy_execution.gpu_scheduler import ModelAffinityScheduler
+            prompt_server.gpu_scheduler = ModelAffinityScheduler(prompt_server.prompt_queues)
+            logging.info("🧭 Model-affinity scheduling ENABLED for prompts without X-TARGET-GPU")
+
+        if REMOTE_WORKERS > 0:
+            prompt_server.remote_queue = execution.PromptQueue(prompt_server, prompt_store, "remote")
+            logging.info(f"🌐 {REMOTE_WORKERS} remote workers ENABLED for prompts made of API nodes")
     else:
         # 单 GPU 模式（原有逻辑）
-        prompt_server.prompt_queue = execution.PromptQueue(prompt_server)
+        prompt_server.prompt_queue = execution.PromptQueue(prompt_server, prompt_store)
     # ========================================
 
+    if prompt_store is not None:
+        # 重启前未完成的任务重新入队
+        queues = {q.name: q for q in prompt_server.all_prompt_queues()}
+        prompt_server.number = max(prompt_server.number, prompt_store.restore(queues))
+
     # ========== 启动 Worker 线程 ==========
     if ENABLE_MULTI_GPU:
         # 多 GPU 模式：启动多个 worker
@@ -720,6 +773,15 @@ def start_comfyui(asyncio_loop=None):
             ).start()
             logging.info(f"🚀 Started worker thread for GPU {gpu_id}")
 
+        # 远程 worker：每个线程一个执行器，并发等待远程服务，不绑定 GPU
+        for worker_id in range(REMOTE_WORKERS):
+            threading.Thread(
+                target=prompt_worker,
+                daemon=True,
+                args=(prompt_server.remote_queue, prompt_server),
+                name=f"Remote{worker_id}-Worker"
+            ).start()
+
         # 预热所有 GPU
         for gpu_id in range(NUM_GPUS):
             warmup_gpu(gpu_id)
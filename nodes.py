@@ -35,6 +35,7 @@ from comfy_api.latest import io, ComfyExtension
 import comfy.clip_vision
 
 import comfy.model_management
+import comfy.output_writer
 from comfy.cli_args import args
 
 import importlib
@@ -675,7 +676,11 @@ class LoraLoader:
             lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
             self.loaded_lora = (lora_path, lora)
 
-        model_lora, clip_lora = comfy.sd.load_lora_for_models(model, clip, lora, strength_model, strength_clip)
+        model_lora, clip_lora = comfy.sd.load_lora_for_models(model, clip, lora, strength_model, strength_clip, lora_identity=comfy.utils.weights_file_hash(lora_path))
+        if model_lora is not None and strength_model != 0:
+            model_lora.source_files = getattr(model, "source_files", ()) + (lora_path,)
+        if clip_lora is not None and strength_clip != 0:
+            clip_lora.patcher.source_files = getattr(clip.patcher, "source_files", ()) + (lora_path,)
         return (model_lora, clip_lora)
 
 class LoraLoaderModelOnly(LoraLoader):
@@ -773,6 +778,7 @@ class VAELoader:
 
     #TODO: scale factor?
     def load_vae(self, vae_name):
+        vae_path = None
         if vae_name == "pixel_space":
             sd = {}
             sd["pixel_space_vae"] = torch.tensor(1.0)
@@ -783,6 +789,9 @@ class VAELoader:
             sd = comfy.utils.load_torch_file(vae_path)
         vae = comfy.sd.VAE(sd=sd)
         vae.throw_exception_if_invalid()
+        if vae_path is not None:
+            vae.patcher.source_files = (vae_path,)
+            vae.patcher.model_identity = comfy.utils.weights_file_hash(vae_path)
         return (vae,)
 
 class ControlNetLoader:
@@ -1589,9 +1598,10 @@ class SaveImage:
         filename_prefix += self.prefix_append
         full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
         results = list()
+        writer = comfy.output_writer.get_output_writer()
+        counter = writer.reserve_counters(full_output_folder, filename, counter, len(images))
+        writes = []
         for (batch_number, image) in enumerate(images):
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
             metadata = None
             if not args.disable_metadata:
                 metadata = PngInfo()
@@ -1603,7 +1613,7 @@ class SaveImage:
 
             filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
             file = f"{filename_with_batch_num}_{counter:05}_.png"
-            img.save(os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=self.compress_level)
+            writes.append(writer.save_image(image.cpu(), os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=self.compress_level))
             results.append({
                 "filename": file,
                 "subfolder": subfolder,
@@ -1611,6 +1621,8 @@ class SaveImage:
             })
             counter += 1
 
+        if not args.async_image_save:
+            writer.wait(writes)
         return { "ui": { "images": results } }
 
 class PreviewImage(SaveImage):
@@ -1641,6 +1653,7 @@ class LoadImage:
 
     RETURN_TYPES = ("IMAGE", "MASK")
     FUNCTION = "load_image"
+    THREAD_SAFE = True
     def load_image(self, image):
         image_path = folder_paths.get_annotated_filepath(image)
 
@@ -1718,6 +1731,7 @@ class LoadImageMask:
 
     RETURN_TYPES = ("MASK",)
     FUNCTION = "load_image"
+    THREAD_SAFE = True
     def load_image(self, image, channel):
         image_path = folder_paths.get_annotated_filepath(image)
         i = node_helpers.pillow(Image.open, image_path)
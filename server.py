@@ -17,6 +17,7 @@ import ipaddress
 from PIL import Image, ImageOps
 from PIL.PngImagePlugin import PngInfo
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 import aiohttp
 from aiohttp import web
@@ -26,11 +27,13 @@ import mimetypes
 from comfy.cli_args import args
 import comfy.utils
 import comfy.model_management
+import comfy.output_writer
 from comfy_api import feature_flags
 import node_helpers
 from comfyui_version import __version__
 from app.frontend_management import FrontendManager
 from comfy_api.internal import _ComfyNodeInternal
+from comfy_execution.gpu_scheduler import is_remote_prompt
 
 from app.user_manager import UserManager
 from app.model_manager import ModelFileManager
@@ -40,6 +43,61 @@ from typing import Optional, Union
 from api_server.routes.internal.internal_routes import InternalRoutes
 from protocol import BinaryEventTypes
 
+# Sampler previews, coalesced and rate limited per client instead of queued
+PREVIEW_EVENTS = (BinaryEventTypes.UNENCODED_PREVIEW_IMAGE, BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA)
+# Seconds between two queue status messages
+STATUS_MIN_INTERVAL = 0.1
+# History entries serialized per step of a streamed /history response
+HISTORY_CHUNK_SIZE = 64
+
+
+class PendingPreview:
+    """Stands in the message queue for the latest preview stored under key in pending_previews."""
+    def __init__(self, key):
+        self.key = key
+
+
+def preview_key(event, data, sid):
+    """Previews are coalesced per client, prompt and node, a newer one replaces a pending one."""
+    prompt_id = node_id = None
+    if event == BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA:
+        metadata = data[1]
+        prompt_id, node_id = metadata.get("prompt_id"), metadata.get("node_id")
+    return (event, sid, prompt_id, node_id)
+
+
+def parse_history_fields(fields):
+    if fields is None:
+        return None
+    return [f for f in fields.split(",") if len(f) > 0]
+
+
+def project_history_entry(entry, fields=None):
+    if fields is None:
+        return dict(entry)
+    return {k: entry[k] for k in fields if k in entry}
+
+
+def encode_history(items, fields, first):
+    chunk = ", ".join(f"{json.dumps(prompt_id)}: {json.dumps(project_history_entry(entry, fields))}" for prompt_id, entry in items)
+    return (("{" if first else ", ") + chunk).encode("utf-8")
+
+
+async def stream_history(request, items, fields, headers):
+    """Writes a history dict, serializing chunks of entries off the event loop."""
+    response = web.StreamResponse(headers=headers)
+    response.content_type = "application/json"
+    # compress_body only handles web.Response, a stream has to be compressed before prepare()
+    if args.enable_compress_response_body and "gzip" in request.headers.get("Accept-Encoding", ""):
+        response.enable_compression()
+    await response.prepare(request)
+    loop = asyncio.get_running_loop()
+    for i in range(0, len(items), HISTORY_CHUNK_SIZE):
+        await response.write(await loop.run_in_executor(None, encode_history, items[i:i + HISTORY_CHUNK_SIZE], fields, i == 0))
+    await response.write(b"}" if len(items) > 0 else b"{}")
+    await response.write_eof()
+    return response
+
 # Import cache control middleware
 from middleware.cache_middleware import cache_control
 
@@ -178,8 +236,20 @@ class PromptServer():
         self.internal_routes = InternalRoutes(self)
         self.supports = ["custom_nodes_from_web"]
         self.prompt_queue = execution.PromptQueue(self)
+        self.gpu_scheduler = None
+        # 仅由 API 节点组成的任务的独立队列（多 GPU 模式下可选）
+        self.remote_queue = None
         self.loop = loop
         self.messages = asyncio.Queue()
+        # Preview frames waiting to be sent, per (event, sid). A newer frame replaces one
+        # that hasn't been sent yet, so a slow client doesn't get a backlog of stale frames.
+        self.pending_previews = {}
+        self.last_preview_time = {}
+        self.status_pending = False
+        self.last_status_time = float("-inf")
+        # Tells ETags of this process apart from those of a previous run
+        self.instance_id = uuid.uuid4().hex[:12]
+        self.preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview_encoder")
         self.client_session:Optional[aiohttp.ClientSession] = None
         self.number = 0
 
@@ -466,6 +536,10 @@ class PromptServer():
                 filename = os.path.basename(filename)
                 file = os.path.join(output_dir, filename)
 
+                pending = comfy.output_writer.get_output_writer().pending_write(file)
+                if pending is not None:
+                    await asyncio.wait([asyncio.wrap_future(pending)])
+
                 if os.path.isfile(file):
                     if 'preview' in request.rel_url.query:
                         with Image.open(file) as img:
@@ -670,48 +744,87 @@ class PromptServer():
 
         @routes.get("/history")
         async def get_history(request):
-            max_items = request.rel_url.query.get("max_items", None)
-            if max_items is not None:
-                max_items = int(max_items)
-
-            offset = request.rel_url.query.get("offset", None)
-            if offset is not None:
-                offset = int(offset)
+            """
+            History, oldest first. max_items and offset page through the history of the
+            first queue. since or before are cursors over the history of all queues: the
+            entries that finished after the entry with id since, or the last ones before
+            the entry with id before. The X-History-Since and X-History-Before headers
+            hold the cursors for the next poll and the previous page. fields (e.g.
+            "status,outputs") limits the keys of the entries. An unchanged history
+            answers If-None-Match with 304.
+            """
+            query = request.rel_url.query
+            etag = self.history_etag()
+            if request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304, headers={"ETag": etag})
+            try:
+                max_items = query.get("max_items", None)
+                if max_items is not None:
+                    max_items = int(max_items)
+                offset = int(query.get("offset", -1))
+                since = query.get("since", None)
+                if since is not None:
+                    since = int(since)
+                before = query.get("before", None)
+                if before is not None:
+                    before = int(before)
+            except ValueError:
+                return web.json_response({"error": "max_items, offset, since and before must be integers"}, status=400)
+            fields = parse_history_fields(query.get("fields", None))
+
+            headers = {"ETag": etag}
+            # With a prompt store the history is read from the database, off the event loop
+            loop = asyncio.get_running_loop()
+            if since is None and before is None:
+                # Entries are shared with the queue, they are serialized after it's unlocked
+                history = list((await loop.run_in_executor(None, lambda: self.prompt_queue.get_history(max_items=max_items, offset=offset))).items())
             else:
-                offset = -1
-
-            return web.json_response(self.prompt_queue.get_history(max_items=max_items, offset=offset))
+                page = await loop.run_in_executor(None, lambda: execution.get_history_page(self.all_prompt_queues(), since=since, before=before, max_items=max_items))
+                history = [(prompt_id, entry) for _, prompt_id, entry in page]
+                if len(page) > 0:
+                    headers["X-History-Since"] = str(page[-1][0])
+                    headers["X-History-Before"] = str(page[0][0])
+                elif since is not None:
+                    headers["X-History-Since"] = str(since)
+            return await stream_history(request, history, fields, headers)
 
         @routes.get("/history/{prompt_id}")
         async def get_history_prompt_id(request):
             prompt_id = request.match_info.get("prompt_id", None)
-            return web.json_response(self.prompt_queue.get_history(prompt_id=prompt_id))
+            fields = parse_history_fields(request.rel_url.query.get("fields", None))
+
+            def find_history():
+                # 多 GPU 模式：任务可能被其他 GPU 窃取执行，历史记录在实际执行的队列中
+                for queue in self.all_prompt_queues():
+                    # Entries aren't modified once finished, a shallow copy is enough
+                    history = queue.get_history(prompt_id=prompt_id, map_function=lambda entry: project_history_entry(entry, fields))
+                    if len(history) > 0:
+                        return history
+                return {}
+
+            return web.json_response(await asyncio.get_running_loop().run_in_executor(None, find_history))
 
         @routes.get("/queue")
         async def get_queue(request):
             # ========== 新增：支持多队列查询 ==========
-            # 解析目标 GPU ID
-            gpu_id_str = request.headers.get('X-TARGET-GPU', '0')
-            try:
-                gpu_id = int(gpu_id_str)
-                gpu_id = max(0, min(gpu_id, 3))  # 限制在 0-3
-            except ValueError:
-                gpu_id = 0
-
-            # 选择对应的队列
-            if hasattr(self, 'prompt_queues') and len(self.prompt_queues) > gpu_id:
-                target_queue = self.prompt_queues[gpu_id]
-            else:
-                target_queue = self.prompt_queue
+            # 指定 X-TARGET-GPU 时只返回该 GPU 的队列，否则合并所有队列
+            gpu_id, queues = self.requested_queues(request)
+            running = []
+            pending = []
+            for queue in queues:
+                current_queue = queue.get_current_queue_volatile()
+                running.extend(current_queue[0])
+                pending.extend(current_queue[1])
+            if len(queues) > 1:
+                pending.sort(key=lambda x: x[0])
 
             queue_info = {}
-            current_queue = target_queue.get_current_queue_volatile()
             remove_sensitive = lambda queue: [x[:5] for x in queue]
-            queue_info['queue_running'] = remove_sensitive(current_queue[0])
-            queue_info['queue_pending'] = remove_sensitive(current_queue[1])
+            queue_info['queue_running'] = remove_sensitive(running)
+            queue_info['queue_pending'] = remove_sensitive(pending)
 
-            # 如果是多 GPU 模式，返回当前查询的 GPU ID
-            if hasattr(self, 'prompt_queues'):
+            # 如果是多 GPU 模式且指定了 GPU，返回当前查询的 GPU ID
+            if hasattr(self, 'prompt_queues') and gpu_id is not None:
                 queue_info['gpu_id'] = gpu_id
             # ==========================================
 
@@ -738,19 +851,43 @@ class PromptServer():
                 }
                 all_queues_info.append(queue_info)
 
-            total_running = sum(q['running_count'] for q in all_queues_info)
-            total_pending = sum(q['pending_count'] for q in all_queues_info)
+            remote_queue_info = None
+            if self.remote_queue is not None:
+                current_queue = self.remote_queue.get_current_queue_volatile()
+                remote_queue_info = {
+                    'queue_running': remove_sensitive(current_queue[0]),
+                    'queue_pending': remove_sensitive(current_queue[1]),
+                    'running_count': len(current_queue[0]),
+                    'pending_count': len(current_queue[1])
+                }
 
-            return web.json_response({
+            total_running = sum(q['running_count'] for q in all_queues_info + [remote_queue_info or {'running_count': 0}])
+            total_pending = sum(q['pending_count'] for q in all_queues_info + [remote_queue_info or {'pending_count': 0}])
+
+            response = {
                 'queues': all_queues_info,
                 'total_running': total_running,
                 'total_pending': total_pending
-            })
+            }
+            if remote_queue_info is not None:
+                response['remote'] = remote_queue_info
+            if self.gpu_scheduler is not None:
+                response['scheduler'] = self.gpu_scheduler.get_stats()
+            return web.json_response(response)
+
+        @routes.get("/shared_pool")
+        async def get_shared_pool(request):
+            """多 GPU 共享权重池的统计：命中/未命中/淘汰次数、驻留字节数、各模型的使用者"""
+            stats = comfy.model_management.shared_pool_stats()
+            if stats is None:
+                return web.json_response({"error": "multi-GPU mode is not enabled"}, status=404)
+            return web.json_response(stats)
 
         @routes.post("/prompt")
         async def post_prompt(request):
             # ========== 新增：GPU 路由 ==========
-            # 解析目标 GPU ID
+            # 解析目标 GPU ID（未指定时可交给模型亲和调度器）
+            gpu_pinned = 'X-TARGET-GPU' in request.headers
             gpu_id_str = request.headers.get('X-TARGET-GPU', '0')
             try:
                 gpu_id = int(gpu_id_str)
@@ -797,7 +934,16 @@ class PromptServer():
 
                     # ========== 修改：选择队列 ==========
                     # 根据是否启用多 GPU 选择队列
-                    if hasattr(self, 'prompt_queues') and len(self.prompt_queues) > gpu_id:
+                    remote = not gpu_pinned and self.remote_queue is not None and is_remote_prompt(prompt)
+                    # 远程任务不经过 GPU 调度，不计入调度统计
+                    if not gpu_pinned and not remote and self.gpu_scheduler is not None:
+                        gpu_id = self.gpu_scheduler.select_gpu(prompt)
+                    if remote:
+                        # 只等待远程服务（API 节点）的任务不占用 GPU worker
+                        target_queue = self.remote_queue
+                        gpu_id = None
+                        logging.debug(f"Routing prompt {prompt_id[:8]} to the remote workers")
+                    elif hasattr(self, 'prompt_queues') and len(self.prompt_queues) > gpu_id:
                         target_queue = self.prompt_queues[gpu_id]
                         logging.debug(f"Routing prompt {prompt_id[:8]} to GPU {gpu_id}")
                     else:
@@ -805,7 +951,17 @@ class PromptServer():
                         target_queue = self.prompt_queue
                         gpu_id = 0
 
-                    target_queue.put((number, prompt_id, prompt, extra_data, outputs_to_execute, sensitive))
+                    # 显式指定 X-TARGET-GPU 的任务不参与 work stealing
+                    try:
+                        target_queue.put((number, prompt_id, prompt, extra_data, outputs_to_execute, sensitive), pinned=gpu_pinned)
+                    except ValueError as e:
+                        error = {
+                            "type": "duplicate_prompt_id",
+                            "message": "Prompt id is already queued",
+                            "details": str(e),
+                            "extra_info": {}
+                        }
+                        return web.json_response({"error": error, "node_errors": {}}, status=400)
                     # ==================================
 
                     response = {"prompt_id": prompt_id, "number": number, "node_errors": valid[3]}
@@ -830,30 +986,19 @@ class PromptServer():
         @routes.post("/queue")
         async def post_queue(request):
             # ========== 新增：支持多队列操作 ==========
-            # 解析目标 GPU ID
-            gpu_id_str = request.headers.get('X-TARGET-GPU', '0')
-            try:
-                gpu_id = int(gpu_id_str)
-                gpu_id = max(0, min(gpu_id, 3))  # 限制在 0-3
-            except ValueError:
-                gpu_id = 0
-
-            # 选择对应的队列
-            if hasattr(self, 'prompt_queues') and len(self.prompt_queues) > gpu_id:
-                target_queue = self.prompt_queues[gpu_id]
-            else:
-                target_queue = self.prompt_queue
+            # 未指定 X-TARGET-GPU 时操作所有队列，任务可能被调度或窃取到任意 GPU
+            _, queues = self.requested_queues(request)
             # ==========================================
 
             json_data =  await request.json()
             if "clear" in json_data:
                 if json_data["clear"]:
-                    target_queue.wipe_queue()
+                    for queue in queues:
+                        queue.wipe_queue()
             if "delete" in json_data:
                 to_delete = json_data['delete']
                 for id_to_delete in to_delete:
-                    delete_func = lambda a: a[1] == id_to_delete
-                    target_queue.delete_queue_item(delete_func)
+                    execution.delete_queue_item_by_id(queues, id_to_delete)
 
             return web.Response(status=200)
 
@@ -872,11 +1017,12 @@ class PromptServer():
 
                 if hasattr(self, 'prompt_queues'):
                     # 多 GPU 模式：检查所有队列
-                    for gpu_id, queue in enumerate(self.prompt_queues):
+                    for gpu_id, queue in enumerate(self.all_prompt_queues()):
                         currently_running, _ = queue.get_current_queue()
                         for item in currently_running:
                             if item[1] == prompt_id:
-                                logging.info(f"Interrupting prompt {prompt_id} on GPU {gpu_id}")
+                                where = "the remote workers" if queue is self.remote_queue else f"GPU {gpu_id}"
+                                logging.info(f"Interrupting prompt {prompt_id} on {where}")
                                 should_interrupt = True
                                 break
                         if should_interrupt:
@@ -907,10 +1053,12 @@ class PromptServer():
             json_data = await request.json()
             unload_models = json_data.get("unload_models", False)
             free_memory = json_data.get("free_memory", False)
-            if unload_models:
-                self.prompt_queue.set_flag("unload_models", unload_models)
-            if free_memory:
-                self.prompt_queue.set_flag("free_memory", free_memory)
+            # Every worker frees the memory of its own device
+            for queue in self.all_prompt_queues():
+                if unload_models:
+                    queue.set_flag("unload_models", unload_models)
+                if free_memory:
+                    queue.set_flag("free_memory", free_memory)
             return web.Response(status=200)
 
         @routes.post("/history")
@@ -972,14 +1120,49 @@ class PromptServer():
             web.static('/', self.web_root),
         ])
 
+    def all_prompt_queues(self):
+        """The GPU queues, followed by the queue of remote-only prompts when there is one."""
+        queues = list(getattr(self, 'prompt_queues', [self.prompt_queue]))
+        if self.remote_queue is not None:
+            queues.append(self.remote_queue)
+        return queues
+
+    def history_etag(self):
+        # Versions only grow, their sum changes with every change to any history
+        version = sum(queue.history_version for queue in self.all_prompt_queues())
+        return f'"{self.instance_id}-{version}"'
+
+    def requested_queues(self, request):
+        """
+        (gpu_id, queues) for a queue request: the queue of the GPU in the X-TARGET-GPU
+        header, or every queue including the remote one, with gpu_id None, when the
+        header isn't sent.
+        """
+        queues = list(getattr(self, 'prompt_queues', [self.prompt_queue]))
+        if 'X-TARGET-GPU' not in request.headers:
+            return None, self.all_prompt_queues()
+        try:
+            gpu_id = int(request.headers['X-TARGET-GPU'])
+            gpu_id = max(0, min(gpu_id, 3))  # 限制在 0-3
+        except ValueError:
+            gpu_id = 0
+        if gpu_id >= len(queues):
+            return gpu_id, [self.prompt_queue]
+        return gpu_id, [queues[gpu_id]]
+
     def get_queue_info(self):
         prompt_info = {}
         exec_info = {}
-        exec_info['queue_remaining'] = self.prompt_queue.get_tasks_remaining()
+        exec_info['queue_remaining'] = sum(queue.get_tasks_remaining() for queue in self.all_prompt_queues())
         prompt_info['exec_info'] = exec_info
         return prompt_info
 
     async def send(self, event, data, sid=None):
+        if isinstance(data, PendingPreview):
+            data = self.pending_previews.pop(data.key, None)
+            if data is None:
+                return
+            self.last_preview_time[sid] = self.loop.time()
         if event == BinaryEventTypes.UNENCODED_PREVIEW_IMAGE:
             await self.send_image(data, sid=sid)
         elif event == BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA:
@@ -1000,7 +1183,8 @@ class PromptServer():
         message.extend(data)
         return message
 
-    async def send_image(self, image_data, sid=None):
+    @staticmethod
+    def encode_preview_image(image_data):
         image_type = image_data[0]
         image = image_data[1]
         max_size = image_data[2]
@@ -1011,31 +1195,26 @@ class PromptServer():
                 resampling = Image.Resampling.LANCZOS
 
             image = ImageOps.contain(image, (max_size, max_size), resampling)
+
+        bytesIO = BytesIO()
+        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
+        return bytesIO.getvalue()
+
+    async def send_image(self, image_data, sid=None):
+        image_type = image_data[0]
         type_num = 1
         if image_type == "JPEG":
             type_num = 1
         elif image_type == "PNG":
             type_num = 2
 
-        bytesIO = BytesIO()
-        header = struct.pack(">I", type_num)
-        bytesIO.write(header)
-        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        preview_bytes = bytesIO.getvalue()
+        image_bytes = await self.loop.run_in_executor(self.preview_executor, self.encode_preview_image, image_data)
+        preview_bytes = bytearray(struct.pack(">I", type_num))
+        preview_bytes.extend(image_bytes)
         await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=sid)
 
     async def send_image_with_metadata(self, image_data, metadata=None, sid=None):
         image_type = image_data[0]
-        image = image_data[1]
-        max_size = image_data[2]
-        if max_size is not None:
-            if hasattr(Image, 'Resampling'):
-                resampling = Image.Resampling.BILINEAR
-            else:
-                resampling = Image.Resampling.LANCZOS
-
-            image = ImageOps.contain(image, (max_size, max_size), resampling)
-
         mimetype = "image/png" if image_type == "PNG" else "image/jpeg"
 
         # Prepare metadata
@@ -1044,14 +1223,11 @@ class PromptServer():
         metadata["image_type"] = mimetype
 
         # Serialize metadata as JSON
-        import json
         metadata_json = json.dumps(metadata).encode('utf-8')
         metadata_length = len(metadata_json)
 
         # Prepare image data
-        bytesIO = BytesIO()
-        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        image_bytes = bytesIO.getvalue()
+        image_bytes = await self.loop.run_in_executor(self.preview_executor, self.encode_preview_image, image_data)
 
         # Combine metadata and image
         combined_data = bytearray()
@@ -1082,11 +1258,50 @@ class PromptServer():
             await send_socket_catch_exception(self.sockets[sid].send_json, message)
 
     def send_sync(self, event, data, sid=None):
+        if event in PREVIEW_EVENTS:
+            self.loop.call_soon_threadsafe(self.queue_preview, event, data, sid)
+            return
         self.loop.call_soon_threadsafe(
             self.messages.put_nowait, (event, data, sid))
 
+    def queue_preview(self, event, data, sid=None):
+        key = preview_key(event, data, sid)
+        already_queued = key in self.pending_previews
+        self.pending_previews[key] = data
+        if already_queued:
+            return
+        delay = 0
+        if args.preview_max_fps > 0 and sid in self.last_preview_time:
+            delay = self.last_preview_time[sid] + 1.0 / args.preview_max_fps - self.loop.time()
+        if delay > 0:
+            self.loop.call_later(delay, self.messages.put_nowait, (event, PendingPreview(key), sid))
+        else:
+            self.messages.put_nowait((event, PendingPreview(key), sid))
+
+    def has_preview_subscriber(self, sid=None):
+        if sid is None:
+            return len(self.sockets) > 0
+        return sid in self.sockets
+
     def queue_updated(self):
-        self.send_sync("status", { "status": self.get_queue_info() })
+        self.loop.call_soon_threadsafe(self.queue_status)
+
+    def queue_status(self):
+        # Queue changes in quick succession share one status message, the status is
+        # read when it's sent instead of on every change.
+        if self.status_pending:
+            return
+        self.status_pending = True
+        delay = self.last_status_time + STATUS_MIN_INTERVAL - self.loop.time()
+        if delay > 0:
+            self.loop.call_later(delay, self.send_status)
+        else:
+            self.send_status()
+
+    def send_status(self):
+        self.status_pending = False
+        self.last_status_time = self.loop.time()
+        self.messages.put_nowait(("status", { "status": self.get_queue_info() }, None))
 
     async def publish_loop(self):
         while True:
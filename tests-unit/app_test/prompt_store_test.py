@@ -0,0 +1,89 @@
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+pytest.importorskip("alembic")
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import db  # noqa: E402
+from app.database.models import Base  # noqa: E402
+from app.database.prompt_store import PromptStore  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'comfyui.db'}")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(db, "Session", sessionmaker(bind=engine))
+    yield
+    engine.dispose()
+
+
+class FakeQueue:
+    def __init__(self):
+        self.items = []
+
+    def restore(self, item, pinned=False):
+        self.items.append((item, pinned))
+
+
+def queue_item(number, prompt_id):
+    return (number, prompt_id, {"1": {"class_type": "Node", "inputs": {}}}, {"client_id": "c"}, ["1"], {"api_key_comfy_org": "secret"})
+
+
+def history_entry(item):
+    return {"prompt": item[:5], "outputs": {"1": {"images": []}}, "status": None}
+
+
+def test_queued_prompts_are_restored(database):
+    store = PromptStore(max_history=10)
+    store.add("gpu0", queue_item(3, "a"))
+    store.add("gpu0", queue_item(1, "b"), pinned=True)
+    store.add("gpu1", queue_item(2, "c"))
+    store.add("gpu1", queue_item(4, "done"))
+    store.complete("gpu1", "done", history_entry(queue_item(4, "done")), store.next_history_id())
+    store.remove(["c"])
+    store.flush()
+
+    queues = {"gpu0": FakeQueue(), "remote": FakeQueue()}
+    assert PromptStore(max_history=10).restore(queues) == 4
+    assert [(item[1], pinned) for item, pinned in queues["gpu0"].items] == [("b", True), ("a", False)]
+    # sensitive extra data is never stored
+    assert queues["gpu0"].items[0][0][5] == {}
+    assert queues["remote"].items == []
+
+
+def test_history_pages_and_limit(database):
+    store = PromptStore(max_history=5)
+    for i in range(8):
+        item = queue_item(i, f"p{i}")
+        store.add("gpu0", item)
+        store.complete("gpu0", item[1], history_entry(item), store.next_history_id())
+    store.complete("gpu1", "other", history_entry(queue_item(9, "other")), store.next_history_id())
+
+    assert store.count_history("gpu0") == 5
+    assert list(store.get_history("gpu0")) == ["p3", "p4", "p5", "p6", "p7"]
+    assert list(store.get_history("gpu0", max_items=2)) == ["p6", "p7"]
+    assert list(store.get_history("gpu0", max_items=2, offset=1)) == ["p4", "p5"]
+    assert store.get_history_item("gpu0", "p7")["prompt"][1] == "p7"
+    assert store.get_history_item("gpu0", "other") is None
+
+    store.delete_history("gpu0", "p7")
+    assert store.get_history_item("gpu0", "p7") is None
+    store.delete_history("gpu0")
+    assert store.count_history("gpu0") == 0
+    assert store.count_history("gpu1") == 1
+
+
+def test_history_cursor_pages(database):
+    store = PromptStore(max_history=10)
+    ids = {}
+    for i in range(5):
+        ids[f"p{i}"] = store.next_history_id()
+        store.complete("gpu0" if i % 2 == 0 else "gpu1", f"p{i}", history_entry(queue_item(i, f"p{i}")), ids[f"p{i}"])
+
+    assert [x[1] for x in store.get_history_page("gpu0", max_items=2)] == ["p2", "p4"]
+    assert [x[1] for x in store.get_history_page("gpu0", before=ids["p2"])] == ["p0"]
+    assert [x[1] for x in store.get_history_page("gpu0", since=ids["p0"], max_items=1)] == ["p2"]
+    # ids continue after a restart
+    assert PromptStore(max_history=10).next_history_id() == ids["p4"] + 1
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+test_utils = pytest.importorskip("aiohttp.test_utils")
+helpers = pytest.importorskip("comfy_api_nodes.util._helpers")
+
+
+async def serve_client_ports():
+    ports = []
+
+    async def handler(request):
+        ports.append(request.transport.get_extra_info("peername")[1])
+        return aiohttp.web.json_response({"status": "ok"})
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/poll", handler)
+    server = test_utils.TestServer(app)
+    await server.start_server()
+    return server, ports
+
+
+def test_requests_reuse_connections():
+    async def run():
+        server, ports = await serve_client_ports()
+        try:
+            session = await helpers.get_http_session()
+            for _ in range(5):
+                async with session.get(server.make_url("/poll")) as resp:
+                    assert (await resp.json())["status"] == "ok"
+            assert await helpers.get_http_session() is session
+        finally:
+            await server.close()
+        return ports
+
+    ports = asyncio.run(run())
+    assert len(ports) == 5
+    assert len(set(ports)) == 1
+
+
+def test_session_per_loop_closed_on_shutdown():
+    async def get_session():
+        return await helpers.get_http_session()
+
+    first = asyncio.run(get_session())
+    second = asyncio.run(get_session())
+    assert first is not second
+    assert first.closed and second.closed
@@ -4,6 +4,7 @@ import tempfile
 import os
 import av
 import io
+import json
 from fractions import Fraction
 from comfy_api.input_impl.video_types import VideoFromFile, VideoFromComponents
 from comfy_api.util.video_types import VideoComponents
@@ -237,3 +238,121 @@ def test_duration_consistency(video_components):
     manual_duration = float(components.images.shape[0] / components.frame_rate)
 
     assert duration == pytest.approx(manual_duration)
+
+
+def create_long_test_video(path, frames=300, size=16, gop=30):
+    """Video whose frames have distinct colors, with a keyframe every gop frames"""
+    with av.open(path, mode="w") as container:
+        stream = container.add_stream("h264", rate=30)
+        stream.width = size
+        stream.height = size
+        stream.pix_fmt = "yuv420p"
+        stream.codec_context.gop_size = gop
+        for i in range(frames):
+            img = torch.zeros(size, size, 3, dtype=torch.uint8)
+            img[..., 0] = i % 256
+            img[..., 1] = (i * 7) % 256
+            frame = av.VideoFrame.from_ndarray(img.numpy(), format="rgb24")
+            container.mux(stream.encode(frame.reformat(format="yuv420p")))
+        container.mux(stream.encode(None))
+
+
+def test_video_frame_source_matches_full_decode(tmp_path):
+    """Seeking, slicing and strides give the same frames as decoding everything"""
+    path = str(tmp_path / "long.mp4")
+    create_long_test_video(path)
+    video = VideoFromFile(path)
+    images = video.get_components().images
+
+    frames = video.get_frames()
+    assert len(frames) == 300
+    assert torch.equal(frames[250], images[250])
+    assert torch.equal(frames[5], images[5])
+    assert torch.equal(frames[10:200:7], images[10:200:7])
+    assert torch.equal(frames[-1], images[-1])
+    assert frames.get_uint8(0).dtype == torch.uint8
+
+    selected = video.get_frames(start_frame=100, end_frame=160, stride=3)
+    assert len(selected) == 20
+    assert torch.equal(selected[:], images[100:160:3])
+    batches = list(selected.iter_batches(8))
+    assert [len(b) for b in batches] == [8, 8, 4]
+    assert torch.equal(batches[1][0], images[124])
+
+
+def test_video_frame_source_bytesio(simple_video_file):
+    """Frames of a BytesIO video can be read while the buffer is used elsewhere"""
+    with open(simple_video_file, "rb") as f:
+        buffer = io.BytesIO(f.read())
+    video = VideoFromFile(buffer)
+    frames = video.get_frames(stride=2)
+    buffer.seek(0, io.SEEK_END)
+    assert len(frames) == 2
+    assert torch.equal(frames[1], video.get_components().images[2])
+
+
+@pytest.mark.parametrize(
+    "format,codec",
+    [
+        ("mp4", "h264"),
+        ("mp4", "h265"),
+        ("webm", "vp9"),
+        ("webm", "av1"),
+        ("mkv", "auto"),
+    ],
+)
+def test_video_from_components_save_formats(format, codec):
+    """Frames, audio and metadata survive saving in every supported container"""
+    images = torch.rand(40, 16, 16, 3)
+    audio = AudioInput({"waveform": torch.rand(1, 2, 48000), "sample_rate": 48000})
+    video = VideoFromComponents(VideoComponents(images=images, audio=audio, frame_rate=Fraction(24)))
+    buffer = io.BytesIO()
+    video.save_to(buffer, format=format, codec=codec, metadata={"prompt": {"1": {}}})
+
+    buffer.seek(0)
+    with av.open(buffer, mode="r") as container:
+        assert len(container.streams.audio) == 1
+        # matroska reads tag names back in upper case
+        metadata = {k.lower(): v for k, v in container.metadata.items()}
+        assert json.loads(metadata["prompt"]) == {"1": {}}
+    loaded = VideoFromFile(buffer).get_components()
+    assert loaded.images.shape == images.shape
+    assert loaded.images.mean().item() == pytest.approx(images.mean().item(), abs=0.05)
+
+
+def test_video_from_components_save_rejects_unsupported_codec(video_components):
+    video = VideoFromComponents(video_components)
+    with pytest.raises(ValueError):
+        video.save_to(io.BytesIO(), format="webm", codec="h264")
+
+
+def saved_as(format, codec="auto"):
+    video = VideoFromComponents(VideoComponents(images=torch.rand(8, 16, 16, 3), audio=None, frame_rate=Fraction(24)))
+    buffer = io.BytesIO()
+    video.save_to(buffer, format=format, codec=codec)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize(
+    "source,format,codec,expected,copied",
+    [
+        (("mkv", "h264"), "webm", "auto", "vp9", False),
+        (("mkv", "h264"), "mkv", "auto", "h264", True),
+        (("mp4", "h265"), "mp4", "h265", "hevc", True),
+        (("webm", "vp9"), "mkv", "vp9", "vp9", True),
+    ],
+)
+def test_video_from_file_save_copies_compatible_streams(monkeypatch, source, format, codec, expected, copied):
+    """Streams are copied only when the target container can hold their codec"""
+    video = VideoFromFile(saved_as(*source))
+    reencoded = []
+    get_components_internal = video.get_components_internal
+    monkeypatch.setattr(video, "get_components_internal", lambda container: reencoded.append(True) or get_components_internal(container))
+    buffer = io.BytesIO()
+    video.save_to(buffer, format=format, codec=codec)
+
+    assert bool(reencoded) != copied
+    buffer.seek(0)
+    with av.open(buffer, mode="r") as container:
+        assert container.streams.video[0].codec_context.codec.canonical_name == expected
@@ -160,3 +160,56 @@ def test_base_path_change_clears_old(set_base_dir):
 
     for name in ["controlnet", "diffusion_models", "text_encoders"]:
         assert len(folder_paths.get_folder_paths(name)) == 2
+
+def test_file_index_relists_only_changed_dirs(temp_dir):
+    os.makedirs(os.path.join(temp_dir, "a"))
+    os.makedirs(os.path.join(temp_dir, "b"))
+    open(os.path.join(temp_dir, "a", "one.safetensors"), "w").close()
+    index = folder_paths.FileIndex()
+    files, dirs = index.scan(temp_dir)
+    assert set(files) == {os.path.join("a", "one.safetensors")}
+    assert len(dirs) == 3
+
+    open(os.path.join(temp_dir, "b", "two.safetensors"), "w").close()
+    os.utime(os.path.join(temp_dir, "b"), (0, os.path.getmtime(os.path.join(temp_dir, "b")) + 10))
+    with patch.object(index, "_list_dir", wraps=index._list_dir) as list_dir:
+        files, _ = index.scan(temp_dir)
+    assert [c.args[0] for c in list_dir.call_args_list] == [os.path.join(temp_dir, "b")]
+    assert set(files) == {os.path.join("a", "one.safetensors"), os.path.join("b", "two.safetensors")}
+
+
+def test_file_index_persistence(temp_dir):
+    root = os.path.join(temp_dir, "models")
+    os.makedirs(os.path.join(root, "sub"))
+    open(os.path.join(root, "sub", "model.safetensors"), "w").close()
+    db_path = os.path.join(temp_dir, "index.db")
+
+    index = folder_paths.FileIndex()
+    index.enable_persistence(db_path)
+    index.scan(root)
+
+    reloaded = folder_paths.FileIndex()
+    reloaded.enable_persistence(db_path)
+    with patch.object(reloaded, "_list_dir", side_effect=AssertionError("directory relisted")):
+        files, _ = reloaded.scan(root)
+    assert files == [os.path.join("sub", "model.safetensors")]
+
+
+def test_get_full_path_uses_file_list(temp_dir, clear_folder_paths):
+    first = os.path.join(temp_dir, "first")
+    second = os.path.join(temp_dir, "second")
+    os.makedirs(first)
+    os.makedirs(os.path.join(second, "sub"))
+    open(os.path.join(second, "sub", "model.safetensors"), "w").close()
+    open(os.path.join(first, "shared.safetensors"), "w").close()
+    open(os.path.join(second, "shared.safetensors"), "w").close()
+    folder_paths.folder_names_and_paths["test_models"] = ([first, second], folder_paths.supported_pt_extensions)
+
+    assert folder_paths.get_filename_list("test_models") == ["shared.safetensors", os.path.join("sub", "model.safetensors")]
+    with patch("os.path.isfile", side_effect=AssertionError("filesystem lookup")):
+        assert folder_paths.get_full_path("test_models", os.path.join("sub", "model.safetensors")) == os.path.join(second, "sub", "model.safetensors")
+        assert folder_paths.get_full_path("test_models", "shared.safetensors") == os.path.join(first, "shared.safetensors")
+
+    # not part of the listing, falls back to checking the folders
+    open(os.path.join(first, "config.yaml"), "w").close()
+    assert folder_paths.get_full_path("test_models", "config.yaml") == os.path.join(first, "config.yaml")
@@ -0,0 +1,97 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+import comfy.lora  # noqa: E402
+import comfy.model_management  # noqa: E402
+import comfy.model_patcher  # noqa: E402
+from comfy.weight_adapter import LoRAAdapter, LoHaAdapter  # noqa: E402
+
+
+def lora_adapter(generator, out_dim, in_dim, rank, alpha=None):
+    up = torch.randn(out_dim, rank, generator=generator, dtype=torch.float16)
+    down = torch.randn(rank, in_dim, generator=generator, dtype=torch.float16)
+    return LoRAAdapter(set(), (up, down, alpha, None, None, None))
+
+
+def per_key(patches, weight):
+    return comfy.lora.calculate_weight(patches, weight.to(torch.float32, copy=True), "key")
+
+
+def test_matches_per_key_merge():
+    generator = torch.Generator().manual_seed(0)
+    items = []
+    expected = {}
+    for i in range(7):
+        shape = (16, 8) if i % 2 == 0 else (8, 4, 1, 1)
+        weight = torch.randn(shape, generator=generator).to(torch.float16)
+        patches = [(0.7, lora_adapter(generator, shape[0], 8 if i % 2 == 0 else 4, 4, alpha=2.0), 1.0, None, None)]
+        if i % 3 == 0:
+            # LoRA stack, merged as one matmul of the concatenated ranks
+            patches.append((-0.3, lora_adapter(generator, shape[0], 8 if i % 2 == 0 else 4, 2), 1.0, None, None))
+        factors = comfy.lora.lora_update_factors(patches, weight)
+        assert factors is not None
+        items.append((f"k{i}", weight, factors))
+        expected[f"k{i}"] = per_key(patches, weight)
+
+    # tiny batches, so buffers are reused between batches
+    merged = {}
+    for key, weight in comfy.lora.calculate_weights_batched(items, max_batch_bytes=1024):
+        merged[key] = weight.clone()
+    assert merged.keys() == expected.keys()
+    for key in expected:
+        assert merged[key].shape == expected[key].shape
+        torch.testing.assert_close(merged[key], expected[key], rtol=1e-4, atol=1e-4)
+
+
+def test_other_patches_are_not_batched():
+    generator = torch.Generator().manual_seed(0)
+    weight = torch.randn(16, 8, generator=generator)
+    lora = lora_adapter(generator, 16, 8, 4)
+    assert comfy.lora.lora_update_factors([(1.0, lora, 0.5, None, None)], weight) is None
+    assert comfy.lora.lora_update_factors([(1.0, lora, 1.0, (0, 0, 8), None)], weight) is None
+    assert comfy.lora.lora_update_factors([(1.0, ("diff", (torch.zeros(16, 8),)), 1.0, None, None)], weight) is None
+    loha = LoHaAdapter(set(), (torch.zeros(16, 2), torch.zeros(2, 8), None, torch.zeros(16, 2), torch.zeros(2, 8), None, None, None))
+    assert comfy.lora.lora_update_factors([(1.0, lora, 1.0, None, None), (1.0, loha, 1.0, None, None)], weight) is None
+    # wrong shape
+    assert comfy.lora.lora_update_factors([(1.0, lora, 1.0, None, None)], torch.zeros(8, 16)) is None
+
+
+def test_model_patcher_load_uses_batched_merge(monkeypatch):
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(*[torch.nn.Linear(8, 8) for _ in range(4)])
+    patcher = comfy.model_patcher.ModelPatcher(model, torch.device("cpu"), torch.device("cpu"))
+    original = {k: v.clone() for k, v in model.state_dict().items()}
+    generator = torch.Generator().manual_seed(1)
+    patches = {f"{i}.weight": lora_adapter(generator, 8, 8, 2) for i in range(4)}
+    patches["0.bias"] = ("diff", (torch.ones(8),))
+    patcher.add_patches(patches, 0.5)
+    expected = {k: per_key(patcher.patches[k], original[k]) for k in patches}
+
+    calls = []
+    batched = comfy.lora.calculate_weights_batched
+    monkeypatch.setattr(comfy.lora, "calculate_weights_batched", lambda items, **kwargs: calls.append(len(items)) or batched(items, **kwargs))
+    patcher.patch_model()
+    assert calls == [4]
+    for k in patches:
+        torch.testing.assert_close(model.state_dict()[k], expected[k], rtol=1e-5, atol=1e-5)
+
+    patcher.unpatch_model()
+    for k, v in original.items():
+        assert torch.equal(model.state_dict()[k], v)
+
+
+def test_batches_fit_in_free_memory(monkeypatch):
+    generator = torch.Generator().manual_seed(0)
+    items = []
+    for i in range(6):
+        weight = torch.randn(16, 8, generator=generator)
+        items.append((f"k{i}", weight, comfy.lora.lora_update_factors([(1.0, lora_adapter(generator, 16, 8, 4), 1.0, None, None)], weight)))
+    item_bytes = (16 * 8 + 16 * 4 + 4 * 8) * 4
+    # room for two sets of buffers of two weights each
+    reserve = comfy.model_management.extra_reserved_memory()
+    monkeypatch.setattr(comfy.model_management, "get_free_memory", lambda *args, **kwargs: reserve + 4 * item_bytes)
+    calls = []
+    baddbmm = torch.baddbmm
+    monkeypatch.setattr(torch, "baddbmm", lambda input, *args, **kwargs: calls.append(input.shape[0]) or baddbmm(input, *args, **kwargs))
+    assert len(list(comfy.lora.calculate_weights_batched(items))) == 6
+    assert calls == [2, 2, 2]
@@ -0,0 +1,42 @@
+import json
+import os
+import struct
+
+import pytest
+
+pytest.importorskip("torch")
+import comfy.utils  # noqa: E402
+
+
+def write_safetensors(path, data: bytes, name="weight"):
+    header = json.dumps({name: {"dtype": "U8", "shape": [len(data)], "data_offsets": [0, len(data)]}}).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(data)
+
+
+def test_same_architecture_different_weights(tmp_path):
+    a = str(tmp_path / "a.safetensors")
+    b = str(tmp_path / "b.safetensors")
+    write_safetensors(a, bytes(range(256)) * 64)
+    write_safetensors(b, bytes(reversed(range(256))) * 64)
+    assert comfy.utils.weights_file_hash(a) != comfy.utils.weights_file_hash(b)
+
+
+def test_identical_content_same_hash(tmp_path):
+    a = str(tmp_path / "a.safetensors")
+    b = str(tmp_path / "copy.safetensors")
+    data = os.urandom(comfy.utils.WEIGHTS_HASH_SAMPLES * comfy.utils.WEIGHTS_HASH_SAMPLE_SIZE * 2)
+    write_safetensors(a, data)
+    write_safetensors(b, data)
+    assert comfy.utils.weights_file_hash(a) == comfy.utils.weights_file_hash(b)
+
+
+def test_cache_invalidated_on_change(tmp_path):
+    a = str(tmp_path / "a.safetensors")
+    write_safetensors(a, b"\x00" * 1024)
+    first = comfy.utils.weights_file_hash(a)
+    write_safetensors(a, b"\x01" * 1024, name="other")
+    os.utime(a, ns=(0, os.stat(a).st_mtime_ns + 1_000_000))
+    assert comfy.utils.weights_file_hash(a) != first
@@ -0,0 +1,33 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+Image = pytest.importorskip("PIL.Image")
+from comfy.output_writer import OutputWriter  # noqa: E402
+
+
+def test_writes_batch_in_parallel(tmp_path):
+    writer = OutputWriter(max_workers=2)
+    images = torch.rand(5, 16, 16, 3)
+    paths = [str(tmp_path / f"out_{i:05}_.png") for i in range(len(images))]
+    writer.wait([writer.save_image(image, path, compress_level=1) for image, path in zip(images, paths)])
+    for path in paths:
+        with Image.open(path) as img:
+            assert img.size == (16, 16)
+        assert writer.pending_write(path) is None
+
+
+def test_write_errors_are_raised(tmp_path):
+    writer = OutputWriter(max_workers=1)
+    future = writer.save_image(torch.rand(4, 4, 3), str(tmp_path / "missing" / "out.png"))
+    with pytest.raises(OSError):
+        writer.wait([future])
+
+
+def test_counters_of_queued_writes_are_not_reused(tmp_path):
+    writer = OutputWriter(max_workers=1)
+    # nothing on disk yet, both saves see counter 1
+    assert writer.reserve_counters(str(tmp_path), "ComfyUI", 1, 3) == 1
+    assert writer.reserve_counters(str(tmp_path), "ComfyUI", 1, 2) == 4
+    assert writer.reserve_counters(str(tmp_path), "Other", 1, 1) == 1
+    # files written by something else in the meantime
+    assert writer.reserve_counters(str(tmp_path), "ComfyUI", 10, 1) == 10
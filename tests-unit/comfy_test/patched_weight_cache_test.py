@@ -0,0 +1,84 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+import comfy.lora  # noqa: E402
+import comfy.model_patcher  # noqa: E402
+import comfy.patched_weight_cache  # noqa: E402
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = comfy.patched_weight_cache.PatchedWeightCache(1024 ** 2)
+    monkeypatch.setattr(comfy.patched_weight_cache, "_cache", cache)
+    return cache
+
+
+def make_patcher():
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(8, 8))
+    patcher = comfy.model_patcher.ModelPatcher(model, torch.device("cpu"), torch.device("cpu"))
+    patcher.model_identity = "base"
+    return patcher
+
+
+def lora(seed):
+    generator = torch.Generator().manual_seed(seed)
+    return {"0.weight": ("diff", (torch.randn(8, 8, generator=generator),))}
+
+
+def patched(patcher):
+    patcher.patch_model()
+    weight = patcher.model[0].weight.detach().clone()
+    patcher.unpatch_model()
+    return weight
+
+
+def test_same_stack_is_served_from_cache(cache, monkeypatch):
+    base = make_patcher()
+    first = base.clone()
+    first.add_patches(lora(1), 0.5, patches_identity="lora1")
+    expected = patched(first)
+    assert cache.stats()["misses"] == 1
+
+    # the same LoRA loaded again gets new tensors and a new patches_uuid
+    second = base.clone()
+    second.add_patches(lora(1), 0.5, patches_identity="lora1")
+    monkeypatch.setattr(comfy.lora, "calculate_weight", lambda *args, **kwargs: pytest.fail("merged again"))
+    assert torch.equal(patched(second), expected)
+    assert cache.stats()["hits"] == 1
+
+    # the model gets a copy, changing it doesn't change the cached weight
+    second.patch_model()
+    with torch.no_grad():
+        second.model[0].weight.zero_()
+    second.unpatch_model()
+    assert torch.equal(patched(second), expected)
+
+
+def test_strengths_and_unidentified_patches_are_not_mixed_up(cache):
+    base = make_patcher()
+    a = base.clone()
+    a.add_patches(lora(1), 0.5, patches_identity="lora1")
+    b = base.clone()
+    b.add_patches(lora(1), 1.0, patches_identity="lora1")
+    assert not torch.equal(patched(a), patched(b))
+    assert cache.stats()["entries"] == 2
+
+    c = a.clone()
+    c.add_patches(lora(2))
+    assert c.patches_identity is None
+    patched(c)
+    assert cache.stats()["entries"] == 2
+
+
+def test_lru_eviction_by_bytes():
+    cache = comfy.patched_weight_cache.PatchedWeightCache(3 * 64 * 4)
+    for i in range(4):
+        cache.put(("base", i), torch.zeros(64))
+    assert cache.get(("base", 0)) is None
+    cache.get(("base", 1))
+    cache.put(("base", 4), torch.zeros(64))
+    assert cache.get(("base", 1)) is not None
+    assert cache.get(("base", 2)) is None
+    assert cache.stats()["bytes_resident"] == 3 * 64 * 4
+    assert cache.stats()["evictions"] == 2
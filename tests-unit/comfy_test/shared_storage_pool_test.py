@@ -0,0 +1,47 @@
+import gc
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+import comfy.model_management  # noqa: E402
+import comfy.model_patcher  # noqa: E402
+
+
+@pytest.fixture
+def shared_pool(monkeypatch):
+    # Room for one of the test models, as in multi-GPU mode
+    pool = comfy.model_management.SharedStoragePool(400)
+    monkeypatch.setattr(comfy.model_management, "_use_shared_cache", True)
+    monkeypatch.setattr(comfy.model_management, "_shared_storage_pool", pool, raising=False)
+    monkeypatch.setattr(comfy.model_management, "_shared_model_cache", [], raising=False)
+    monkeypatch.setattr(comfy.model_management, "_model_cache_lock", threading.RLock(), raising=False)
+    monkeypatch.setattr(comfy.model_management, "_model_loading_locks", {}, raising=False)
+    return pool
+
+
+def make_patcher(identity):
+    model = torch.nn.Sequential(torch.nn.Linear(8, 8))
+    patcher = comfy.model_patcher.ModelPatcher(model, torch.device("cpu"), torch.device("cpu"))
+    patcher.model_identity = identity
+    return patcher
+
+
+def test_dead_model_releases_its_pool_entry(shared_pool):
+    patcher = make_patcher("a")
+    comfy.model_management.load_models_gpu([patcher])
+    loaded = comfy.model_management._shared_model_cache[0]
+    assert loaded.model_hash in shared_pool
+    assert len(shared_pool.users[loaded.model_hash]) == 1
+
+    # the model is dropped without being unloaded, its finalizer cleans up
+    model_hash = loaded.model_hash
+    del patcher, loaded
+    gc.collect()
+    assert comfy.model_management._shared_model_cache == []
+    assert model_hash not in shared_pool.users
+
+    other = make_patcher("b")
+    comfy.model_management.load_models_gpu([other])
+    assert model_hash not in shared_pool
+    assert shared_pool.get_stats()["evictions"] == 1
@@ -0,0 +1,110 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+import comfy.model_patcher  # noqa: E402
+import comfy.ops  # noqa: E402
+import comfy.weight_prefetch  # noqa: E402
+from comfy.cli_args import args  # noqa: E402
+
+
+class Model(torch.nn.Module):
+    def __init__(self, layers):
+        super().__init__()
+        self.layers = torch.nn.ModuleList([comfy.ops.disable_weight_init.Linear(8, 8) for _ in range(layers)])
+        generator = torch.Generator().manual_seed(0)
+        for layer in self.layers:
+            layer.weight.data.copy_(torch.randn(8, 8, generator=generator))
+            layer.bias.data.copy_(torch.randn(8, generator=generator))
+        self.skip = None
+
+    def forward(self, x):
+        for i, layer in enumerate(self.layers):
+            if i != self.skip:
+                x = layer(x)
+        return x
+
+
+@pytest.fixture
+def prefetch(monkeypatch):
+    monkeypatch.setattr(args, "prefetch_weights", 2)
+
+
+def lowvram_patcher():
+    model = Model(6)
+    patcher = comfy.model_patcher.ModelPatcher(model, torch.device("cpu"), torch.device("cpu"))
+    patcher.add_patches({f"layers.{i}.weight": ("diff", (torch.full((8, 8), 0.1 * i),)) for i in range(6)})
+    return patcher
+
+
+def reference(model, x):
+    for i, layer in enumerate(model.layers):
+        if i != model.skip:
+            x = torch.nn.functional.linear(x, layer.weight + 0.1 * i, layer.bias)
+    return x
+
+
+def test_prefetched_weights_are_used_after_the_first_step(prefetch):
+    patcher = lowvram_patcher()
+    model = patcher.model
+    patcher.patch_model(device_to=torch.device("cpu"), lowvram_model_memory=1)
+    prefetcher = model.weight_prefetcher
+    assert all(layer.weight_prefetcher is prefetcher for layer in model.layers)
+
+    x = torch.randn(2, 8)
+    with torch.no_grad():
+        for _ in range(3):
+            torch.testing.assert_close(model(x), reference(model, x))
+    # only the first layer of the second step wasn't prefetched, the order wasn't known yet
+    assert prefetcher.stats()["modules"] == 6
+    assert prefetcher.stats()["hits"] == 11
+    assert prefetcher.stats()["misses"] == 1
+    assert prefetcher.staged_bytes <= prefetcher.max_bytes
+
+    patcher.unpatch_model()
+    assert not hasattr(model, "weight_prefetcher")
+    assert all(layer.weight_prefetcher is None for layer in model.layers)
+
+
+def test_skipped_layers_are_misses(prefetch):
+    patcher = lowvram_patcher()
+    model = patcher.model
+    patcher.patch_model(device_to=torch.device("cpu"), lowvram_model_memory=1)
+    prefetcher = model.weight_prefetcher
+
+    x = torch.randn(2, 8)
+    with torch.no_grad():
+        model(x)
+        model.skip = 2
+        torch.testing.assert_close(model(x), reference(model, x))
+        assert prefetcher.stats()["misses"] == 1
+        assert prefetcher.stats()["hits"] == 4
+        # the weights of the skipped layer were dropped, the first layers of the next step are prefetched
+        assert list(prefetcher.staged) == [model.layers[0], model.layers[1]]
+    patcher.unpatch_model()
+
+
+def test_disabled_by_default():
+    patcher = lowvram_patcher()
+    patcher.patch_model(device_to=torch.device("cpu"), lowvram_model_memory=1)
+    assert not hasattr(patcher.model, "weight_prefetcher")
+    assert all(layer.weight_prefetcher is None for layer in patcher.model.layers)
+    patcher.unpatch_model()
+
+
+def test_budget_counts_the_cast_weights(prefetch):
+    patcher = lowvram_patcher()
+    model = patcher.model
+    model.half()
+    model.manual_cast_dtype = torch.float32
+    patcher.patch_model(device_to=torch.device("cpu"), lowvram_model_memory=1)
+    prefetcher = model.weight_prefetcher
+    # two float32 layers, not their float16 storage
+    assert prefetcher.max_bytes == 2 * (8 * 8 + 8) * 4
+
+    x = torch.randn(2, 8)
+    with torch.no_grad():
+        for _ in range(2):
+            model(x)
+    assert [staged[4] for staged in prefetcher.staged.values()] == [(8 * 8 + 8) * 4] * 2
+    assert prefetcher.staged_bytes == prefetcher.max_bytes
+    patcher.unpatch_model()
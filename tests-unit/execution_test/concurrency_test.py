@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+import pytest
+
+from comfy_execution.concurrency import DEFAULT_LIMITS, NodeConcurrency, parse_limits
+
+
+def test_parse_limits():
+    assert parse_limits("") == DEFAULT_LIMITS
+    limits = parse_limits("cpu=8, network=32")
+    assert limits == {"gpu": DEFAULT_LIMITS["gpu"], "cpu": 8, "network": 32}
+    with pytest.raises(ValueError):
+        parse_limits("disk=2")
+
+
+class ThreadSafeNode:
+    THREAD_SAFE = True
+
+
+class ApiNode:
+    RESOURCE_CLASS = "network"
+
+
+def test_node_classification():
+    assert NodeConcurrency.runs_in_thread(ThreadSafeNode)
+    assert not NodeConcurrency.runs_in_thread(ApiNode)
+    assert NodeConcurrency.resource_class(ThreadSafeNode, False) == "cpu"
+    assert NodeConcurrency.resource_class(ThreadSafeNode, True) == "network"
+    assert NodeConcurrency.resource_class(ApiNode, False) == "network"
+
+
+def test_limit_per_resource_class():
+    concurrency = NodeConcurrency(parse_limits("network=2"))
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with concurrency.limit("network"):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def run():
+        await asyncio.gather(*[call() for _ in range(6)])
+
+    asyncio.run(run())
+    # a new event loop gets its own semaphores
+    asyncio.run(run())
+    assert peak == 2
+
+
+def test_run_in_thread():
+    pytest.importorskip("torch")
+    concurrency = NodeConcurrency(parse_limits(""))
+
+    async def run():
+        return await asyncio.gather(*[concurrency.run_in_thread("cpu", threading.get_ident) for _ in range(4)])
+
+    thread_ids = asyncio.run(run())
+    assert threading.get_ident() not in thread_ids
+
+
+def test_every_executor_owns_its_pool(monkeypatch):
+    import comfy.cli_args
+    from comfy_execution.concurrency import create_node_concurrency
+    monkeypatch.setattr(comfy.cli_args.args, "node_concurrency", "cpu=2")
+    a = create_node_concurrency()
+    b = create_node_concurrency()
+    assert a.pool is not b.pool
+    assert a.pool._max_workers == 2 + DEFAULT_LIMITS["gpu"]
+
+    monkeypatch.setattr(comfy.cli_args.args, "node_concurrency", None)
+    assert create_node_concurrency() is None
@@ -0,0 +1,24 @@
+import pytest
+
+
+@pytest.fixture
+def node_classes(monkeypatch):
+    """
+    Registers stand-in node classes for the test, by class_type and RETURN_TYPES, e.g.
+    node_classes(TestImageNode=("IMAGE", "MASK")). The output cache tiers look up the
+    output types of a result by its class_type.
+    """
+    nodes = pytest.importorskip("nodes")
+
+    def register(**return_types):
+        for class_type, types in return_types.items():
+            monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, class_type, type(class_type, (), {"RETURN_TYPES": types}))
+    return register
+
+
+@pytest.fixture
+def make_key():
+    """Builds an input signature cache key, e.g. make_key("TestImageNode", seed=1)."""
+    def make_key(class_type, **inputs):
+        return frozenset([("class_type", class_type), *inputs.items()])
+    return make_key
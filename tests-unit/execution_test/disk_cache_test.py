@@ -0,0 +1,56 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+caching = pytest.importorskip("comfy_execution.caching")
+
+
+@pytest.fixture
+def image_key(node_classes, make_key):
+    node_classes(TestImageNode=("IMAGE", "MASK"), TestModelNode=("MODEL",))
+    return lambda seed: make_key("TestImageNode", seed=seed, denoise=0.5)
+
+
+def test_canonical_key_is_order_independent():
+    a = frozenset([("a", 1), ("b", "x"), ("c", frozenset([1.0, 2]))])
+    b = frozenset([("c", frozenset([2, 1.0])), ("b", "x"), ("a", 1)])
+    assert caching.canonical_key(a) == caching.canonical_key(b)
+    assert caching.canonical_key((1,)) != caching.canonical_key((1.0,))
+    with pytest.raises(caching.NotSerializable):
+        caching.canonical_key((caching.Unhashable(),))
+    with pytest.raises(caching.NotSerializable):
+        caching.canonical_key((float("nan"),))
+
+
+def test_roundtrip_survives_new_instance(tmp_path, image_key):
+    cache = caching.DiskCache(str(tmp_path), 1024 ** 3)
+    image = torch.rand(1, 8, 8, 3)
+    mask = torch.zeros(8, 8)
+    cache.put(image_key(1), "TestImageNode", (None, [[image], [mask]]))
+    cache.flush()
+
+    reloaded = caching.DiskCache(str(tmp_path), 1024 ** 3)
+    ui, outputs = reloaded.get(image_key(1))
+    assert ui is None
+    assert torch.equal(outputs[0][0], image)
+    assert torch.equal(outputs[1][0], mask)
+    assert reloaded.get(image_key(2)) is None
+
+
+def test_skips_unsupported_results(tmp_path, image_key):
+    cache = caching.DiskCache(str(tmp_path), 1024 ** 3)
+    cache.put(image_key(1), "TestModelNode", (None, [[object()]]))
+    cache.put(image_key(2), "TestImageNode", ({"images": []}, [[torch.zeros(1)]]))
+    cache.put(image_key(3), "TestImageNode", (None, [[object()]]))
+    cache.flush()
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_evicts_least_recently_used(tmp_path, image_key):
+    entry_size = 64 * 1024 * 4
+    cache = caching.DiskCache(str(tmp_path), int(entry_size * 2.5))
+    for seed in range(3):
+        cache.put(image_key(seed), "TestImageNode", (None, [[torch.zeros(64 * 1024)]]))
+        cache.flush()
+    assert cache.get(image_key(0)) is None
+    assert cache.get(image_key(2)) is not None
+    assert cache.get_stats()["entries"] == 2
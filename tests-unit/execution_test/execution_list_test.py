@@ -0,0 +1,87 @@
+import asyncio
+import random
+
+import pytest
+
+graph = pytest.importorskip("comfy_execution.graph")
+
+
+class Node:
+    FUNCTION = "run"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"optional": {f"in{i}": ("*",) for i in range(4)}}
+
+    def run(self, **kwargs):
+        pass
+
+
+class OutputNode(Node):
+    OUTPUT_NODE = True
+
+
+class AsyncNode(Node):
+    async def run(self, **kwargs):
+        pass
+
+
+@pytest.fixture
+def node_classes(monkeypatch):
+    for name, cls in [("TestNode", Node), ("TestOutputNode", OutputNode), ("TestAsyncNode", AsyncNode)]:
+        monkeypatch.setitem(graph.nodes.NODE_CLASS_MAPPINGS, name, cls)
+
+
+class NoCache:
+    def get(self, node_id):
+        return None
+
+    def set(self, node_id, value):
+        pass
+
+
+def random_prompt(rng, size):
+    prompt = {}
+    for i in range(size):
+        class_type = rng.choices(["TestNode", "TestOutputNode", "TestAsyncNode"], weights=[8, 2, 1])[0]
+        inputs = {}
+        for j in range(rng.randint(0, min(i, 4))):
+            inputs[f"in{j}"] = [str(rng.randrange(i)), 0]
+        prompt[str(i)] = {"class_type": class_type, "inputs": inputs}
+    return prompt
+
+
+def test_ready_queue_matches_ux_friendly_pick(node_classes):
+    rng = random.Random(0)
+    for _ in range(20):
+        prompt = random_prompt(rng, 60)
+        execution_list = graph.ExecutionList(graph.DynamicPrompt(prompt), NoCache())
+        for node_id, node in prompt.items():
+            if node["class_type"] == "TestOutputNode":
+                execution_list.add_node(node_id)
+
+        executed = []
+        while not execution_list.is_empty():
+            expected = execution_list.ux_friendly_pick_node(execution_list.get_ready_nodes())
+            node_id, error, _ = asyncio.run(execution_list.stage_node_execution())
+            assert error is None
+            assert node_id == expected
+            execution_list.complete_node_execution()
+            executed.append(node_id)
+        assert len(executed) == len(set(executed))
+
+
+def test_external_block_requeues_node(node_classes):
+    prompt = {
+        "1": {"class_type": "TestNode", "inputs": {}},
+        "2": {"class_type": "TestOutputNode", "inputs": {"in0": ["1", 0]}},
+    }
+    execution_list = graph.ExecutionList(graph.DynamicPrompt(prompt), NoCache())
+    execution_list.add_node("2")
+    node_id, _, _ = asyncio.run(execution_list.stage_node_execution())
+    assert node_id == "1"
+    unblock = execution_list.add_external_block("1")
+    execution_list.unstage_node_execution()
+    assert execution_list.peek_ready_node() is None
+    unblock()
+    assert execution_list.peek_ready_node() == "1"
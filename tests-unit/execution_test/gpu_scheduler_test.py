@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+import folder_paths
+from comfy_execution.gpu_scheduler import ModelAffinityScheduler, is_remote_prompt, prompt_model_files, steal_prompt
+
+
+class FakeQueue:
+    def __init__(self, remaining=0):
+        self.remaining = remaining
+
+    def get_tasks_remaining(self):
+        return self.remaining
+
+
+@pytest.fixture
+def model_dirs(tmp_path, monkeypatch):
+    paths = {}
+    for folder, name in [("checkpoints", "a.safetensors"), ("checkpoints", "b.safetensors"), ("loras", "style.safetensors")]:
+        d = tmp_path / folder
+        d.mkdir(exist_ok=True)
+        (d / name).write_bytes(b"0")
+        monkeypatch.setitem(folder_paths.folder_names_and_paths, folder, ([str(d)], folder_paths.supported_pt_extensions))
+        paths[name] = os.path.join(str(d), name)
+    return paths
+
+
+def make_prompt(ckpt, lora=None):
+    prompt = {"1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": ckpt}}}
+    if lora is not None:
+        prompt["2"] = {"class_type": "LoraLoader", "inputs": {"lora_name": lora, "model": ["1", 0], "clip": ["1", 1]}}
+    return prompt
+
+
+def test_prompt_model_files(model_dirs):
+    files = prompt_model_files(make_prompt("a.safetensors", "style.safetensors"))
+    assert files == {model_dirs["a.safetensors"]: 4, model_dirs["style.safetensors"]: 1}
+    assert prompt_model_files(make_prompt("missing.safetensors")) == {}
+
+
+def test_routes_to_gpu_holding_model(model_dirs):
+    resident = {0: {model_dirs["b.safetensors"]}, 2: {model_dirs["a.safetensors"]}}
+    scheduler = ModelAffinityScheduler([FakeQueue(), FakeQueue(), FakeQueue(1)], resident_files=lambda: resident)
+    assert scheduler.select_gpu(make_prompt("a.safetensors")) == 2
+    assert scheduler.select_gpu(make_prompt("b.safetensors")) == 0
+    assert scheduler.get_stats()["affinity_hits"] == 2
+
+
+def test_falls_back_to_least_loaded(model_dirs):
+    resident = {0: {model_dirs["a.safetensors"]}}
+    queues = [FakeQueue(5), FakeQueue(2), FakeQueue(1)]
+    scheduler = ModelAffinityScheduler(queues, resident_files=lambda: resident, max_queue_skew=2)
+    # GPU 0 holds the model but is too far behind the least loaded queue
+    assert scheduler.select_gpu(make_prompt("a.safetensors")) == 2
+    # nothing resident anywhere
+    assert scheduler.select_gpu(make_prompt("b.safetensors")) == 2
+    assert scheduler.get_stats()["fallbacks"] == 2
+
+
+def test_prefers_checkpoint_over_lora(model_dirs):
+    resident = {0: {model_dirs["style.safetensors"]}, 1: {model_dirs["a.safetensors"]}}
+    scheduler = ModelAffinityScheduler([FakeQueue(), FakeQueue()], resident_files=lambda: resident)
+    assert scheduler.select_gpu(make_prompt("a.safetensors", "style.safetensors")) == 1
+
+
+class QueueServer:
+    def queue_updated(self):
+        pass
+
+
+def make_queues(n):
+    # execution imports torch, so the queue is only available with the full environment
+    execution = pytest.importorskip("execution")
+    return [execution.PromptQueue(QueueServer()) for _ in range(n)]
+
+
+def queue_item(number, prompt_id, prompt=None):
+    return (number, prompt_id, prompt or {}, {}, [], {})
+
+
+def test_steal_skips_pinned_and_idle_queues():
+    queues = make_queues(3)
+    queues[1].put(queue_item(0, "running"))
+    queues[1].get()
+    queues[1].put(queue_item(1, "pinned"), pinned=True)
+    assert steal_prompt(0, queues, resident_files=lambda: {}) is None
+
+    queues[1].put(queue_item(2, "free"))
+    item = steal_prompt(0, queues, resident_files=lambda: {})
+    assert item[1] == "free"
+    assert [x[1] for x in queues[0].queue] == ["free"]
+    assert [x[1] for x in queues[1].queue] == ["pinned"]
+
+    # the worker of queue 2 is idle, it will pick up its own work
+    queues[2].put(queue_item(3, "idle"))
+    assert steal_prompt(0, queues, resident_files=lambda: {}) is None
+
+
+def test_stolen_prompt_can_be_deleted():
+    execution = pytest.importorskip("execution")
+    queues = make_queues(2)
+    queues[0].put(queue_item(0, "running"))
+    queues[0].get()
+    queues[0].put(queue_item(1, "stolen"))
+    assert steal_prompt(1, queues, resident_files=lambda: {})[1] == "stolen"
+    assert not queues[0].delete_queue_item_by_id("stolen")
+
+    assert execution.delete_queue_item_by_id(queues, "stolen")
+    assert all(len(queue.queue) == 0 for queue in queues)
+    assert not execution.delete_queue_item_by_id(queues, "stolen")
+
+
+def test_steal_prefers_resident_models(model_dirs):
+    queues = make_queues(2)
+    queues[1].put(queue_item(0, "running"))
+    queues[1].get()
+    queues[1].put(queue_item(1, "first", make_prompt("b.safetensors")))
+    queues[1].put(queue_item(2, "warm", make_prompt("a.safetensors")))
+    item = steal_prompt(0, queues, resident_files=lambda: {0: {model_dirs["a.safetensors"]}})
+    assert item[1] == "warm"
+
+
+class ApiNode:
+    API_NODE = True
+
+
+class LocalNode:
+    pass
+
+
+def test_is_remote_prompt():
+    node_classes = {"ApiNode": ApiNode, "VAEDecode": LocalNode}
+    prompt = {
+        "1": {"class_type": "LoadImage", "inputs": {"image": "a.png"}},
+        "2": {"class_type": "ApiNode", "inputs": {"image": ["1", 0]}},
+        "3": {"class_type": "SaveVideo", "inputs": {"video": ["2", 0]}},
+    }
+    assert is_remote_prompt(prompt, node_classes)
+    assert not is_remote_prompt({"1": prompt["1"], "3": prompt["3"]}, node_classes)
+    prompt["4"] = {"class_type": "VAEDecode", "inputs": {}}
+    assert not is_remote_prompt(prompt, node_classes)
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import types
+
+import pytest
+
+torch = pytest.importorskip("torch")
+prompt_batching = pytest.importorskip("comfy_execution.prompt_batching")
+caching = pytest.importorskip("comfy_execution.caching")
+
+
+def make_prompt(seed, text, sampler="euler", steps=20):
+    return {
+        "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "model.safetensors"}},
+        "5": {"class_type": "EmptyLatentImage", "inputs": {"width": 512, "height": 512, "batch_size": 1}},
+        "6": {"class_type": "CLIPTextEncode", "inputs": {"text": text, "clip": ["4", 1]}},
+        "7": {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry", "clip": ["4", 1]}},
+        "3": {"class_type": "KSampler", "inputs": {"seed": seed, "steps": steps, "cfg": 7.0, "sampler_name": sampler, "scheduler": "normal",
+                                                   "denoise": 1.0, "model": ["4", 0], "positive": ["6", 0], "negative": ["7", 0], "latent_image": ["5", 0]}},
+    }
+
+
+def test_batch_key_ignores_seed_and_text():
+    key = prompt_batching.batch_key(make_prompt(1, "a cat"))
+    assert key is not None
+    assert prompt_batching.batch_key(make_prompt(2, "a dog")) == key
+    assert prompt_batching.batch_key(make_prompt(1, "a cat", steps=30)) != key
+
+
+def test_batch_key_rejects_stochastic_samplers():
+    assert prompt_batching.batch_key(make_prompt(1, "a cat", sampler="euler_ancestral")) is None
+    prompt = make_prompt(1, "a cat")
+    prompt["8"] = dict(prompt["3"])
+    assert prompt_batching.batch_key(prompt) is None
+
+
+def test_conditioning_stacking():
+    a = [[torch.zeros(1, 77, 8), {"pooled_output": torch.zeros(1, 8), "guidance": 3.5}]]
+    b = [[torch.ones(1, 77, 8), {"pooled_output": torch.ones(1, 8), "guidance": 3.5}]]
+    assert prompt_batching._same_structure(a, b)
+    stacked = prompt_batching._stack([a, b])
+    assert stacked[0][0].shape == (2, 77, 8)
+    assert stacked[0][1]["pooled_output"].shape == (2, 8)
+    assert stacked[0][1]["guidance"] == 3.5
+
+    assert not prompt_batching._same_structure(a, [[torch.ones(1, 154, 8), b[0][1]]])
+    assert not prompt_batching._same_structure(a, [[b[0][0], {"pooled_output": torch.ones(1, 8), "guidance": 1.0}]])
+    assert not prompt_batching._same_structure([[torch.zeros(2, 77, 8), {}]], [[torch.zeros(2, 77, 8), {}]])
+
+
+def test_batch_results_are_taken_once(node_classes, make_key):
+    node_classes(TestLatentNode=("LATENT",))
+    results = caching.BatchResultCache(1024 ** 2)
+    key = make_key("TestLatentNode", seed=1)
+    results.put(key, "TestLatentNode", (None, [[{"samples": torch.zeros(1, 4, 8, 8)}]]))
+    assert results.get(key) is not None
+    assert results.get(key) is None
+    assert results.get_stats()["bytes"] == 0
+
+    assert results.claim("prompt")
+    assert not results.claim("prompt")
+
+    results.release(["prompt"])
+    assert results.claim("prompt")
+
+
+def test_failed_batch_releases_claims(monkeypatch):
+    results = caching.BatchResultCache(1024 ** 2)
+    prompt = make_prompt(1, "a cat")
+    batcher = prompt_batching.PromptBatcher(lambda: [(1, "peer", make_prompt(2, "a cat"), {}, [], {})], results, None)
+
+    async def resolve_peer(peer_prompt_id, peer_prompt, node_id, inputs, outputs_cache):
+        return ("key", inputs)
+
+    def sample(runs):
+        raise RuntimeError("sampling failed")
+
+    monkeypatch.setattr(batcher, "_resolve_peer", resolve_peer)
+    monkeypatch.setattr(batcher, "_sample", sample)
+    inputs = {"seed": [1]}
+    output = asyncio.run(batcher.sample("prompt", prompt_batching.DynamicPrompt(prompt), "3", inputs, None))
+    assert output is None
+    assert results.claim("peer")
+
+
+class PendingQueue:
+    def __init__(self, items, pinned=()):
+        self.mutex = threading.RLock()
+        self.items = tuple(items)
+        self.pinned = set(pinned)
+
+    def get_current_queue_volatile(self):
+        return ((), self.items)
+
+
+def test_pending_prompts_skip_pinned_items():
+    server = types.SimpleNamespace(prompt_queues=[
+        PendingQueue([(2, "b", {}), (0, "pinned", {})], pinned=["pinned"]),
+        PendingQueue([(1, "a", {})]),
+    ])
+    assert [x[1] for x in prompt_batching.pending_prompts(server, 8)] == ["a", "b"]
+
+
+def test_only_the_builtin_ksampler_is_batched(monkeypatch):
+    batcher = prompt_batching.PromptBatcher(lambda: [], caching.BatchResultCache(1024), None)
+    dynprompt = prompt_batching.DynamicPrompt(make_prompt(1, "a cat"))
+    assert batcher.accepts(prompt_batching.nodes.KSampler, dynprompt, "3")
+
+    class CustomKSampler(prompt_batching.nodes.KSampler):
+        pass
+    assert not batcher.accepts(CustomKSampler, dynprompt, "3")
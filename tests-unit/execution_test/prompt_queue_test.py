@@ -0,0 +1,146 @@
+import random
+
+import pytest
+
+# execution imports torch, so the queue is only available with the full environment
+execution = pytest.importorskip("execution")
+
+
+class QueueServer:
+    def __init__(self):
+        self.updates = 0
+
+    def queue_updated(self):
+        self.updates += 1
+
+
+def queue_item(number, prompt_id):
+    return (number, prompt_id, {"1": {"class_type": "Node", "inputs": {}}}, {}, [], {})
+
+
+def check_index(queue):
+    assert len(queue.positions) == len(queue.queue)
+    for i, item in enumerate(queue.queue):
+        assert queue.positions[item[1]] == i
+        if i > 0:
+            assert not item < queue.queue[(i - 1) >> 1]
+
+
+def test_random_deletes_keep_heap_order():
+    rng = random.Random(0)
+    queue = execution.PromptQueue(QueueServer())
+    numbers = list(range(200))
+    rng.shuffle(numbers)
+    for n in numbers:
+        queue.put(queue_item(n, f"p{n}"))
+    check_index(queue)
+
+    deleted = set(rng.sample(numbers, 80))
+    for n in deleted:
+        assert queue.delete_queue_item_by_id(f"p{n}")
+        check_index(queue)
+    assert not queue.delete_queue_item_by_id("p-missing")
+    kept = next(n for n in numbers if n not in deleted)
+    assert queue.delete_queue_item(lambda x: x[0] == kept)
+    deleted.add(kept)
+    check_index(queue)
+
+    order = []
+    while len(queue.queue) > 0:
+        item, item_id = queue.get()
+        order.append(item[0])
+        queue.task_done(item_id, {}, None)
+    assert order == sorted(set(numbers) - deleted)
+    assert queue.positions == {}
+
+
+def test_rejects_duplicate_prompt_ids():
+    queue = execution.PromptQueue(QueueServer())
+    queue.put(queue_item(0, "a"))
+    with pytest.raises(ValueError):
+        queue.put(queue_item(1, "a"))
+    assert len(queue.queue) == 1
+
+
+def test_snapshots_are_shared_until_the_queue_changes():
+    queue = execution.PromptQueue(QueueServer())
+    queue.put(queue_item(0, "a"))
+    queue.put(queue_item(1, "b"))
+    snapshot = queue.get_current_queue_volatile()
+    assert queue.get_current_queue_volatile() is snapshot
+
+    item, item_id = queue.get()
+    running, queued = queue.get_current_queue_volatile()
+    assert [x[1] for x in running] == ["a"]
+    assert [x[1] for x in queued] == ["b"]
+
+    # the worker gets a copy, what it does to the prompt doesn't show up in the queue or history
+    item[2]["1"]["is_changed"] = [1.0]
+    assert "is_changed" not in running[0][2]["1"]
+    queue.task_done(item_id, {}, None)
+    assert "is_changed" not in queue.get_history("a")["a"]["prompt"][2]["1"]
+
+
+def run(queue, number, prompt_id):
+    queue.put(queue_item(number, prompt_id))
+    _, item_id = queue.get()
+    queue.task_done(item_id, {}, None)
+
+
+def test_history_pages_by_cursor():
+    queue = execution.PromptQueue(QueueServer())
+    for i in range(6):
+        run(queue, i, f"p{i}")
+    # running a prompt again moves it to the end
+    run(queue, 6, "p1")
+
+    page = queue.get_history_page(max_items=3)
+    assert [x[1] for x in page] == ["p4", "p5", "p1"]
+    older = queue.get_history_page(before=page[0][0], max_items=3)
+    assert [x[1] for x in older] == ["p0", "p2", "p3"]
+    assert queue.get_history_page(before=older[0][0]) == []
+
+    newer = queue.get_history_page(since=older[0][0], max_items=2)
+    assert [x[1] for x in newer] == ["p2", "p3"]
+    assert queue.get_history_page(since=page[-1][0]) == []
+
+    version = queue.history_version
+    queue.delete_history_item("p4")
+    assert queue.history_version > version
+    assert [x[1] for x in queue.get_history_page(since=older[-1][0])] == ["p5", "p1"]
+    assert list(queue.get_history(max_items=2)) == ["p5", "p1"]
+    assert list(queue.get_history(max_items=2, offset=1)) == ["p2", "p3"]
+
+
+def test_history_pages_over_queues():
+    queues = [execution.PromptQueue(QueueServer()), execution.PromptQueue(QueueServer())]
+    for i in range(6):
+        run(queues[i % 2], i, f"p{i}")
+
+    page = execution.get_history_page(queues, max_items=4)
+    assert [x[1] for x in page] == ["p2", "p3", "p4", "p5"]
+    assert [x[1] for x in execution.get_history_page(queues, before=page[0][0])] == ["p0", "p1"]
+    assert [x[1] for x in execution.get_history_page(queues, since=page[1][0], max_items=1)] == ["p4"]
+    # entries finished after the last id handed out when the page was started are left out
+    assert [x[1] for x in queues[0].get_history_page(upto=page[1][0])] == ["p0", "p2"]
+
+
+class HistoryStore:
+    last_history_id = 7
+
+    def __init__(self):
+        self.reads = []
+
+    def get_history_page(self, queue, since, before, max_items, upto):
+        # flushing and querying the store must not block the workers finishing prompts
+        assert not execution._history_lock.locked()
+        self.reads.append(upto)
+        return []
+
+
+def test_stored_history_is_read_outside_the_history_lock(monkeypatch):
+    monkeypatch.setattr(execution, "_last_history_id", 0)
+    queue = execution.PromptQueue(QueueServer())
+    queue.store = HistoryStore()
+    assert execution.get_history_page([queue], since=3) == []
+    assert queue.store.reads == [7]
@@ -0,0 +1,44 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+caching = pytest.importorskip("comfy_execution.caching")
+
+
+@pytest.fixture
+def text_key(node_classes, make_key):
+    node_classes(TestConditioningNode=("CONDITIONING",), TestClipNode=("CLIP",))
+    return lambda text: make_key("TestConditioningNode", text=text)
+
+
+def conditioning(n):
+    return (None, [[[torch.zeros(n), {"pooled_output": torch.ones(2)}]]])
+
+
+def test_shared_between_executors(text_key):
+    cache = caching.SharedOutputCache(1024 ** 2)
+    cache.put(text_key("negative"), "TestConditioningNode", conditioning(4))
+    ui, outputs = cache.get(text_key("negative"))
+    assert ui is None
+    assert torch.equal(outputs[0][0][0], torch.zeros(4))
+    assert torch.equal(outputs[0][0][1]["pooled_output"], torch.ones(2))
+    assert cache.get(text_key("positive")) is None
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_only_portable_results(text_key):
+    cache = caching.SharedOutputCache(1024 ** 2)
+    cache.put(text_key("a"), "TestClipNode", (None, [[torch.zeros(1)]]))
+    cache.put(text_key("b"), "TestConditioningNode", (None, [[object()]]))
+    cache.put(frozenset([("seed", float("nan"))]), "TestConditioningNode", conditioning(1))
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_byte_budget(text_key):
+    cache = caching.SharedOutputCache(4 * 1024 + 64)
+    cache.put(text_key("a"), "TestConditioningNode", conditioning(512))
+    cache.put(text_key("b"), "TestConditioningNode", conditioning(512))
+    cache.get(text_key("a"))
+    cache.put(text_key("c"), "TestConditioningNode", conditioning(512))
+    assert cache.get(text_key("b")) is None
+    assert cache.get(text_key("a")) is not None
+    assert cache.get(text_key("c")) is not None
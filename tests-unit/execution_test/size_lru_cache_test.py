@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+torch = pytest.importorskip("torch")
+caching = pytest.importorskip("comfy_execution.caching")
+from comfy_execution.graph import DynamicPrompt  # noqa: E402
+
+
+def set_prompt(cache, node_ids):
+    prompt = {node_id: {"class_type": "TestNode", "inputs": {}} for node_id in node_ids}
+    asyncio.run(cache.set_prompt(DynamicPrompt(prompt), set(node_ids), None))
+    cache.clean_unused()
+
+
+def entry(n):
+    return (None, [[torch.zeros(n, dtype=torch.uint8)]])
+
+
+def test_estimate_output_size():
+    outputs = [[torch.zeros(10, dtype=torch.float32)], [{"samples": torch.zeros(4, dtype=torch.uint8), "batch_index": [0]}], ["text"]]
+    assert caching.estimate_output_size(outputs) == 44
+
+
+def test_evicts_large_stale_entries_first():
+    cache = caching.SizeLRUCache(caching.CacheKeySetID, max_bytes=4096)
+    set_prompt(cache, ["big", "small"])
+    cache.get("big")
+    cache.set("big", entry(4096))
+    cache.get("small")
+    cache.set("small", entry(16))
+
+    # still used by the current prompt, nothing can go
+    set_prompt(cache, ["big", "small"])
+    assert len(cache.cache) == 2
+
+    set_prompt(cache, ["other"])
+    assert ("big", "TestNode") not in cache.cache
+    assert ("small", "TestNode") in cache.cache
+
+
+def test_keeps_expensive_results():
+    cache = caching.SizeLRUCache(caching.CacheKeySetID, max_bytes=3000)
+    set_prompt(cache, ["cheap", "slow"])
+    cache.set("cheap", entry(1000))
+    cache.set("slow", entry(2500))
+    cache.costs[("slow", "TestNode")] = 60.0
+
+    set_prompt(cache, ["other"])
+    assert ("cheap", "TestNode") not in cache.cache
+    assert ("slow", "TestNode") in cache.cache
+
+
+
+def test_very_old_entries_are_scored():
+    cache = caching.SizeLRUCache(caching.CacheKeySetID, max_bytes=3000)
+    set_prompt(cache, ["old", "new"])
+    cache.set("old", entry(2000))
+    cache.set("new", entry(2000))
+    # far past the point where 1.5 ** age overflows a float
+    cache.generation += 5000
+
+    set_prompt(cache, ["new"])
+    assert ("old", "TestNode") not in cache.cache
+    assert ("new", "TestNode") in cache.cache